@@ -0,0 +1,258 @@
+"""
+Analytics Cache - Server-side result cache for the dashboard endpoints
+
+Dashboards poll /api/analytics/advanced and /api/dashboard/stats with the
+same filters every few seconds.  Results are kept here keyed by user plus
+the normalised filter set, in an LRU bounded by entry count and by an
+estimate of their encoded size.
+
+Entries are dropped when:
+  - their TTL runs out (open ranges only; closed historical ranges have none)
+  - the detection sink commits new rows for one of the cameras they cover
+  - the user's camera set changes (connect / disconnect / delete)
+
+Every entry carries an ETag so polling clients get 304 Not Modified.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Hashable, Iterable, Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ANALYTICS_CACHE_ENABLED = os.getenv("ANALYTICS_CACHE_ENABLED", "true").lower() == "true"
+ANALYTICS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYTICS_CACHE_MAX_ENTRIES", 256))
+ANALYTICS_CACHE_MAX_MB = float(os.getenv("ANALYTICS_CACHE_MAX_MB", 32))
+ANALYTICS_CACHE_TTL_SECONDS = float(os.getenv("ANALYTICS_CACHE_TTL_SECONDS", 60))
+DASHBOARD_CACHE_TTL_SECONDS = float(os.getenv("DASHBOARD_CACHE_TTL_SECONDS", 10))
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    etag: str
+    size: int
+    user_id: int
+    cameras: FrozenSet[int]
+    expires_at: Optional[float]    # None = closed range, never expires
+
+
+def normalize_filters(**filters) -> tuple:
+    """Order-insensitive, hashable form of a filter set (lists become sorted tuples)."""
+    normalized = []
+    for name in sorted(filters):
+        value = filters[name]
+        if isinstance(value, (list, tuple, set, frozenset)):
+            value = tuple(sorted(set(value))) or None
+        elif hasattr(value, "isoformat"):
+            value = value.isoformat()
+        normalized.append((name, value))
+    return tuple(normalized)
+
+
+class AnalyticsCache:
+    def __init__(
+        self,
+        enabled: bool = ANALYTICS_CACHE_ENABLED,
+        max_entries: int = ANALYTICS_CACHE_MAX_ENTRIES,
+        max_bytes: int = int(ANALYTICS_CACHE_MAX_MB * 1024 * 1024),
+    ):
+        self.enabled = enabled
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+
+        # Invalidation sequence: put() refuses results computed before an
+        # invalidation of any camera / user they cover.
+        self._generation = 0
+        self._camera_generation: Dict[int, int] = {}
+        self._user_generation: Dict[int, int] = {}
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_puts = 0
+
+    # ── Lookup / store ────────────────────────────────────────────────────
+
+    def generation(self) -> int:
+        """Take before computing a result; pass to put()."""
+        with self._lock:
+            return self._generation
+
+    def get(self, key: Hashable) -> Optional[CacheEntry]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at is not None \
+                    and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(
+        self,
+        key: Hashable,
+        value: Any,
+        user_id: int,
+        cameras: Iterable[int],
+        ttl: Optional[float],
+        generation: int,
+    ) -> CacheEntry:
+        """
+        Store a freshly computed result and return its entry.
+
+        Args:
+            cameras:    Camera IDs the result depends on
+            ttl:        Seconds to keep it, or None for closed historical ranges
+            generation: Value of generation() taken before computing
+        """
+        encoded = json.dumps(jsonable_encoder(value), sort_keys=True, separators=(",", ":")).encode()
+        entry = CacheEntry(
+            value=value,
+            etag='W/"' + hashlib.blake2b(encoded, digest_size=12).hexdigest() + '"',
+            size=len(encoded),
+            user_id=user_id,
+            cameras=frozenset(cameras),
+            expires_at=None if ttl is None else time.monotonic() + ttl,
+        )
+        if not self.enabled or entry.size > self.max_bytes:
+            return entry
+
+        with self._lock:
+            # A detection commit or camera change landed while this was computed
+            if self._user_generation.get(user_id, -1) > generation or any(
+                self._camera_generation.get(c, -1) > generation for c in entry.cameras
+            ):
+                self.stale_puts += 1
+                return entry
+
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return entry
+
+    # ── Invalidation ──────────────────────────────────────────────────────
+
+    def invalidate_cameras(self, camera_ids: Iterable[int]):
+        """New detections for these cameras: drop open-range entries covering them."""
+        camera_ids = set(camera_ids)
+        if not camera_ids:
+            return
+        with self._lock:
+            self._generation += 1
+            for camera_id in camera_ids:
+                self._camera_generation[camera_id] = self._generation
+            stale = [
+                key for key, entry in self._entries.items()
+                if entry.expires_at is not None and not entry.cameras.isdisjoint(camera_ids)
+            ]
+            for key in stale:
+                self._remove(key)
+            self.invalidations += len(stale)
+
+    def invalidate_user(self, user_id: int):
+        """The user's cameras changed: drop all of their entries, closed ranges too."""
+        with self._lock:
+            self._generation += 1
+            self._user_generation[user_id] = self._generation
+            stale = [key for key, entry in self._entries.items() if entry.user_id == user_id]
+            for key in stale:
+                self._remove(key)
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "size_kb": round(self._bytes / 1024, 1),
+                "max_size_kb": round(self.max_bytes / 1024, 1),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "not_modified": self.not_modified,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "stale_puts": self.stale_puts,
+            }
+
+    # ── HTTP helpers ──────────────────────────────────────────────────────
+
+    def respond(self, request: Request, entry: CacheEntry, content: Any = None) -> Response:
+        """
+        304 if the client's If-None-Match already has this entry's ETag,
+        otherwise a JSON response with `content` (default: the cached value).
+        """
+        headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache"}
+        if _etag_matches(request.headers.get("if-none-match"), entry.etag):
+            with self._lock:
+                self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return JSONResponse(
+            content=jsonable_encoder(entry.value if content is None else content),
+            headers=headers,
+        )
+
+    # ── Internal helpers ──────────────────────────────────────────────────
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    """Weak comparison, as If-None-Match requires."""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+# Global instance
+analytics_cache = AnalyticsCache()
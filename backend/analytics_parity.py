@@ -0,0 +1,173 @@
+"""
+Analytics Parity Check - Compare rollup-backed analytics against raw detections
+
+Seeds a throwaway SQLite database with random detections, written the way
+the detection sink writes them (bulk INSERT + upsert_detection_rollups per
+batch), then builds the /api/analytics/advanced response twice for a set
+of hour-aligned filters: once from the hourly rollups and once from the
+raw detections table, and reports every field that differs.
+
+    python analytics_parity.py [--rows 50000] [--cameras 4] [--days 21]
+                               [--batch 200] [--rebuild] [--seed 1]
+                               [--db parity.db] [--keep]
+
+--rebuild builds the rollups with rebuild_detection_rollups() instead of
+the per-batch upserts.  Exits with status 1 when any response differs.
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from analytics_queries import build_advanced_analytics
+from database import (Base, Camera, Detection, User, rebuild_detection_rollups,
+                      upsert_detection_rollups)
+
+CLASSES = ["person", "car", "bicycle", "motorcycle", "dog", "cat", "truck", "bus"]
+USER_ID = 1
+
+
+def seed(Session, rows: int, cameras: int, days: int, batch: int, rebuild: bool):
+    db = Session()
+    try:
+        db.add(User(id=USER_ID, email="parity@example.com", hashed_password="x", is_active=True))
+        db.add(User(id=USER_ID + 1, email="other@example.com", hashed_password="x", is_active=True))
+        for i in range(1, cameras + 1):
+            # Every other camera belongs to the other user, so the user filter matters
+            db.add(Camera(id=i, name=f"Camera {i}", connection_url=str(i), user_id=USER_ID + (i % 2 == 0)))
+        db.commit()
+
+        print(f"⏳ Seeding {rows:,} detections...")
+        started = time.perf_counter()
+        end = datetime.utcnow()
+        span = days * 86400
+        for first in range(0, rows, batch):
+            chunk = []
+            for _ in range(min(batch, rows - first)):
+                x1, y1 = random.randint(0, 1100), random.randint(0, 600)
+                chunk.append({
+                    "camera_id": random.randint(1, cameras),
+                    "class_name": random.choice(CLASSES),
+                    "confidence": round(random.uniform(0.2, 1.0), 4),
+                    "bbox_x1": x1,
+                    "bbox_y1": y1,
+                    "bbox_x2": x1 + random.randint(10, 180),
+                    "bbox_y2": y1 + random.randint(10, 120),
+                    "detected_at": end - timedelta(seconds=random.uniform(0, span)),
+                })
+            db.execute(insert(Detection), chunk)
+            if not rebuild:
+                upsert_detection_rollups(db, chunk)
+            db.commit()
+        if rebuild:
+            print(f"   rollups rebuilt ({rebuild_detection_rollups(db)} rows)")
+        print(f"✅ Seeded in {time.perf_counter() - started:.1f}s")
+    finally:
+        db.close()
+
+
+def scenarios(cameras: int):
+    """(label, dt_from, dt_to, class_names, camera_ids), all covered by rollups."""
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    end_of_today = today + timedelta(hours=23, minutes=59, seconds=59)
+    week_ago = today - timedelta(days=7)
+    hour_ago = datetime.utcnow().replace(minute=0, second=0, microsecond=0) - timedelta(hours=5)
+    own_cameras = [i for i in range(1, cameras + 1) if i % 2]
+
+    return [
+        ("all time", None, None, None, None),
+        ("today", today, end_of_today, None, None),
+        ("last 7 days", week_ago, end_of_today, None, None),
+        ("from 5 hours ago", hour_ago, None, None, None),
+        ("last 7 days, person + car", week_ago, end_of_today, ["person", "car"], None),
+        ("last 7 days, one camera", week_ago, end_of_today, None, own_cameras[:1]),
+        ("other user's camera", None, None, None, [2]),
+    ]
+
+
+def diff(raw, rollup, path: str = ""):
+    """Yield (path, raw, rollup) for every leaf that differs."""
+    if isinstance(raw, dict) and isinstance(rollup, dict):
+        for key in raw.keys() | rollup.keys():
+            yield from diff(raw.get(key), rollup.get(key), f"{path}.{key}" if path else str(key))
+    elif isinstance(raw, list) and isinstance(rollup, list):
+        if len(raw) != len(rollup):
+            yield f"{path} (length)", len(raw), len(rollup)
+        for i, (a, b) in enumerate(zip(raw, rollup)):
+            yield from diff(a, b, f"{path}[{i}]")
+    elif isinstance(raw, float) and isinstance(rollup, (int, float)):
+        if not math.isclose(raw, rollup, rel_tol=1e-9, abs_tol=1e-6):
+            yield path, raw, rollup
+    elif raw != rollup:
+        yield path, raw, rollup
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--cameras", type=int, default=4)
+    parser.add_argument("--days", type=int, default=21)
+    parser.add_argument("--batch", type=int, default=200, help="Rows per insert + rollup upsert")
+    parser.add_argument("--rebuild", action="store_true", help="Build rollups with rebuild_detection_rollups()")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+    parser.add_argument("--db", default="parity.db")
+    parser.add_argument("--keep", action="store_true", help="Keep the database file afterwards")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+    engine = create_engine(f"sqlite:///{args.db}")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    seed(Session, args.rows, args.cameras, args.days, args.batch, args.rebuild)
+
+    failures = 0
+    print(f"\n{'scenario':<30} {'total':>8} {'raw ms':>9} {'rollup ms':>10}  result")
+    for label, dt_from, dt_to, class_names, camera_ids in scenarios(args.cameras):
+        results, timings = {}, {}
+        for source, use_rollups in (("raw", False), ("rollup", True)):
+            db = Session()
+            try:
+                started = time.perf_counter()
+                results[source] = build_advanced_analytics(
+                    db, USER_ID, dt_from, dt_to, class_names, camera_ids, use_rollups=use_rollups
+                )
+                timings[source] = time.perf_counter() - started
+            finally:
+                db.close()
+
+        differences = list(diff(results["raw"], results["rollup"]))
+        failures += bool(differences)
+        print(
+            f"{label:<30} {results['raw']['total']:>8} {timings['raw'] * 1000:>9.1f} "
+            f"{timings['rollup'] * 1000:>10.1f}  {'MISMATCH' if differences else 'ok'}"
+        )
+        for path, raw, rollup in differences[:20]:
+            print(f"    {path}: raw={raw!r} rollup={rollup!r}")
+        if len(differences) > 20:
+            print(f"    … {len(differences) - 20} more")
+
+    engine.dispose()
+    if not args.keep:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+
+    if failures:
+        print(f"\n❌ {failures} scenario(s) differ between raw and rollup analytics")
+        return 1
+    print("\n✅ Rollup analytics match the raw detections")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,535 @@
+"""
+Analytics Queries - SQL aggregations behind /api/analytics/advanced
+
+Every section of the advanced analytics response is computed with
+GROUP BY queries that return only aggregate rows; detections are never
+loaded as ORM objects.  Date/hour bucketing and the no-activity gap
+search (LAG window) are written per dialect (SQLite, PostgreSQL).
+
+When the date filters fall on hour boundaries the aggregates are read
+from the hourly rollup table (DetectionHourlyRollup) instead of the raw
+detections; only the gap search still needs raw timestamps.
+
+Ties are broken the way the original single-pass Python version did:
+groups with equal counts keep the order in which they first appeared
+(earliest detected_at first).
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import DateTime, Integer, case, cast, extract, func, literal, select, type_coerce
+from sqlalchemy.orm import Session
+
+from database import (
+    Camera, Detection, DetectionHourlyRollup, ROLLUP_HIGH_CONFIDENCE,
+    ROLLUP_LOW_CONFIDENCE, ZONE_COUNT, zone_index_sql
+)
+
+ALERT_THRESHOLD = ROLLUP_HIGH_CONFIDENCE
+LOW_CONFIDENCE_THRESHOLD = ROLLUP_LOW_CONFIDENCE
+GAP_THRESHOLD_MINUTES = 30
+
+# Zone analytics: 3×3 grid (see database.zone_index), keyed by (row, col)
+ZONE_NAMES = {
+    (0, 0): "Top-Left",
+    (0, 1): "Top-Center",
+    (0, 2): "Top-Right",
+    (1, 0): "Mid-Left",
+    (1, 1): "Mid-Center",
+    (1, 2): "Mid-Right",
+    (2, 0): "Bot-Left",
+    (2, 1): "Bot-Center",
+    (2, 2): "Bot-Right"
+}
+
+
+# ==================== DIALECT HELPERS ====================
+
+class _Sql:
+    """Date/time expressions for the bound database dialect."""
+
+    def __init__(self, db: Session):
+        self.postgres = db.get_bind().dialect.name == "postgresql"
+
+    def day(self, col):
+        """'YYYY-MM-DD'"""
+        if self.postgres:
+            return func.to_char(col, "YYYY-MM-DD")
+        return func.strftime("%Y-%m-%d", col)
+
+    def hour_bucket(self, col):
+        """'YYYY-MM-DD HH:00'"""
+        if self.postgres:
+            return func.to_char(col, 'YYYY-MM-DD HH24:"00"')
+        return func.strftime("%Y-%m-%d %H:00", col)
+
+    def hour(self, col):
+        if self.postgres:
+            return cast(extract("hour", col), Integer)
+        return cast(func.strftime("%H", col), Integer)
+
+    def weekday(self, col):
+        """0 = Monday, like datetime.weekday()"""
+        if self.postgres:
+            return cast(extract("isodow", col), Integer) - 1
+        return (cast(func.strftime("%w", col), Integer) + 6) % 7
+
+    def minutes_between(self, later, earlier):
+        if self.postgres:
+            return extract("epoch", later - earlier) / 60.0
+        return (func.julianday(later) - func.julianday(earlier)) * 1440.0
+
+
+def _first_seen_order(groups: Dict, counts: Dict) -> List:
+    """Group keys by count desc, ties in order of first appearance."""
+    return sorted(sorted(groups, key=lambda k: groups[k]), key=lambda k: counts[k], reverse=True)
+
+
+def _pct_change(now: int, before: int) -> float:
+    return round(((now - before) / max(before, 1)) * 100, 1)
+
+
+def rollups_cover(dt_from: Optional[datetime], dt_to: Optional[datetime]) -> bool:
+    """
+    True when whole hourly buckets answer the query.  date_to always ends
+    at 23:59:59, so its last bucket is taken whole.
+    """
+    if dt_from is not None and (dt_from.minute, dt_from.second, dt_from.microsecond) != (0, 0, 0):
+        return False
+    if dt_to is not None and (dt_to.minute, dt_to.second) != (59, 59):
+        return False
+    return True
+
+
+# ==================== AGGREGATE SOURCES ====================
+# Both return the same row shapes:
+#   classes   (class, count, conf_sum, conf_max, first_seen, today, yesterday,
+#              alerts, first_alert, low_confidence)
+#   dates     (YYYY-MM-DD, count)
+#   grid      (hour, weekday, count, first_seen)
+#   cameras   (camera_id, name, count, conf_sum, first_seen, last_seen)
+#   zones     (zone_index, count, first_seen)
+#   timeline  ("YYYY-MM-DD HH:00", count)
+
+def _raw_aggregates(db: Session, sql: "_Sql", conditions: list, today: str, yesterday: str) -> dict:
+    ts = Detection.detected_at
+
+    def scoped(*columns):
+        return (
+            select(*columns)
+            .select_from(Detection)
+            .join(Camera, Detection.camera_id == Camera.id)
+            .where(*conditions)
+        )
+
+    day = sql.day(ts)
+    is_alert = Detection.confidence >= ALERT_THRESHOLD
+    hour, weekday = sql.hour(ts), sql.weekday(ts)
+    zone = zone_index_sql(Detection.bbox_x1, Detection.bbox_y1,
+                          Detection.bbox_x2, Detection.bbox_y2, sql.postgres)
+    bucket = sql.hour_bucket(ts)
+
+    return {
+        "classes": db.execute(
+            scoped(
+                Detection.class_name,
+                func.count(),
+                func.sum(Detection.confidence),
+                func.max(Detection.confidence),
+                func.min(ts),
+                func.sum(case((day == today, 1), else_=0)),
+                func.sum(case((day == yesterday, 1), else_=0)),
+                func.sum(case((is_alert, 1), else_=0)),
+                func.min(case((is_alert, ts))),
+                func.sum(case((Detection.confidence < LOW_CONFIDENCE_THRESHOLD, 1), else_=0)),
+            ).group_by(Detection.class_name)
+        ).all(),
+        "dates": db.execute(scoped(day, func.count()).group_by(day).order_by(day)).all(),
+        "grid": db.execute(
+            scoped(hour, weekday, func.count(), func.min(ts)).group_by(hour, weekday)
+        ).all(),
+        "cameras": db.execute(
+            scoped(
+                Detection.camera_id,
+                Camera.name,
+                func.count(),
+                func.sum(Detection.confidence),
+                func.min(ts),
+                func.max(ts),
+            ).group_by(Detection.camera_id, Camera.name)
+        ).all(),
+        "zones": db.execute(scoped(zone, func.count(), func.min(ts)).group_by(zone)).all(),
+        "timeline": db.execute(
+            scoped(bucket, func.count()).group_by(bucket).order_by(bucket)
+        ).all(),
+    }
+
+
+def _rollup_aggregates(db: Session, sql: "_Sql", conditions: list, today: str, yesterday: str) -> dict:
+    r = DetectionHourlyRollup
+    hour_start = r.hour_start
+
+    def scoped(*columns):
+        return (
+            select(*columns)
+            .select_from(r)
+            .join(Camera, r.camera_id == Camera.id)
+            .where(*conditions)
+        )
+
+    day = sql.day(hour_start)
+    count = func.sum(r.detection_count)
+    hour, weekday = sql.hour(hour_start), sql.weekday(hour_start)
+    bucket = sql.hour_bucket(hour_start)
+
+    zone_rows = db.execute(scoped(
+        *(func.coalesce(func.sum(getattr(r, f"zone_{i}")), 0) for i in range(ZONE_COUNT)),
+        *(func.min(case((getattr(r, f"zone_{i}") > 0, r.first_detected_at))) for i in range(ZONE_COUNT)),
+    )).one()
+
+    return {
+        "classes": db.execute(
+            scoped(
+                r.class_name,
+                count,
+                func.sum(r.confidence_sum),
+                func.max(r.confidence_max),
+                func.min(r.first_detected_at),
+                func.sum(case((day == today, r.detection_count), else_=0)),
+                func.sum(case((day == yesterday, r.detection_count), else_=0)),
+                func.sum(r.high_conf_count),
+                func.min(case((r.high_conf_count > 0, r.first_detected_at))),
+                func.sum(r.low_conf_count),
+            ).group_by(r.class_name)
+        ).all(),
+        "dates": db.execute(scoped(day, count).group_by(day).order_by(day)).all(),
+        "grid": db.execute(
+            scoped(hour, weekday, count, func.min(r.first_detected_at)).group_by(hour, weekday)
+        ).all(),
+        "cameras": db.execute(
+            scoped(
+                r.camera_id,
+                Camera.name,
+                count,
+                func.sum(r.confidence_sum),
+                func.min(r.first_detected_at),
+                func.max(r.last_detected_at),
+            ).group_by(r.camera_id, Camera.name)
+        ).all(),
+        "zones": [
+            (i, zone_rows[i], zone_rows[ZONE_COUNT + i])
+            for i in range(ZONE_COUNT) if zone_rows[i]
+        ],
+        "timeline": db.execute(scoped(bucket, count).group_by(bucket).order_by(bucket)).all(),
+    }
+
+
+# ==================== ADVANCED ANALYTICS ====================
+
+def build_advanced_analytics(
+    db: Session,
+    user_id: int,
+    dt_from: Optional[datetime],
+    dt_to: Optional[datetime],
+    class_names: Optional[List[str]],
+    camera_ids: Optional[List[int]],
+    use_rollups: Optional[bool] = None,
+) -> dict:
+    """
+    Everything in the /api/analytics/advanced response except filters_applied.
+    use_rollups forces the aggregate source (None = rollups when they cover
+    the range); analytics_parity.py uses it to compare the two.
+    """
+    sql = _Sql(db)
+    today_d = datetime.now(timezone.utc).date()
+    yesterday_d = today_d - timedelta(days=1)
+
+    def filters(model, ts):
+        conditions = [Camera.user_id == user_id]
+        if dt_from is not None:
+            conditions.append(ts >= dt_from)
+        if dt_to is not None:
+            conditions.append(ts <= dt_to)
+        if class_names:
+            conditions.append(model.class_name.in_(class_names))
+        if camera_ids:
+            conditions.append(Camera.id.in_(camera_ids))
+        return conditions
+
+    if use_rollups is None:
+        use_rollups = rollups_cover(dt_from, dt_to)
+    if use_rollups:
+        r = DetectionHourlyRollup
+        agg = _rollup_aggregates(db, sql, filters(r, r.hour_start),
+                                 today_d.isoformat(), yesterday_d.isoformat())
+    else:
+        agg = _raw_aggregates(db, sql, filters(Detection, Detection.detected_at),
+                              today_d.isoformat(), yesterday_d.isoformat())
+
+    class_rows = agg["classes"]
+    total = sum(row[1] for row in class_rows)
+    by_class = {row[0]: row[1] for row in class_rows}
+    class_meta = {row[0]: row for row in class_rows}
+    class_order = _first_seen_order({row[0]: row[4] for row in class_rows}, by_class)
+
+    date_rows = agg["dates"]
+    by_date_sorted = [{"date": d, "count": c} for d, c in date_rows]
+    by_date = dict(date_rows)
+
+    grid_rows = agg["grid"]
+    activity_grid = {(h, w): c for h, w, c, _ in grid_rows}
+    hour_counts: dict = defaultdict(int)
+    hour_first: dict = {}
+    for h, _, c, first in grid_rows:
+        hour_counts[h] += c
+        hour_first[h] = min(first, hour_first.get(h, first))
+
+    camera_rows = agg["cameras"]
+
+    zone_counts = {ZONE_NAMES[divmod(z, 3)]: n for z, n, _ in agg["zones"]}
+    zone_first = {ZONE_NAMES[divmod(z, 3)]: first for z, _, first in agg["zones"]}
+
+    timeline_rows = agg["timeline"]
+
+    # ── No-activity gaps (LAG over the filtered raw detections) ──────────
+    # SQL narrows the candidates; durations are recomputed exactly in Python.
+    ts = Detection.detected_at
+    ordered = (
+        select(
+            ts.label("detected_at"),
+            type_coerce(func.lag(ts).over(order_by=ts), DateTime).label("previous"),
+        )
+        .select_from(Detection)
+        .join(Camera, Detection.camera_id == Camera.id)
+        .where(*filters(Detection, ts))
+        .subquery()
+    )
+    gap_rows = db.execute(
+        select(ordered.c.previous, ordered.c.detected_at)
+        .where(ordered.c.previous.isnot(None))
+        .where(sql.minutes_between(ordered.c.detected_at, ordered.c.previous)
+               >= literal(GAP_THRESHOLD_MINUTES - 0.01))
+        .order_by(ordered.c.detected_at)
+    ).all()
+
+    #_________ 1. Detection Count Analytics ___________________________
+
+    detection_counts = {
+        "total": total,
+        "by_class": [
+            {
+                "class_name": k,
+                "count": by_class[k],
+                "percentage": round(by_class[k] / total * 100, 1) if total > 0 else 0
+            }
+            for k in class_order
+        ],
+        "by_date": by_date_sorted
+    }
+
+    #___________ 2. Activity Intensity Heatmap (24 hours * 7 weekdays)____________________
+    activity_intensity = [
+        {"hour": h, "weekday": w, "count": activity_grid.get((h, w), 0)}
+        for h in range(24)
+        for w in range(7)
+    ]
+
+    #______ 3. Peak hours (sorted top 10)_____________________________
+    peak_hours = [
+        {"hour": h, "count": hour_counts[h], "label": f"{h:02d}:00"}
+        for h in _first_seen_order(hour_first, hour_counts)
+    ][:10]
+
+    #__________4. Zone analytics _____________________
+    zone_analytics = [
+        {"zone": name, "count": zone_counts.get(name, 0)}
+        for name in ZONE_NAMES.values()
+    ]
+
+    #__________5. Object-wise analysis ________________________
+    object_analytics = []
+    for cls in class_order:
+        _, count, conf_sum, conf_max, _, today_c, yest_c, *_ = class_meta[cls]
+        object_analytics.append({
+            "class_name": cls,
+            "count": count,
+            "percentage": round(count / total * 100, 1) if total > 0 else 0,
+            "avg_confidence": round(conf_sum / count * 100, 1) if count else 0,
+            "max_confidence": round(conf_max * 100, 1) if count else 0,
+            "today_count": today_c,
+            "yesterday_count": yest_c,
+            "trand_pct": _pct_change(today_c, yest_c)
+        })
+
+    #__________6. Alert analytics (confidence >= 0.8, no separate model needed)____________
+    alert_by_class = {row[0]: row[7] for row in class_rows if row[7]}
+    alert_first = {row[0]: row[8] for row in class_rows if row[7]}
+    total_alerts = sum(alert_by_class.values())
+    alert_analytics = {
+        "total_alerts": total_alerts,
+        "threshold": ALERT_THRESHOLD,
+        "by_class": [
+            {"class_name": k, "count": alert_by_class[k]}
+            for k in _first_seen_order(alert_first, alert_by_class)
+        ],
+        "alert_rate_pct": round(total_alerts / total * 100, 1) if total > 0 else 0
+    }
+
+    #_________ 7. Camera-wise analytics __________________________
+    camera_first = {row[0]: row[4] for row in camera_rows}
+    camera_meta = {row[0]: row for row in camera_rows}
+    camera_analytics = []
+    for cam_id in _first_seen_order(camera_first, {row[0]: row[2] for row in camera_rows}):
+        _, name, count, conf_sum, _, last_ts = camera_meta[cam_id]
+        camera_analytics.append({
+            "camera_id": cam_id,
+            "camera_name": name,
+            "count": count,
+            "avg_comfidence": round(conf_sum / count * 100, 1) if count else 0,
+            "last_detection": last_ts.strftime("%Y-%m-%d %H:%M") if last_ts else None
+        })
+
+    #__________ 8. Trend analytics(today vs yesterday, this week vs last week) _____________
+    week_start = today_d - timedelta(days=today_d.weekday())
+    last_week_start = week_start - timedelta(days=7)
+    today_count = by_date.get(today_d.isoformat(), 0)
+    yest_count = by_date.get(yesterday_d.isoformat(), 0)
+    this_week = sum(c for d, c in by_date.items() if d >= week_start.isoformat())
+    last_week = sum(
+        c for d, c in by_date.items()
+        if last_week_start.isoformat() <= d < week_start.isoformat()
+    )
+    trend_analytics = {
+        "today_count": today_count,
+        "yesterday_count": yest_count,
+        "day_change_pct": _pct_change(today_count, yest_count),
+        "this_week": this_week,
+        "last_week": last_week,
+        "week_change_pct": _pct_change(this_week, last_week),
+        "daily_series": by_date_sorted[-30:]  # last 30 days
+    }
+
+    #________ 9. Average detection rate _________________________
+    if total > 1:
+        first_ts = min(row[4] for row in camera_rows)
+        last_ts = max(row[5] for row in camera_rows)
+        span_hours = max((last_ts - first_ts).total_seconds() / 3600, 1.0)
+        avg_rate = round(total / span_hours, 2)
+    else:
+        avg_rate = float(total)
+
+    #____________10. No-activity periods (consecutive gaps >= 30 minutes)______________________________
+    no_activity_periods = []
+    for previous, current in gap_rows:
+        gap_min = (current - previous).total_seconds() / 60
+        if gap_min >= GAP_THRESHOLD_MINUTES:
+            no_activity_periods.append({
+                "from": previous.strftime("%Y-%m-%d %H:%M"),
+                "to": current.strftime("%Y-%m-%d %H:%M"),
+                "duration_minutes": round(gap_min, 1)
+            })
+    no_activity_periods.sort(key=lambda x: x["duration_minutes"], reverse=True)
+
+    # ___ 11. Timeline chart (hourly buckets for graph plotting)___________________________
+    timeline_chart = [{"time": k, "count": v} for k, v in timeline_rows]
+
+    #____ 12. Smart insights (auto-generated)_________________________
+    insights = []
+    if total == 0:
+        insights.append({
+            "type": "info",
+            "text": "No detections found for the selected filters."
+        })
+    else:
+        #Most detected class
+        top_cls = class_order[0]
+        pct = round(by_class[top_cls] / total * 100, 1)
+        insights.append({
+            "type": "info",
+            "text": f"'{top_cls.capitalize()}' is the most detected object - {by_class[top_cls]} detections ({pct}% of total activity)."
+        })
+
+        #Peak hours
+        if peak_hours:
+            ph = peak_hours[0]
+            insights.append({
+                "type": "info",
+                "text": f"Peak detection hour is {ph['label']} with {ph['count']} detections."
+            })
+
+        # Day-over-day trend
+        if yest_count > 0:
+            if today_count == yest_count:
+                insights.append({
+                    "type": "info",
+                    "text": f"Activity remained unchanged compared to yesterday ({today_count} detections)."
+                })
+            else:
+                direction, kind = ("up", "warning") if today_count > yest_count else ("down", "success")
+                pct = round(abs(trend_analytics["day_change_pct"]))
+                insights.append({
+                    "type": kind,
+                    "text": f" Activity is {direction} {pct}% today vs yesterday ({today_count} vs {yest_count} detections)"
+                })
+        elif today_count > 0:
+            insights.append({
+                "type": "info",
+                "text": f"{today_count} new detections recorded today (no data for yesterday to compare)"
+            })
+
+        # High confidence alerts
+        if total_alerts > 0:
+            insights.append({
+                "type": "warning",
+                "text": f"{total_alerts} high-confidence alerts detected (>= {int(ALERT_THRESHOLD*100)}% confidence). Review these events."
+            })
+
+        # Longest quiet period
+        if no_activity_periods:
+            lg = no_activity_periods[0]
+            insights.append({
+                "type": "info",
+                "text": f"Longest quiet gap: {lg['duration_minutes']} min (from{lg['from']} to {lg['to']})."
+            })
+
+        # Most active camera
+        if camera_analytics:
+            top_cam = camera_analytics[0]
+            insights.append({
+                "type": "info",
+                "text": f"Most active camera is '{top_cam['camera_name']} with {top_cam['count']} detections."
+            })
+
+        # Busiest Zone
+        if zone_counts:
+            top_zone = _first_seen_order(zone_first, zone_counts)[0]
+            insights.append({
+                "type": "info",
+                "text": f"Highest activity zone: '{top_zone}' ({zone_counts[top_zone]} detections)."
+            })
+
+        #Low confidence warning
+        low_con = sum(row[9] for row in class_rows)
+        if low_con:
+            insights.append({
+                "type": "warning",
+                "text": f"{low_con} detections ({round(low_con/total*100,2)}%) have confidence below 30%. Consider raising the detection threshold."
+            })
+
+    return {
+        "total": total,
+        "detection_counts": detection_counts,
+        "activity_intensity": activity_intensity,
+        "peak_hours": peak_hours,
+        "zone_analytics": zone_analytics,
+        "object_analytics": object_analytics,
+        "alert_analytics": alert_analytics,
+        "camera_analytics": camera_analytics,
+        "trend_analytics": trend_analytics,
+        "average_detection_rate_per_hour": avg_rate,
+        "no_activity_periods": no_activity_periods[:10],  # top 10 longest gaps
+        "timeline_chart": timeline_chart,
+        "smart_insights": insights
+    }
@@ -1,11 +1,13 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, status, BackgroundTasks, Query, Body
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, status, BackgroundTasks, Query, Body, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from sqlalchemy.orm import Session
-from datetime import timedelta, datetime, timezone
-from typing import Optional, List, Dict
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import timedelta, datetime
+from typing import Optional, List
 from fastapi import Query
 from pydantic import BaseModel
 from pydantic import BaseModel as _BaseModel
@@ -13,72 +15,49 @@ from typing import Optional as _Optional
 from starlette.websockets import WebSocketDisconnect
 import os
 import uuid
-import cv2
 import asyncio
 import base64
 import secrets
+import hmac
+import hashlib
 import logging
 from pathlib import Path
 import json
 import numpy as np
-import time
-import asyncio
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-from database import SessionLocal 
-from database import (get_db, init_db, User, Camera, Recording, Detection, 
-                     RecordingSchedule, Notification)
-from auth import (authenticate_user, create_access_token, get_current_active_user,
-                  get_password_hash, verify_password, ACCESS_TOKEN_EXPIRE_MINUTES)
+from database import SessionLocal, AsyncSessionLocal, async_engine
+from database import (get_db, get_async_db, init_db, User, Camera, Recording, Detection, 
+                     RecordingSchedule, Notification, DetectionHourlyRollup)
+from auth import (authenticate_user_async, create_access_token, get_current_active_user,
+                  get_password_hash, verify_password, ACCESS_TOKEN_EXPIRE_MINUTES,
+                  SECRET_KEY)
 from camera_handler import camera_manager
 from yolo_detector import yolo_detector
 from recording_manager import recording_manager
 from smart_recording_manager import smart_recording_manager 
+from buffer_memory import buffer_memory
 from notification_service import notification_service
 from scheduler_service import scheduler_service
 from email_service import email_service
 from websocket_manager import websocket_manager
-from collections import defaultdict 
+from video_hub import video_hub_manager
+from pipeline_executor import pipeline_executors
+from detection_scheduler import detection_scheduler
+from detection_sink import detection_sink
+from storage_ledger import storage_ledger
+from crop_store import crop_store
+from frame_packet import FramePacket
+import frame_packet
+import stream_protocol
+from analytics_queries import build_advanced_analytics
+from pagination import keyset_page_async, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from analytics_cache import (analytics_cache, normalize_filters,
+                             ANALYTICS_CACHE_TTL_SECONDS, DASHBOARD_CACHE_TTL_SECONDS)
 
 app = FastAPI(title="CSIO ThermalStream API", version="2.0.0")
 
-# ==================== DETECTION STATE MANAGER ====================
-
-class CachedDetectionState:
-    """Manages cached detections for smooth rendering"""
-    def __init__(self):
-        self.cached_detections: Dict[str, List[Dict]] = {}
-        self.detection_ages: Dict[str, int] = {}
-    
-    def update(self, session_id: str, detections: List[Dict]):
-        """Update cached detections"""
-        self.cached_detections[session_id] = detections
-        self.detection_ages[session_id] = 0
-    
-    def get(self, session_id: str) -> List[Dict]:
-        """Get cached detections with aging"""
-        if session_id not in self.cached_detections:
-            return []
-        
-        # Age out old detections (if not updated in 3 frames, clear them)
-        age = self.detection_ages.get(session_id, 0)
-        if age > 3:
-            self.cached_detections[session_id] = []
-            return []
-        
-        self.detection_ages[session_id] = age + 1
-        return self.cached_detections[session_id]
-    
-    def clear(self, session_id: str):
-        """Clear detections for session"""
-        if session_id in self.cached_detections:
-            del self.cached_detections[session_id]
-        if session_id in self.detection_ages:
-            del self.detection_ages[session_id]
-
-detection_cache = CachedDetectionState()
-
 origins=[
         "http://localhost:5173",
         "http://192.168.228.39:5173"
@@ -99,32 +78,32 @@ for dir_path in ['recordings', 'screenshots', 'detections', 'thumbnails']:
 app.mount("/detections", StaticFiles(directory="detections"), name="detections")
 app.mount("/recordings", StaticFiles(directory="recordings"), name="recordings")
 
-# Storage tracking
-storage_stats = {
-    'recordings': 0,
-    'screenshots': 0,
-    'detections': 0,
-    'total': 0
-}
-
-def calculate_storage():
-    """Calculate total storage used"""
-    global storage_stats
-    total = 0
-    for dir_name in ['recordings', 'screenshots', 'detections']:
-        dir_size = sum(f.stat().st_size for f in Path(dir_name).rglob('*') if f.is_file())
-        storage_stats[dir_name] = dir_size
-        total += dir_size
-    storage_stats['total'] = total
-
 @app.on_event("startup")
 async def startup():
     init_db()
     scheduler_service.reload_all_schedules()
-    calculate_storage()
+    # Storage stats come from the ledger's counters, not directory scans
+    storage_ledger.set_db_factory(SessionLocal)
+    storage_ledger.start()
+    crop_store.set_db_factory(SessionLocal)
+    crop_store.start()
     smart_recording_manager.set_db_factory(SessionLocal)
+    detection_sink.set_db_factory(SessionLocal)
+    video_hub_manager.set_detection_handler(detection_sink.submit)
+    scheduler_service.set_start_handler(video_hub_manager.start_scheduled_recording)
+    detection_sink.set_commit_handler(analytics_cache.invalidate_cameras)
     print("✅ CSIO ThermalStream API Started")
 
+@app.on_event("shutdown")
+async def shutdown():
+    # Close pipelines first so open clips are written and their detections queued
+    await video_hub_manager.stop_all()
+    # Flush detections still waiting in the sink queue
+    await asyncio.to_thread(detection_sink.stop)
+    await asyncio.to_thread(crop_store.stop)
+    await asyncio.to_thread(storage_ledger.stop)
+    await async_engine.dispose()
+
 # ==================== REQUEST MODELS ====================
 
 class CameraConnectRequest(BaseModel):
@@ -165,9 +144,9 @@ async def signup(email: str, password: str, full_name: str,
 
 @app.post("/api/auth/login")
 async def login(form_data: OAuth2PasswordRequestForm = Depends(),
-               db: Session = Depends(get_db)):
+               db: AsyncSession = Depends(get_async_db)):
     """User login"""
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user_async(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=401, detail="Incorrect credentials")
     
@@ -358,17 +337,18 @@ class ChangePasswordRequest(BaseModel):
 async def update_profile(
     profile_data: UpdateProfileRequest,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update user profile information (name, organization)"""
+    # current_user was loaded through this same AsyncSession (dependency cache)
     try:
         if profile_data.full_name:
             current_user.full_name = profile_data.full_name
         if profile_data.organization is not None:
             current_user.organization = profile_data.organization
         
-        db.commit()
-        db.refresh(current_user)
+        await db.commit()
+        await db.refresh(current_user)
         
         return {
             "id": current_user.id,
@@ -378,7 +358,7 @@ async def update_profile(
             "role": current_user.role
         }
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error updating profile for user {current_user.id}: {e}")
         raise HTTPException(status_code=500, detail="Failed to update profile")
 
@@ -386,23 +366,25 @@ async def update_profile(
 async def change_password(
     password_data: ChangePasswordRequest,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Change user password (requires old password verification)"""
     try:
-        # Verify old password
-        if not verify_password(password_data.old_password, current_user.hashed_password):
+        # Verify old password (bcrypt runs in a worker thread)
+        if not await asyncio.to_thread(verify_password, password_data.old_password,
+                                       current_user.hashed_password):
             raise HTTPException(status_code=401, detail="Old password is incorrect")
         
         # Update with new password hash
-        current_user.hashed_password = get_password_hash(password_data.new_password)
-        db.commit()
+        current_user.hashed_password = await asyncio.to_thread(get_password_hash,
+                                                               password_data.new_password)
+        await db.commit()
         
         return {"message": "Password changed successfully"}
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Error changing password for user {current_user.id}: {e}")
         raise HTTPException(status_code=500, detail="Failed to change password")
 
@@ -470,6 +452,10 @@ async def connect_camera(url: str, camera_id: int = 1, stream_type: Optional[str
     camera.resolution = "1280x720"
     db.commit()
     db.refresh(camera)
+    analytics_cache.invalidate_user(current_user.id)
+    
+    # Detection and recording run server-side whether or not anyone watches
+    video_hub_manager.start_ingest(session_id, session, camera)
     
     # Send notification
     notification_service.create_notification(
@@ -511,6 +497,7 @@ async def disconnect_camera(session_id: str,
     if recording_manager.is_recording(session_id):
         await stop_recording(session_id, current_user, db)
     
+    await video_hub_manager.stop(session_id)
     await camera_manager.disconnect_session(session_id)
     
     # Update camera status
@@ -523,6 +510,7 @@ async def disconnect_camera(session_id: str,
         camera.status = "disconnected"
         camera.session_id = None
         db.commit()
+        analytics_cache.invalidate_user(current_user.id)
         
         # Send notification
         notification_service.create_notification(
@@ -544,9 +532,12 @@ async def disconnect_camera(session_id: str,
 
 @app.get("/api/camera/list")
 async def list_cameras(current_user: User = Depends(get_current_active_user),
-                      db: Session = Depends(get_db)):
+                      db: AsyncSession = Depends(get_async_db)):
     """Get all user cameras"""
-    cameras = db.query(Camera).filter(Camera.user_id == current_user.id).all()
+    cameras = (await db.execute(select(
+        Camera.id, Camera.name, Camera.connection_type, Camera.connection_url,
+        Camera.status, Camera.fps, Camera.resolution, Camera.last_seen, Camera.session_id
+    ).where(Camera.user_id == current_user.id))).all()
     return {
         "cameras": [
             {
@@ -579,10 +570,12 @@ async def delete_camera(camera_id: int,
     
     # Disconnect if connected
     if camera.session_id:
+        await video_hub_manager.stop(camera.session_id)
         await camera_manager.disconnect_session(camera.session_id)
     
     db.delete(camera)
     db.commit()
+    analytics_cache.invalidate_user(current_user.id)
     
     return {"message": "Camera deleted"}
 
@@ -590,58 +583,34 @@ async def delete_camera(camera_id: int,
 
 @app.websocket("/ws/video/{session_id}")
 async def websocket_endpoint(websocket: WebSocket, session_id: str):
-    """WebSocket video streaming - optimized for fast startup"""
+    """
+    WebSocket video streaming.
+    Every viewer of a session subscribes to the same VideoHub (already
+    running headless since connect), so capture, detection and encoding
+    run once per frame no matter how many tabs are open.
+    Frames go out as JSON/base64 unless the client sends
+    {"type": "set_transport", "mode": "binary"} (see stream_protocol.py).
+    {"type": "toggle_detection", ...} hides boxes or raises the confidence
+    threshold for this viewer only.
+    """
     try:
         await websocket.accept()
-        logger.warning(f"ENTERED VIDEO WS: {session_id}")
-        detection_enabled = True  # Enable detection by default
-        detection_confidence = 0.5
-        db = next(get_db())
-        frame_count = 0
-        scheduled_recording_active = False
         
         # Get camera session with fast fail
         camera_session = camera_manager.get_session(session_id)
-        logger.warning(f"CAMERA SESSION: {camera_session}")
         if not camera_session or not camera_session.connected:
             await websocket.close(code=1008, reason="Camera not connected")
             return
         
         # Get camera from database
-        camera = db.query(Camera).filter(Camera.session_id == session_id).first()
+        async with AsyncSessionLocal() as db:
+            camera = await db.scalar(select(Camera).where(Camera.session_id == session_id))
         if not camera:
             await websocket.close(code=1008, reason="Camera not found")
             return
         
         logger.info(f"WebSocket stream started for camera {camera.id} (session: {session_id})")
         
-        # Check if there's an active scheduled recording for this camera
-        active_schedule = scheduler_service.get_active_schedule(camera.id)
-        if active_schedule:
-            logger.info(f"Active scheduled recording detected for camera {camera.id}")
-            # Start recording automatically from schedule
-            filepath = recording_manager.start_recording(
-                session_id,
-                camera_session.fps,
-                (640, 480),
-                camera.name
-            )
-            if filepath:
-                # Create database entry for scheduled recording
-                recording = Recording(
-                    filename=os.path.basename(filepath),
-                    format="mp4",
-                    storage_path=filepath,
-                    camera_id=camera.id,
-                    user_id=camera.owner.id,
-                    started_at=datetime.utcnow(),
-                    is_scheduled=True  # Mark as scheduled
-                )
-                db.add(recording)
-                db.commit()
-                scheduled_recording_active = True
-                logger.info(f"Scheduled recording started for camera {camera.id}")
-        
         # Send immediate "ready" message
         await websocket.send_json({
             "type": "stream_ready",
@@ -649,168 +618,81 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
             "resolution": "1280x720"
         })
         
-        smart_recording_manager.init_session(
-            session_id=session_id,
-            camera_id=camera.id,
-            user_id=camera.user_id,
-            fps=camera_session.fps,
-            camera_name=camera.name
-        )
+        hub = video_hub_manager.get_or_create(session_id, camera_session, camera)
+        subscriber = hub.subscribe()
         
-        DETECTION_INTERVAL = 3  # Run detection every 3 frames
-        frame_skip_count = 0
+        # Per-viewer transport: JSON/base64 until the client negotiates binary
+        transport = {"mode": stream_protocol.TRANSPORT_JSON, "ack_pending": False}
         
-        try:
-            logger.info("STREAM LOOP START")
-            logger.warning(
-    f"START STREAM: running={camera_session.is_running}, connected={camera_session.connected}"
-)
-            while camera_session.is_running and camera_session.connected:
-                detections = []
-                # Non-blocking check for client messages
+        async def receive_client_messages():
+            while True:
                 try:
-                    message = await asyncio.wait_for(websocket.receive_json(), timeout=0.001)
-                    if message.get('type') == 'toggle_detection':
-                        detection_enabled = message.get('enabled', False)
-                        detection_confidence = message.get('confidence', 0.5)
-                        if not detection_enabled:
-                            detection_cache.clear(session_id)
-                        logger.info(f"Detection {'enabled' if detection_enabled else 'disabled'}")
-                except asyncio.TimeoutError:
-                    pass
+                    message = await websocket.receive_json()
                 except WebSocketDisconnect:
                     logger.info("Client disconnected")
-                    break
-                
-                except Exception as e:
+                    return
+                except json.JSONDecodeError as e:
                     logger.warning(f"Recieve error: {e}")
                     continue
+                if message.get('type') == 'toggle_detection':
+                    # Only filters this viewer's boxes; detection itself keeps
+                    # running for recording and the other viewers
+                    subscriber.show_detections = bool(message.get('enabled', True))
+                    try:
+                        subscriber.min_confidence = float(message.get('confidence', 0.0))
+                    except (TypeError, ValueError):
+                        logger.warning(f"Invalid viewer confidence: {message.get('confidence')!r}")
+                elif message.get('type') == 'set_motion_rois':
+                    # [[x, y, w, h], ...] normalised to 0..1; empty = full frame
+                    try:
+                        hub.motion_gate.set_rois(
+                            [tuple(float(v) for v in roi) for roi in message.get('rois', [])]
+                        )
+                    except (TypeError, ValueError) as e:
+                        logger.warning(f"Invalid motion ROIs: {e}")
+                elif message.get('type') == 'set_transport':
+                    mode = message.get('mode', stream_protocol.TRANSPORT_JSON)
+                    if mode in stream_protocol.TRANSPORTS:
+                        transport["mode"] = mode
+                        transport["ack_pending"] = True
+                        logger.info(f"Viewer of {session_id} switched to {mode} transport")
+        
+        receiver = asyncio.create_task(receive_client_messages())
+        getter = None
+        try:
+            while True:
+                # Race the next packet against the receiver, so a viewer that
+                # disconnects is noticed even while no frames are coming
+                getter = asyncio.create_task(subscriber.get())
+                done, _ = await asyncio.wait(
+                    {getter, receiver}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if getter not in done:
+                    break  # Client disconnected
+                packet = getter.result()
+                if packet is None:
+                    break  # Camera stopped
                 
-                # Get frame
-                loop_start = time.time()
-                frame = await camera_session.get_frame()
-                read_end = time.time()
-                if frame is None:
-                    await asyncio.sleep(0.001)
-                    continue
-        #################################### ADDED
-                cv2.putText( frame, 
-                            datetime.now().strftime("%H:%M:%S.%f")[:-3],
-                            (20,40), 
-                            cv2.FONT_HERSHEY_SIMPLEX,
-                            1,
-                            (0, 255, 0),
-                            2)
-                
-                frame_count += 1
-                frame_skip_count += 1
-                
-                # Make a copy for recording (with detections drawn on it)
-                recording_frame = frame
-                
-                # # Minimal processing - only encode and send
-                # try:
-                #     # JPEG encoding with lower quality for speed
-                #     _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 75])
-                #     frame_base64 = base64.b64encode(buffer).decode('utf-8')
-                    
-                #     # Prepare message
-                #     message = {
-                #         "frame": frame_base64,
-                #         "fps": camera_session.fps,
-                #         "timestamp": time.time()
-                #     }
-                
-                try: 
-                    loop_start = time.time()
-                    
-                    _, buffer = cv2.imencode(
-                        '.jpg',
-                        frame,
-                        [cv2.IMWRITE_JPEG_QUALITY, 75]
-                    )
-                    jpeg_end = time.time()
-                    
-                    frame_base64 = base64.b64encode(buffer).decode('utf-8')
-                    
-                    b64_end = time.time()
-                    
-                    message = {
-                        "frame": frame_base64,
-                        "fps" : camera_session.fps,
-                        "timestamp": time.time()
-                    }
-                    
-                    # YOLO Detection - run every N frames to avoid blocking
-                    if detection_enabled and frame_skip_count % DETECTION_INTERVAL == 0:
-                    # if False:
-                        try:
-                            #ADDED######################################
-                            det_start = time.time()
-                            detections = yolo_detector.detect(frame, detection_confidence)
-                            det_end = time.time()
-                            print(f"Detection time = {(det_end-det_start)*1000:.2f} ms")
-                            
-                            
-                            if detections:
-                                detection_cache.update(session_id, detections)
-                                message["detections"] = len(detections)
-                                message["detection_data"] = detections  # Send full detection data
-                                
-                                # Async database write
-                                loop = asyncio.get_event_loop()
-                                loop.run_in_executor(
-                                    None,
-                                    lambda: _save_detections_sync(camera.id, detections, frame)
-                                )
-                        except Exception as e:
-                            logger.error(f"Detection error: {e}")
-                    
-                    # Get cached detections
-                    cached = detection_cache.get(session_id)
-                    if cached:
-                        message["cached_detections"] = len(cached)
-                        message["cached_detection_data"] = cached  # Send cached detection data
-                    
-                    # Draw cached detections on recording frame
-                    if cached:
-                        recording_frame = yolo_detector.draw_detections(recording_frame, cached)
-                    
-                    # Smart event driven recording
-                    smart_recording_manager.push_frame(
-                        session_id,
-                        recording_frame,
-                        detections if detection_enabled else None,
+                binary = transport["mode"] == stream_protocol.TRANSPORT_BINARY
+                if transport["ack_pending"]:
+                    transport["ack_pending"] = False
+                    await websocket.send_json(
+                        stream_protocol.describe(yolo_detector.target_classes) if binary
+                        else {"type": "transport", "mode": stream_protocol.TRANSPORT_JSON}
                     )
-                    
-                    if recording_manager.is_recording(session_id):
-                        recording_manager.write_frame(session_id, recording_frame)
-                    
-                    # Send frame (frontend is receiving frames here)
-                    # print("Sending frame:", datetime.now().strftime("%H:%M:%S"))
-                    # await websocket.send_json(message)
-                    #Added ################################################
-                    # send_start = time.time()
-                    await websocket.send_json(message)
-                    # send_end = time.time()
-                    # print(
-                    #     f"READ={read_end-loop_start:.4f}s "
-                    #     f"JPEG={jpeg_end-read_end:.4f}s "
-                    #     f"B64= {b64_end-jpeg_end:.4f}s "
-                    #     f"SEND= {send_end-send_start:.4f}s"
-                    # )
-                except Exception as e:
-                    logger.error(f"Error encoding/sending frame: {e}")
-                    break
-        
+                
+                if binary:
+                    await websocket.send_bytes(packet.binary_frame())
+                else:
+                    await websocket.send_text(packet.json_text())
         except Exception as e:
             logger.error(f"Stream error: {e}")
-            logger.warning(
-    f"END STREAM: running={camera_session.is_running}, connected={camera_session.connected}"
-)
         finally:
+            receiver.cancel()
+            if getter is not None:
+                getter.cancel()
+            hub.unsubscribe(subscriber)
             logger.info(f"WebSocket stream ended for camera {camera.id}")
-            smart_recording_manager.close_session(session_id)
     
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
@@ -820,55 +702,6 @@ async def video_stream(websocket: WebSocket, session_id: str):
     await websocket_endpoint(websocket, session_id)
 
 
-def _save_detections_sync(camera_id: int, detections, frame):
-    """
-    This runs in a background thread.
-    It MUST create its own DB session.
-    
-    Args:
-        camera_id: Camera ID for the detection
-        detections: List of detection dictionaries from YOLO detector
-        frame: The frame where detections were found (for saving detected objects)
-    """
-
-    db: Session = SessionLocal()
-
-    try:
-        for det in detections:
-            # Extract detections from YOLO format
-            bbox = det.get("bbox", {})
-            
-            # Save detection screenshot (cropped image of detected object)
-            screenshot_path = None
-            try:
-                screenshot_path = yolo_detector.save_detection(frame, det, output_dir="detections")
-                logger.debug(f"Saved detection screenshot: {screenshot_path}")
-            except Exception as e:
-                logger.warning(f"Failed to save detection screenshot: {e}")
-            
-            detection = Detection(
-                camera_id=camera_id,
-                class_name=det.get("class_name", "unknown"),
-                confidence=det.get("confidence", 0.0),
-                bbox_x1=bbox.get("x1", 0),
-                bbox_y1=bbox.get("y1", 0),
-                bbox_x2=bbox.get("x2", 0),
-                bbox_y2=bbox.get("y2", 0),
-                screenshot_path=screenshot_path,
-                detected_at=datetime.utcnow()
-            )
-            db.add(detection)
-
-        db.commit()
-        logger.info(f"Successfully saved {len(detections)} detections for camera {camera_id}")
-
-    except Exception as e:
-        db.rollback()
-        logger.error(f"Error committing detections: {e}")
-
-    finally:
-        db.close()
-
 # ==================== RECORDING MANAGEMENT ====================
 
 @app.post("/api/recording/start")
@@ -893,8 +726,9 @@ async def start_recording(session_id: str,
     filepath = recording_manager.start_recording(
         session_id,
         camera_session.fps,
-        (640, 480),
-        camera.name
+        camera_session.frame_size,
+        camera.name,
+        user_id=current_user.id
     )
     
     if not filepath:
@@ -942,7 +776,8 @@ async def stop_recording(session_id: str,
                         current_user: User = Depends(get_current_active_user),
                         db: Session = Depends(get_db)):
     """Stop recording"""
-    stats = recording_manager.stop_recording(session_id)
+    # Waits for the writer thread to drain its queue
+    stats = await asyncio.to_thread(recording_manager.stop_recording, session_id)
     if not stats:
         raise HTTPException(status_code=404, detail="No active recording")
     
@@ -958,9 +793,6 @@ async def stop_recording(session_id: str,
         recording.ended_at = stats['ended_at']
         db.commit()
         
-        # Update storage stats
-        calculate_storage()
-        
         # Notification
         notification_service.create_notification(
             user_id=current_user.id,
@@ -981,18 +813,30 @@ async def stop_recording(session_id: str,
         "message": "Recording stopped",
         "filename": stats['filename'],
         "duration_seconds": stats['duration_seconds'],
-        "file_size_bytes": stats['file_size_bytes']
+        "file_size_bytes": stats['file_size_bytes'],
+        "dropped_frames": stats['dropped_frames']
     }
 
 @app.get("/api/recording/list")
-async def list_recordings(current_user: User = Depends(get_current_active_user),
-                         db: Session = Depends(get_db)):
-    """Get all recordings"""
-    recordings = db.query(Recording).filter(
-        Recording.user_id == current_user.id
-    ).order_by(Recording.created_at.desc()).all()
+async def list_recordings(cursor: Optional[str] = None,
+                         limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                         camera_id: Optional[int] = None,
+                         smart_only: bool = False,
+                         since: Optional[datetime] = None,
+                         until: Optional[datetime] = None,
+                         current_user: User = Depends(get_current_active_user),
+                         db: AsyncSession = Depends(get_async_db)):
+    """Get recordings, newest first, one page at a time (pass next_cursor back as cursor)"""
+    query = select(
+        Recording.id, Recording.filename, Recording.format, Recording.duration_seconds,
+        Recording.file_size_bytes, Recording.camera_id, Recording.started_at,
+        Recording.ended_at, Recording.is_scheduled, Recording.created_at
+    ).where(Recording.user_id == current_user.id)
+    query = _filter_recordings(query, camera_id, smart_only, since, until)
+    recordings, next_cursor = await _page(db, query, Recording.created_at, Recording.id, cursor, limit)
     
     return {
+        "next_cursor": next_cursor,
         "recordings": [
             {
                 "id": rec.id,
@@ -1009,6 +853,26 @@ async def list_recordings(current_user: User = Depends(get_current_active_user),
         ]
     }
 
+
+def _filter_recordings(query, camera_id: Optional[int], smart_only: bool,
+                       since: Optional[datetime], until: Optional[datetime]):
+    if camera_id is not None:
+        query = query.where(Recording.camera_id == camera_id)
+    if smart_only:
+        query = query.where(Recording.is_smart_clip == True)
+    if since is not None:
+        query = query.where(Recording.created_at >= since)
+    if until is not None:
+        query = query.where(Recording.created_at <= until)
+    return query
+
+
+async def _page(db: AsyncSession, query, ts_col, id_col, cursor: Optional[str], limit: int):
+    try:
+        return await keyset_page_async(db, query, ts_col, id_col, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/api/recording/download/{recording_id}")
 async def download_recording(recording_id: int,
                             current_user: User = Depends(get_current_active_user),
@@ -1055,14 +919,11 @@ async def delete_recording(recording_id: int,
         raise HTTPException(status_code=404, detail="Recording not found")
     
     # Delete file
-    if os.path.exists(recording.storage_path):
-        os.remove(recording.storage_path)
+    storage_ledger.remove_file(recording.storage_path, current_user.id)
     
     db.delete(recording)
     db.commit()
     
-    calculate_storage()
-    
     return {"message": "Recording deleted"}
 
 
@@ -1077,6 +938,7 @@ class SmartRecordingConfigUpdate(_BaseModel):
     buffer_jpeg_quality: _Optional[int] = None
     max_clip_age_days: _Optional[int] = None
     max_storage_mb: _Optional[int] = None
+    max_clip_seconds: _Optional[float] = None
  
  
 @app.get("/api/smart-recording/status")
@@ -1091,12 +953,14 @@ async def get_smart_recording_status(
     return {
         "sessions": smart_recording_manager.get_all_statuses(),
         "storage": smart_recording_manager.get_storage_stats(),
+        "memory": buffer_memory.get_stats(),
         "config": {
             "pre_event_seconds": smart_recording_manager.config.pre_event_seconds,
             "post_event_seconds": smart_recording_manager.config.post_event_seconds,
             "output_dir": smart_recording_manager.config.output_dir,
             "max_clip_age_days": smart_recording_manager.config.max_clip_age_days,
             "max_storage_mb": smart_recording_manager.config.max_storage_mb,
+            "max_clip_seconds": smart_recording_manager.config.max_clip_seconds,
         }
     }
  
@@ -1133,6 +997,8 @@ async def update_smart_recording_config(
         cfg.max_clip_age_days = max(0, config_update.max_clip_age_days)
     if config_update.max_storage_mb is not None:
         cfg.max_storage_mb = max(0, config_update.max_storage_mb)
+    if config_update.max_clip_seconds is not None:
+        cfg.max_clip_seconds = max(0.0, config_update.max_clip_seconds)
  
     return {
         "message": "Config updated",
@@ -1142,6 +1008,7 @@ async def update_smart_recording_config(
             "buffer_jpeg_quality": cfg.buffer_jpeg_quality,
             "max_clip_age_days": cfg.max_clip_age_days,
             "max_storage_mb": cfg.max_storage_mb,
+            "max_clip_seconds": cfg.max_clip_seconds,
         }
     }
  
@@ -1164,20 +1031,25 @@ async def trigger_storage_cleanup(
  
 @app.get("/api/smart-recording/clips")
 async def list_smart_clips(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    camera_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """List all smart event clips (is_smart_clip=True recordings)."""
-    clips = (
-        db.query(Recording)
-        .filter(
-            Recording.user_id == current_user.id,
-            Recording.is_smart_clip == True,
-        )
-        .order_by(Recording.created_at.desc())
-        .all()
-    )
+    """List smart event clips (is_smart_clip=True recordings), newest first, paginated."""
+    query = select(
+        Recording.id, Recording.filename, Recording.duration_seconds,
+        Recording.file_size_bytes, Recording.event_classes, Recording.camera_id,
+        Recording.started_at, Recording.ended_at, Recording.created_at,
+        Recording.event_id, Recording.event_part
+    ).where(Recording.user_id == current_user.id)
+    query = _filter_recordings(query, camera_id, True, since, until)
+    clips, next_cursor = await _page(db, query, Recording.created_at, Recording.id, cursor, limit)
     return {
+        "next_cursor": next_cursor,
         "clips": [
             {
                 "id": c.id,
@@ -1188,6 +1060,8 @@ async def list_smart_clips(
                 "camera_id": c.camera_id,
                 "started_at": c.started_at,
                 "ended_at": c.ended_at,
+                "event_id": c.event_id,
+                "event_part": c.event_part,
             }
             for c in clips
         ]
@@ -1196,15 +1070,33 @@ async def list_smart_clips(
 # ==================== DETECTION MANAGEMENT ====================
 
 @app.get("/api/detection/list")
-async def list_detections(limit: int = 100,
+async def list_detections(limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                         cursor: Optional[str] = None,
+                         camera_id: Optional[int] = None,
+                         class_names: Optional[List[str]] = Query(None),
+                         since: Optional[datetime] = None,
+                         until: Optional[datetime] = None,
                          current_user: User = Depends(get_current_active_user),
-                         db: Session = Depends(get_db)):
-    """Get detection history"""
-    detections = db.query(Detection).join(Camera).filter(
-        Camera.user_id == current_user.id
-    ).order_by(Detection.detected_at.desc()).limit(limit).all()
+                         db: AsyncSession = Depends(get_async_db)):
+    """Get detection history, newest first, paginated"""
+    query = select(
+        Detection.id, Detection.class_name, Detection.confidence,
+        Detection.bbox_x1, Detection.bbox_y1, Detection.bbox_x2, Detection.bbox_y2,
+        Detection.screenshot_path, Detection.crop_segment,
+        Detection.camera_id, Detection.detected_at
+    ).join(Camera).where(Camera.user_id == current_user.id)
+    if camera_id is not None:
+        query = query.where(Detection.camera_id == camera_id)
+    if class_names:
+        query = query.where(Detection.class_name.in_(class_names))
+    if since is not None:
+        query = query.where(Detection.detected_at >= since)
+    if until is not None:
+        query = query.where(Detection.detected_at <= until)
+    detections, next_cursor = await _page(db, query, Detection.detected_at, Detection.id, cursor, limit)
     
     return {
+        "next_cursor": next_cursor,
         "detections": [
             {
                 "id": det.id,
@@ -1217,6 +1109,7 @@ async def list_detections(limit: int = 100,
                     "y2": det.bbox_y2
                 },
                 "screenshot_path": det.screenshot_path,
+                "crop_url": _crop_url(det),
                 "camera_id": det.camera_id,
                 "detected_at": det.detected_at
             }
@@ -1224,6 +1117,54 @@ async def list_detections(limit: int = 100,
         ]
     }
 
+def _crop_sig(detection_id: int) -> str:
+    """
+    Crops are loaded by <img> tags, which can't send the bearer token, so
+    the list hands out crop URLs signed per detection instead.
+    """
+    digest = hmac.new((SECRET_KEY or "").encode(), f"crop:{detection_id}".encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:16]).decode().rstrip("=")
+
+
+def _crop_url(det) -> Optional[str]:
+    if not (det.crop_segment or det.screenshot_path):
+        return None
+    return f"/api/detection/{det.id}/crop?sig={_crop_sig(det.id)}"
+
+
+class _BufferResponse(Response):
+    """Response sent straight from a buffer (crop_store's memoryview), without a copy."""
+    def render(self, content):
+        return content
+
+
+@app.get("/api/detection/{detection_id}/crop")
+async def get_detection_crop(detection_id: int, sig: str,
+                             db: AsyncSession = Depends(get_async_db)):
+    """Serve a detection crop from the crop store (or a legacy JPEG file)"""
+    if not hmac.compare_digest(sig, _crop_sig(detection_id)):
+        raise HTTPException(status_code=404, detail="Crop not found")
+    
+    det = (await db.execute(select(
+        Detection.crop_segment, Detection.crop_offset, Detection.crop_length,
+        Detection.screenshot_path
+    ).where(Detection.id == detection_id))).first()
+    if not det:
+        raise HTTPException(status_code=404, detail="Crop not found")
+    
+    # Crops never change once written
+    headers = {"Cache-Control": "private, max-age=31536000, immutable"}
+    if det.crop_segment:
+        try:
+            data = await asyncio.to_thread(crop_store.read, det.crop_segment, det.crop_offset, det.crop_length)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Crop expired")
+        return _BufferResponse(content=data, media_type="image/jpeg", headers=headers)
+    
+    if det.screenshot_path and os.path.exists(det.screenshot_path):
+        return FileResponse(det.screenshot_path, media_type="image/jpeg", headers=headers)
+    raise HTTPException(status_code=404, detail="Crop not found")
+
 # ==================== SCREENSHOT ====================
 
 @app.post("/api/screenshot/capture")
@@ -1260,14 +1201,18 @@ async def capture_screenshot(session_id: str,
         # Run YOLO detection and draw bounding boxes on the screenshot
         screenshot_frame = frame.copy()
         try:
-            detections = yolo_detector.detect(frame, confidence=0.5)
+            detections = await detection_scheduler.detect(frame, confidence=0.5)
             if detections:
                 screenshot_frame = yolo_detector.draw_detections(screenshot_frame, detections)
                 logger.debug(f"Detected {len(detections)} objects in screenshot")
         except Exception as e:
             logger.warning(f"Failed to run detection on screenshot: {e}")
         
-        cv2.imwrite(filepath, screenshot_frame)
+        # Encode off the event loop; quality matches cv2.imwrite's default
+        jpeg = await pipeline_executors.encode.run(FramePacket(screenshot_frame).jpeg, 95)
+        with storage_ledger.tracked_write(filepath, current_user.id):
+            with open(filepath, "wb") as f:
+                f.write(jpeg)
         
         logger.info(f"Screenshot saved: {filepath}")
         
@@ -1408,14 +1353,24 @@ async def delete_schedule(schedule_id: int,
 
 @app.get("/api/notifications")
 async def get_notifications(unread_only: bool = False,
-                           current_user: User = Depends(get_current_active_user)):
-    """Get user notifications"""
-    notifications = notification_service.get_user_notifications(
-        current_user.id,
-        unread_only=unread_only
-    )
+                           cursor: Optional[str] = None,
+                           limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+                           current_user: User = Depends(get_current_active_user),
+                           db: AsyncSession = Depends(get_async_db)):
+    """Get user notifications, newest first, paginated"""
+    try:
+        notifications, next_cursor = await notification_service.get_user_notifications_async(
+            db,
+            current_user.id,
+            unread_only=unread_only,
+            limit=limit,
+            cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return {
+        "next_cursor": next_cursor,
         "notifications": [
             {
                 "id": notif.id,
@@ -1432,54 +1387,75 @@ async def get_notifications(unread_only: bool = False,
 
 @app.put("/api/notifications/{notification_id}/read")
 async def mark_notification_read(notification_id: int,
-                                current_user: User = Depends(get_current_active_user)):
+                                current_user: User = Depends(get_current_active_user),
+                                db: AsyncSession = Depends(get_async_db)):
     """Mark notification as read"""
-    success = notification_service.mark_as_read(notification_id, current_user.id)
+    success = await notification_service.mark_as_read_async(db, notification_id, current_user.id)
     if not success:
         raise HTTPException(status_code=404, detail="Notification not found")
     return {"message": "Marked as read"}
 
 @app.put("/api/notifications/read-all")
-async def mark_all_read(current_user: User = Depends(get_current_active_user)):
+async def mark_all_read(current_user: User = Depends(get_current_active_user),
+                        db: AsyncSession = Depends(get_async_db)):
     """Mark all notifications as read"""
-    notification_service.mark_all_as_read(current_user.id)
+    await notification_service.mark_all_as_read_async(db, current_user.id)
     return {"message": "All marked as read"}
 
 # ==================== DASHBOARD STATS ====================
 
 @app.get("/api/dashboard/stats")
-async def get_dashboard_stats(current_user: User = Depends(get_current_active_user),
-                             db: Session = Depends(get_db)):
-    """Get real-time dashboard statistics"""
+async def get_dashboard_stats(request: Request,
+                             current_user: User = Depends(get_current_active_user),
+                             db: AsyncSession = Depends(get_async_db)):
+    """Get real-time dashboard statistics (cached briefly, ETag aware)"""
+    cache_key = ("dashboard", current_user.id)
+    entry = analytics_cache.get(cache_key)
+    if entry is None:
+        generation = analytics_cache.generation()
+        stats = await _compute_dashboard_stats(current_user, db)
+        user_cameras = (await db.scalars(select(Camera.id).where(Camera.user_id == current_user.id))).all()
+        entry = analytics_cache.put(cache_key, stats, current_user.id, user_cameras,
+                                    DASHBOARD_CACHE_TTL_SECONDS, generation)
+    return analytics_cache.respond(request, entry)
+
+
+async def _compute_dashboard_stats(current_user: User, db: AsyncSession) -> dict:
     # Active cameras
-    active_cameras = db.query(Camera).filter(
+    active_cameras = await db.scalar(select(func.count(Camera.id)).where(
         Camera.user_id == current_user.id,
         Camera.status == "connected"
-    ).count()
+    ))
     
     # Total recordings
-    total_recordings = db.query(Recording).filter(
+    total_recordings = await db.scalar(select(func.count(Recording.id)).where(
         Recording.user_id == current_user.id
-    ).count()
+    ))
     
-    # Total detections
-    total_detections = db.query(Detection).join(Camera).filter(
+    # Total detections (summed from the hourly rollups)
+    total_detections = await db.scalar(select(
+        func.coalesce(func.sum(DetectionHourlyRollup.detection_count), 0)
+    ).join(Camera).where(
         Camera.user_id == current_user.id
-    ).count()
+    ))
     
-    # Calculate storage
-    calculate_storage()
-    storage_gb = round(storage_stats['total'] / (1024**3), 2)
+    # Storage (ledger counters, O(1))
+    breakdown = {
+        category: storage_ledger.usage(category)["bytes"]
+        for category in ("recordings", "screenshots", "detections")
+    }
+    storage_gb = round(sum(breakdown.values()) / (1024**3), 2)
     
     return {
         "active_cameras": active_cameras,
         "total_recordings": total_recordings,
         "total_detections": total_detections,
         "storage_used_gb": storage_gb,
+        "user_storage_gb": round(storage_ledger.usage(user_id=current_user.id)["bytes"] / (1024**3), 2),
         "storage_breakdown": {
-            "recordings_gb": round(storage_stats['recordings'] / (1024**3), 2),
-            "screenshots_gb": round(storage_stats['screenshots'] / (1024**3), 2),
-            "detections_gb": round(storage_stats['detections'] / (1024**3), 2)
+            "recordings_gb": round(breakdown['recordings'] / (1024**3), 2),
+            "screenshots_gb": round(breakdown['screenshots'] / (1024**3), 2),
+            "detections_gb": round(breakdown['detections'] / (1024**3), 2)
         }
     }
 
@@ -1512,8 +1488,21 @@ async def health_check():
     return {
         "status": "healthy",
         "yolo_loaded": yolo_detector.is_loaded,
+        "yolo_backend": yolo_detector.backend,
         "active_cameras": len(camera_manager.sessions),
-        "active_recordings": len(recording_manager.active_recordings)
+        "active_recordings": len(recording_manager.active_recordings),
+        "recordings": recording_manager.get_stats(),
+        "video_hubs": video_hub_manager.get_all_stats(),
+        "pipeline": {
+            **pipeline_executors.get_stats(),
+            "jpeg_encodes": frame_packet.get_stats(),
+            "inference": detection_scheduler.get_stats(),
+            "detection_sink": detection_sink.get_stats()
+        },
+        "analytics_cache": analytics_cache.get_stats(),
+        "storage_ledger": storage_ledger.get_stats(),
+        "smart_buffer_memory": buffer_memory.get_stats(),
+        "crop_store": crop_store.get_stats()
     }
 
 
@@ -1521,12 +1510,13 @@ async def health_check():
 
 @app.get("/api/analytics/advanced")
 async def get_advanced_analytics(
+    request: Request,
     date_from: Optional[str] = Query(None, description= "Start date YYYY-MM-DD"),
     date_to: Optional[str] = Query(None, description = "End date YYYY-MM-DD"),
     class_names: Optional[List[str]] = Query(None, description="Filter by object class"),
     camera_ids: Optional[List[int]] = Query(None, description="Filter by camera IDs"),  
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
     
 ):
     """
@@ -1535,20 +1525,10 @@ async def get_advanced_analytics(
     All queries are scoped to the current user's cameras.
     """
     
-    # ______________ Base query scoped to current user's cameras_______________________________
-    #all detections from cameras belonging to current user
-    
-    base_q = (
-        db.query(Detection)
-        .join(Camera)
-        .filter(Camera.user_id == current_user.id)
-    )
-
-# ----------------------Apply filters ------------------------
+    dt_from = dt_to = None
     if date_from:
         try:
             dt_from = datetime.fromisoformat(date_from)
-            base_q = base_q.filter(Detection.detected_at >= dt_from)
         except ValueError:
             raise HTTPException(status_code=400, detail= "Invalid date_from. Use YYYY-MM-DD format.")
 
@@ -1556,346 +1536,45 @@ async def get_advanced_analytics(
         try:
             #include the full end day up to 23:59:59
             dt_to = datetime.fromisoformat(date_to+"T23:59:59")
-            base_q = base_q.filter(Detection.detected_at <= dt_to)
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid date_to. Use YYYY-MM-DD format.")
-        
-    if class_names:
-        base_q = base_q.filter(Detection.class_name.in_(class_names))
-    
-    if camera_ids:
-        base_q = base_q.filter(Camera.id.in_(camera_ids))
-        
-        
-# Fetch all matching detections ordered by time (needed for gap analysis)
-    all_detections = base_q.order_by(Detection.detected_at.asc()).all()
-    total = len(all_detections)
-    
-    
-    #___________________ Single-pass aggregation __________________________________ 
-    
-    by_class: dict = defaultdict(int)
-    by_date: dict = defaultdict(int)
-    by_camera_meta: dict = defaultdict(lambda: {"count": 0, "name": "", "confs": []})
-    hour_counts: dict = defaultdict(int)
-    activity_grid: dict = defaultdict(int)    # key: (hour 0-23, weekday 0=Mon)
-    hourly_buckets: dict= defaultdict(int) # key: "YYYY-MM-DD HH:00"
-    
-    for det in all_detections: 
-        by_class[det.class_name] += 1
-        by_date[det.detected_at.strftime("%Y-%m-%d")] += 1
-        by_camera_meta[det.camera_id]["count"] += 1
-        by_camera_meta[det.camera_id]["name"] = (
-            det.camera.name if det.camera else f"Camera {det.camera_id}"
-        )
-        by_camera_meta[det.camera_id]["confs"].append(det.confidence)
-        hour_counts[det.detected_at.hour] += 1
-        activity_grid[(det.detected_at.hour, det.detected_at.weekday())] += 1 
-        hourly_buckets[det.detected_at.strftime("%Y-%m-%d %H:00")] += 1
-        
-        by_date_sorted = [{"date": k, "count": v} for k, v in sorted(by_date.items())]
-        
-        
-    #_________ 1. Detection Count Analytics ___________________________
-    
-    detection_counts = {
-        "total": total,
-        "by_class": [
-            {
-                "class_name": k,
-                "count": v,
-                "percentage": round(v / total * 100, 1) if total > 0 else 0
-            }
-            for k, v in sorted(by_class.items(), key=lambda x: x[1], reverse=True)
-        ],
-        "by_date": by_date_sorted
-    }
-    
-    
-    #___________ 2. Activity Intensity Heatmap (24 hours * 7 weekdays)____________________
-    activity_intensity = [
-        {"hour": h, "weekday": w, "count": activity_grid.get((h,w), 0)}
-        for h in range(24)
-        for w in range(7)
-    ]
-    
-    
-    #______ 3. Peak hours (sorted top 10)_____________________________
-    
-    peak_hours = sorted(
-        [
-            {"hour": h, "count": c, "label": f"{h:02d}:00"}
-            for h,c in hour_counts.items()
-        ],
-        key=lambda x:x["count"],
-        reverse= True
-    )[:10]
-    
-    
-    
-    #__________4. Zone analytics (3*3 grid assuming 1280*720 frame) _____________________
-    # zones mapped to (row,col) where row 0=top, col 0=left
-    
-    FRAME_W, FRAME_H = 1280, 720
-    ZONE_NAMES = {
-        (0,0): "Top-Left",
-        (0,1): "Top-Center",
-        (0,2): "Top-Right",
-        (1,0): "Mid-Left",
-        (1,1): "Mid-Center",
-        (1,2): "Mid-Right",
-        (2,0): "Bot-Left",
-        (2,1): "Bot-Center",
-        (2,2): "Bot-Right"
-    }
-    zone_counts: dict = defaultdict(int)
-
-    for det in all_detections:
-        cx = (det.bbox_x1 + det.bbox_x2) / 2
-        cy = (det.bbox_y1 + det.bbox_y2) / 2
-        col = min(int(cx / FRAME_W * 3), 2)
-        row = min(int(cy / FRAME_H * 3), 2)
-        zone_counts[ZONE_NAMES[(row, col)]] += 1
-    zone_analytics = [
-        {"zone": name, "count": zone_counts.get(name, 0)}
-        for name in ZONE_NAMES.values()
-    ]
-    
-    
-#__________5. Object-wise analysis ________________________
-
-    today_d = datetime.now(timezone.utc).date()
-    yesterday_d = today_d - timedelta(days=1)
-    object_analytics = []
-    for cls, count in sorted(by_class.items(), key=lambda x: x[1], reverse=True):
-        cls_dets = [d for d in all_detections if d.class_name == cls]
-        confs = [d.confidence for d in cls_dets]
-        avg_conf = sum(confs) / len(confs) if confs else 0
-        today_c = sum(1 for d in cls_dets if d.detected_at.date() == today_d)
-        yest_c = sum(1 for d in cls_dets if d.detected_at.date() == yesterday_d)
-        
-        object_analytics.append({
-            "class_name" : cls,
-            "count" : count, 
-            "percentage" : round(count / total * 100, 1) if total > 0 else 0,
-            "avg_confidence" : round(avg_conf * 100, 1),
-            "max_confidence" : round(max(confs) * 100, 1) if confs else 0,
-            "today_count" : today_c,
-            "yesterday_count" : yest_c,
-            "trand_pct" : round(((today_c - yest_c) / max(yest_c, 1)) * 100, 1)
-        })
 
-#__________6. Alert analytics (confidence >= 0.8, no separate model needed)____________
-
-    ALERT_THRESHOLD = 0.8
-    high_conf = [d for d in all_detections if d.confidence >= ALERT_THRESHOLD]
-    alert_by_class: dict = defaultdict(int)
-    for d in high_conf:
-        alert_by_class[d.class_name] += 1
-    alert_analytics = {
-        "total_alerts" : len(high_conf),
-        "threshold" : ALERT_THRESHOLD,
-        "by_class" : [
-            {"class_name": k, "count" : v}
-            for k,v in sorted(alert_by_class.items(), key= lambda x : x[1], reverse=True)
-        ],
-        "alert_rate_pct" : round(len(high_conf) / total * 100, 1) if total > 0 else 0
-        
-    }
-    
-#_________ 7. Camera-wise analytics __________________________
-
-    camera_analytics = []
-    for cam_id, meta in by_camera_meta.items():
-        confs = meta["confs"]
-        cam_dets = [d for d in all_detections if d.camera_id == cam_id]
-        last_ts = cam_dets[-1].detected_at if cam_dets else None
-        camera_analytics.append({
-            "camera_id" : cam_id,
-            "camera_name" : meta["name"],
-            "count" : meta["count"],
-            "avg_comfidence" : round(sum(confs) / len(confs) * 100, 1) if confs else 0,
-            "last_detection" : last_ts.strftime("%Y-%m-%d %H:%M") if last_ts else None
-        })
-    camera_analytics.sort(key=lambda x: x["count"], reverse=True)
-        
-#__________ 8. Trend analytics(today vs yesterday, this week vs last week) _____________
-    week_start = today_d - timedelta(days=today_d.weekday())
-    last_week_start = week_start - timedelta(days=7)
-    today_count = sum(1 for d in all_detections if d.detected_at.date() == today_d)
-    yest_count = sum(1 for d in all_detections if d.detected_at.date() == yesterday_d)
-    this_week = sum(1 for d in all_detections if d.detected_at.date() >= week_start) 
-    last_week = sum(1 for d in all_detections if d.detected_at.date() >= last_week_start and d.detected_at.date() < week_start)
-    last_week = sum(
-        1 for d in all_detections
-        if last_week_start <= d.detected_at.date()< week_start
-    )
-    trend_analytics = {
-        "today_count": today_count,
-        "yesterday_count": yest_count,
-        "day_change_pct" : round(((today_count - yest_count) / max(yest_count, 1)) * 100, 1),
-        "this_week" : this_week, 
-        "last_week" : last_week,
-        "week_change_pct" : round(((this_week - last_week) / max(last_week, 1)) * 100, 1),
-        "daily_series" : by_date_sorted[-30:] # last 30 days
-    } 
-    
-#________ 9. Average detection rate _________________________
-
-    if total > 1:
-        span_hours = max(
-            (all_detections[-1].detected_at - all_detections[0].detected_at).total_seconds()/3600,
-            1.0
+    # Trend sections compare against "today", so the UTC date is part of the key
+    now = datetime.utcnow()
+    cache_key = ("advanced", current_user.id, now.date().isoformat(), normalize_filters(
+        date_from=dt_from, date_to=dt_to, class_names=class_names, camera_ids=camera_ids
+    ))
+    entry = analytics_cache.get(cache_key)
+    if entry is None:
+        generation = analytics_cache.generation()
+        # All aggregation happens in SQL (see analytics_queries.py); run_sync
+        # drives the sync query builder over the async connection
+        analytics = await db.run_sync(
+            build_advanced_analytics, current_user.id, dt_from, dt_to, class_names, camera_ids
         )
-        avg_rate = round(total / span_hours, 2)
-    else: 
-        avg_rate = float(total)
-        
-#____________10. No-activity periods (consecutive gaps >= 30 minutes)______________________________
-    GAP_THRESHOLD_MINUTES = 30
-    no_activity_periods = []
-    if len(all_detections) > 1:
-        for i in range(1, len(all_detections)):
-            gap_min = (
-                all_detections[i].detected_at  - all_detections[i-1].detected_at
-            ).total_seconds() / 60
-            if gap_min >= GAP_THRESHOLD_MINUTES:
-                no_activity_periods.append({
-                    "from": all_detections[i-1].detected_at.strftime("%Y-%m-%d %H:%M"),
-                    "to": all_detections[i].detected_at.strftime("%Y-%m-%d %H:%M"),
-                    "duration_minutes": round(gap_min, 1)
-                })
-    no_activity_periods.sort(key=lambda x: x["duration_minutes"], reverse=True)
-
-
-# ___ 11. Timeline chart (houly buckets for graph plotting)___________________________
-
-    timeline_chart = [
-        {"time": k, "count": v}
-        for k, v in sorted(hourly_buckets.items())
-    ]
-    
-#____ 12. Smart insights (auto-generated)_________________________
-
-    insights = []
-    if total == 0:
-        insights.append({
-            "type": "info",
-            "text": "No detections found for the selected filters."
-        })
-    else:
-        #Most detected class
-        if by_class:
-            top_cls = max(by_class, key=by_class.get)
-            pct = round(by_class[top_cls] / total * 100, 1)
-            insights.append({
-                "type": "info",
-                "text": f"'{top_cls.capitalize()}' is the most detected object - {by_class[top_cls]} detections ({pct}% of total activity)."
-            })
-        
-        #Peak hours
-        if peak_hours:
-            ph = peak_hours[0]
-            insights.append({
-                "type": "info",
-                "text": f"Peak detection hour is {ph['label']} with {ph['count']} detections."
-            })
-            
-        # Day-over-day trend 
-        
-        if yest_count > 0:
-            if today_count > yest_count:
-                direction = "up"
-                w = "warning"
-            elif today_count < yest_count:
-                direction = "down"
-                w = "success"
-            else:
-                direction = "unchanged"
-                t = "info"
-            pct = round(abs(trend_analytics["day_change_pct"]))
-            
-            if direction == "unchanged":
-                insights.append({
-                 "type": t,
-                 "text": f"Activity remained unchanged compared to yesterday ({today_count} detections)."
-            })
-            else:
-                insights.append({
-                 "type": w,
-                 "text": f" Activity is {direction} {pct}% today vs yesterday ({today_count} vs {yest_count} detections)"
-            })
-        
-        elif today_count > 0:
-            insights.append({
-                "type": "info",
-                "text": f"{today_count} new detections recorded today (no data for yesterday to compare)"
-            })
-            
-        # High confidence alerts 
-        if len(high_conf) > 0:
-            insights.append({
-                "type": "warning",
-                "text": f"{len(high_conf)} high-confidence alerts detected (>= {int(ALERT_THRESHOLD*100)}% confidence). Review these events."
-            })    
-
-        # Longest quiet period
-        if no_activity_periods:
-            lg = no_activity_periods[0]
-            insights.append({
-                "type": "info",
-                "text": f"Longest quiet gap: {lg['duration_minutes']} min (from{lg['from']} to {lg['to']})."
-            })
-    
-        # Most active camera
-        if camera_analytics:
-            top_cam = camera_analytics[0]
-            insights.append({
-                "type": "info",
-                "text": f"Most active camera is '{top_cam['camera_name']} with {top_cam['count']} detections."
-            })
-
-        # Busiest Zone
-        if zone_counts:
-            top_zone = max(zone_counts, key=zone_counts.get)
-            insights.append({
-                "type" : "info",
-                "text": f"Highest activity zone: '{top_zone}' ({zone_counts[top_zone]} detections)."
-            })
-            
-        #Low confidence warning 
-        low_con = [d for d in all_detections if d.confidence <0.3]
-        if len(low_con) / total * 0.3:
-            insights.append({
-                "type": "warning",
-                "text": f"{len(low_con)} detections ({round(len(low_con)/total*100,2)}%) have confidence below 30%. Consider raising the detection threshold."
-            })
-        
-        # Response
-        return{
-            "total" : total,
-            "filters_applied" : {
-                "date_from" : date_from,
-                "date_to" : date_to,
-                "class_names" : class_names,
-                "camera_ids" : camera_ids
-            },
-            "detection_counts" : detection_counts,
-            "activity_intensity" : activity_intensity,
-            "peak_hours" : peak_hours,
-            "zone_analytics" : zone_analytics,
-            "object_analytics" : object_analytics,
-            "alert_analytics" : alert_analytics,
-            "camera_analytics" : camera_analytics,
-            "trend_analytics" : trend_analytics,
-            "average_detection_rate_per_hour" : avg_rate,
-            "no_activity_periods" : no_activity_periods[:10], # top 10 longest gaps
-            "timeline_chart" : timeline_chart,
-            "smart_insights" : insights
-        }
-    
-            
-        
+        cameras = select(Camera.id).where(Camera.user_id == current_user.id)
+        if camera_ids:
+            cameras = cameras.where(Camera.id.in_(camera_ids))
+        # A range that ended in the past can't gain detections: no TTL
+        closed = dt_to is not None and dt_to < now
+        entry = analytics_cache.put(
+            cache_key, analytics, current_user.id, (await db.scalars(cameras)).all(),
+            None if closed else ANALYTICS_CACHE_TTL_SECONDS, generation
+        )
+
+    analytics = dict(entry.value)
+    return analytics_cache.respond(request, entry, {
+        "total" : analytics.pop("total"),
+        "filters_applied" : {
+            "date_from" : date_from,
+            "date_to" : date_to,
+            "class_names" : class_names,
+            "camera_ids" : camera_ids
+        },
+        **analytics
+    })
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,186 @@
+"""
+Buffer Memory - Process-wide RAM budget for smart-recording buffers
+
+Every pre-event buffer (and every event recorder queue) opens an account
+here and reports byte deltas as frames come and go, so usage is an O(1)
+read and the total across all cameras can be held under one cap.
+
+When the total climbs, buffers degrade in steps, and only buffers using
+more than their fair share (cap / number of buffers) are touched, so one
+busy high-resolution camera can't push a quiet one out of its pre-roll:
+
+    usage >= reduce_quality_at   → store new frames at a lower JPEG quality
+    usage >= decimate_at         → keep every other idle pre-roll frame
+    usage >= shrink_at           → evict the oldest pre-roll frames until
+                                   the buffer is back at its fair share
+
+Event recorder queues are counted in the total but never degraded: frames
+already committed to a clip are not thrown away to save memory.
+
+    account = buffer_memory.open_account("sess-1", degradable=True)
+    account.add(len(jpeg))
+    if account.pressure >= Pressure.DECIMATE: ...
+    buffer_memory.close_account(account)
+"""
+
+import logging
+import os
+import threading
+from enum import IntEnum
+from typing import Dict
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SMART_BUFFER_MEMORY_MB = float(os.getenv("SMART_BUFFER_MEMORY_MB", 512))   # 0 = unlimited
+
+
+class Pressure(IntEnum):
+    NORMAL = 0
+    REDUCE_QUALITY = 1
+    DECIMATE = 2
+    SHRINK = 3
+
+
+class BufferAccount:
+    """Byte counter for one buffer.  Updated by its owner, read by anyone."""
+
+    __slots__ = ("name", "degradable", "bytes", "peak_bytes", "closed", "_manager")
+
+    def __init__(self, manager: "BufferMemoryManager", name: str, degradable: bool):
+        self.name = name
+        self.degradable = degradable
+        self.bytes = 0
+        self.peak_bytes = 0
+        self.closed = False
+        self._manager = manager
+
+    def add(self, delta: int):
+        """Report bytes added (positive) or released (negative)."""
+        if delta:
+            self._manager._add(self, delta)
+
+    @property
+    def pressure(self) -> Pressure:
+        return self._manager.pressure_for(self)
+
+    @property
+    def fair_share(self) -> int:
+        """Bytes this buffer may hold before it counts as over its share (0 = no cap)."""
+        return self._manager.fair_share()
+
+
+class BufferMemoryManager:
+    def __init__(
+        self,
+        cap_bytes: int = int(SMART_BUFFER_MEMORY_MB * 1024 * 1024),
+        reduce_quality_at: float = 0.75,
+        decimate_at: float = 0.9,
+        shrink_at: float = 1.0,
+    ):
+        """
+        Args:
+            cap_bytes:          Global budget for all accounts (0 = unlimited)
+            reduce_quality_at:  Usage ratio where buffers lower their JPEG quality
+            decimate_at:        Usage ratio where idle pre-roll is thinned out
+            shrink_at:          Usage ratio where pre-roll windows are cut back
+        """
+        self.cap_bytes = max(0, cap_bytes)
+        self.reduce_quality_at = reduce_quality_at
+        self.decimate_at = decimate_at
+        self.shrink_at = shrink_at
+
+        self._lock = threading.Lock()
+        self._accounts: Dict[int, BufferAccount] = {}
+        self._total = 0
+        self._degradable = 0
+
+        # Statistics
+        self.peak_bytes = 0
+        self.peak_pressure = Pressure.NORMAL
+
+    # ── Accounts ──────────────────────────────────────────────────────────
+
+    def open_account(self, name: str, degradable: bool = True) -> BufferAccount:
+        account = BufferAccount(self, name, degradable)
+        with self._lock:
+            self._accounts[id(account)] = account
+            self._degradable += int(degradable)
+        return account
+
+    def close_account(self, account: BufferAccount):
+        """Release whatever the account still holds; later add() calls are ignored."""
+        with self._lock:
+            if account.closed:
+                return
+            account.closed = True
+            self._accounts.pop(id(account), None)
+            self._degradable -= int(account.degradable)
+            self._total -= account.bytes
+            account.bytes = 0
+
+    def _add(self, account: BufferAccount, delta: int):
+        with self._lock:
+            if account.closed:
+                return
+            account.bytes += delta
+            account.peak_bytes = max(account.peak_bytes, account.bytes)
+            self._total += delta
+            self.peak_bytes = max(self.peak_bytes, self._total)
+
+    # ── Pressure ──────────────────────────────────────────────────────────
+
+    @property
+    def used_bytes(self) -> int:
+        return self._total
+
+    def usage(self) -> float:
+        return self._total / self.cap_bytes if self.cap_bytes else 0.0
+
+    def fair_share(self) -> int:
+        if not self.cap_bytes:
+            return 0
+        return self.cap_bytes // max(1, self._degradable)
+
+    def global_pressure(self) -> Pressure:
+        usage = self.usage()
+        if usage >= self.shrink_at:
+            return Pressure.SHRINK
+        if usage >= self.decimate_at:
+            return Pressure.DECIMATE
+        if usage >= self.reduce_quality_at:
+            return Pressure.REDUCE_QUALITY
+        return Pressure.NORMAL
+
+    def pressure_for(self, account: BufferAccount) -> Pressure:
+        """Global pressure, applied only to degradable buffers above their fair share."""
+        if not account.degradable or not self.cap_bytes:
+            return Pressure.NORMAL
+        pressure = self.global_pressure()
+        if pressure == Pressure.NORMAL or account.bytes <= self.fair_share():
+            return Pressure.NORMAL
+        if pressure > self.peak_pressure:
+            self.peak_pressure = pressure
+            logger.warning(
+                f"Buffer memory at {self.usage():.0%} of "
+                f"{self.cap_bytes / 1_048_576:.0f}MB: buffers over their share → {pressure.name}"
+            )
+        return pressure
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            accounts = sorted(self._accounts.values(), key=lambda a: a.bytes, reverse=True)
+            return {
+                "cap_mb": round(self.cap_bytes / 1_048_576, 1),
+                "used_mb": round(self._total / 1_048_576, 2),
+                "peak_mb": round(self.peak_bytes / 1_048_576, 2),
+                "usage": round(self.usage(), 3),
+                "pressure": self.global_pressure().name,
+                "peak_pressure": self.peak_pressure.name,
+                "fair_share_mb": round(self.fair_share() / 1_048_576, 2),
+                "accounts": {a.name: round(a.bytes / 1_048_576, 2) for a in accounts},
+            }
+
+
+# Global instance
+buffer_memory = BufferMemoryManager()
@@ -6,27 +6,68 @@ Supports USB, RTSP, IP, and RAW stream types
 import cv2
 import asyncio
 import logging
+import os
+import threading
 import time
+from dataclasses import dataclass
 from typing import Dict, Optional
 from urllib.parse import urlparse, unquote
 import uuid
 
+import numpy as np
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# "threaded" (default): each session owns a background reader thread that keeps
+# the latest decoded frame in a slot.  "inline": frames are grabbed on demand
+# inside get_frame() (legacy behaviour).
+CAPTURE_MODE = os.getenv("CAMERA_CAPTURE_MODE", "threaded").lower()
+
+
+@dataclass
+class FrameSlot:
+    """Latest decoded frame of a session, stamped by the capture side."""
+    frame: np.ndarray
+    seq: int            # monotonically increasing per session, starts at 1
+    timestamp: float    # time.time() when the frame was decoded
+
+
+class _Reader:
+    """One reader thread and the capture it reads (threaded mode)."""
+
+    def __init__(self, capture):
+        self.capture = capture
+        self.stop = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        # A reader stuck in capture.read() past disconnect's join releases
+        # the capture itself; releasing it from another thread can crash OpenCV
+        self.lock = threading.Lock()
+        self.exited = False
+        self.release_on_exit = False
+
 
 class CameraSession:
-    def __init__(self, session_id: str, url, camera_id: int, stream_type: str = "rtsp"):
+    def __init__(self, session_id: str, url, camera_id: int, stream_type: str = "rtsp",
+                 capture_mode: str = CAPTURE_MODE):
         self.session_id = session_id
         self.url = url
         self.camera_id = camera_id
         self.stream_type = stream_type or "rtsp"
+        self.capture_mode = capture_mode
         self.capture = None
         self.connected = False
         self.is_running = False
         self.last_frame = None
         self.fps = 10
 
+        # Latest-frame slot (written by the reader thread or by inline reads)
+        self._slot: Optional[FrameSlot] = None
+        self._slot_lock = threading.Lock()
+        self._frame_seq = 0
+        self._reader: Optional[_Reader] = None
+        self.read_failures = 0
+
     async def connect(self):
         """Stable camera connection with support for USB, RTSP, IP, and RAW streams"""
         try:
@@ -153,8 +194,15 @@ class CameraSession:
 
             self.connected = True
             self.is_running = True
+            self._publish(self.last_frame)
+
+            if self.capture_mode == "threaded":
+                self._start_reader()
 
-            logger.info(f"[Camera {self.camera_id}] Connected successfully (FPS: {self.fps})")
+            logger.info(
+                f"[Camera {self.camera_id}] Connected successfully "
+                f"(FPS: {self.fps}, capture: {self.capture_mode})"
+            )
             return True
 
         except Exception as e:
@@ -208,33 +256,131 @@ class CameraSession:
         
         return variations
 
-    async def get_frame(self):
-        """Get a single frame from the camera"""
+    # ── Latest-frame slot ─────────────────────────────────────────────────
+
+    def _publish(self, frame) -> FrameSlot:
+        """Store a freshly decoded frame in the slot with the next sequence number."""
+        with self._slot_lock:
+            self._frame_seq += 1
+            self._slot = FrameSlot(frame=frame, seq=self._frame_seq, timestamp=time.time())
+            self.last_frame = frame
+            return self._slot
+
+    def _start_reader(self):
+        """Spawn the background thread that keeps the slot filled."""
+        reader = _Reader(self.capture)
+        reader.thread = threading.Thread(
+            target=self._reader_loop,
+            args=(reader,),
+            name=f"camera-reader-{self.camera_id}",
+            daemon=True,
+        )
+        self._reader = reader
+        reader.thread.start()
+
+    def _reader_loop(self, reader: _Reader):
+        """
+        Decode frames as fast as the source delivers them.
+        Only the newest frame is kept, so a slow consumer never sees stale
+        footage piling up in the capture buffer.
+        """
+        capture = reader.capture
+        while not reader.stop.is_set():
+            if capture is None or not capture.isOpened():
+                break
+
+            try:
+                ret, frame = capture.read()
+            except Exception as e:
+                logger.error(f"[Camera {self.camera_id}] Frame read error: {e}")
+                ret, frame = False, None
+
+            if not ret or frame is None:
+                self.read_failures += 1
+                # Back off a little so a dead stream doesn't spin a core
+                reader.stop.wait(0.01)
+                continue
+
+            if not reader.stop.is_set():
+                self._publish(frame)
+
+        with reader.lock:
+            reader.exited = True
+            release = reader.release_on_exit
+        if release:
+            try:
+                capture.release()
+            except Exception as e:
+                logger.error(f"[Camera {self.camera_id}] Error releasing capture: {e}")
+        logger.info(f"[Camera {self.camera_id}] Reader thread stopped")
+
+    def get_latest(self) -> Optional[FrameSlot]:
+        """Return the current slot without touching the capture device."""
+        with self._slot_lock:
+            return self._slot
+
+    @property
+    def frame_size(self) -> Optional[tuple]:
+        """(width, height) of the latest decoded frame, None before the first one."""
+        slot = self.get_latest()
+        if slot is None:
+            return None
+        return (slot.frame.shape[1], slot.frame.shape[0])
+
+    async def read_slot(self) -> Optional[FrameSlot]:
+        """
+        Return the newest FrameSlot.
+
+        In threaded mode this is a non-blocking read of the slot; callers can
+        compare ``slot.seq`` with the last one they consumed to skip repeats.
+        In inline mode a fresh frame is grabbed from the device first.
+        """
+        if self.capture_mode == "threaded":
+            return self.get_latest()
+
         if not self.capture or not self.capture.isOpened():
             return None
-        
+
         try:
-            ################################# ADDED
-            #start = time.time()
-            for _ in range(2):    
+            for _ in range(2):
                 self.capture.grab()
             ret, frame = self.capture.retrieve()
-            
-            #print(f"READ TIME = {time.time() - start:.3f}s")
             if ret and frame is not None:
-                self.last_frame = frame
-                return frame
+                return self._publish(frame)
         except Exception as e:
             logger.error(f"[Camera {self.camera_id}] Frame read error: {e}")
 
         return None
 
+    async def get_frame(self):
+        """Get the latest frame from the camera"""
+        slot = await self.read_slot()
+        return slot.frame if slot else None
+
     async def disconnect(self):
         """Disconnect and cleanup camera"""
         self.is_running = False
         self.connected = False
 
-        if self.capture:
+        # Stop the reader before releasing the device it is reading from
+        release = True
+        reader, self._reader = self._reader, None
+        if reader is not None:
+            reader.stop.set()
+            if reader.thread is not threading.current_thread():
+                await asyncio.to_thread(reader.thread.join, 2.0)
+            with reader.lock:
+                if not reader.exited and reader.capture is self.capture:
+                    # Still inside capture.read(): the reader releases it on its way out
+                    reader.release_on_exit = True
+                    release = False
+            if not release:
+                logger.warning(
+                    f"[Camera {self.camera_id}] Reader thread did not stop in time; "
+                    f"it will release the capture when its read returns"
+                )
+
+        if self.capture and release:
             try:
                 self.capture.release()
             except Exception as e:
@@ -0,0 +1,411 @@
+"""
+Crop Store - Packed append-only storage for detection crops
+
+Instead of one tiny JPEG per detected box, crops are appended to large
+segment files under detections/packs/.  A crop is addressed by
+(segment, offset, length), which the detection sink stores on the
+Detection row itself (crop_segment / crop_offset / crop_length), so the
+detections table is the index.
+
+Segment layout: a sequence of records, each an 8-byte header
+(b"CRP1", little-endian uint32 payload length) followed by the JPEG bytes.
+The stored offset points at the payload, so a read is a zero-copy slice
+of the segment's read-only memory map.  The header only exists so a segment can be walked without
+the database.
+
+A segment is closed when it reaches segment_max_bytes or the UTC day
+changes, and retention deletes whole closed segments once they are older
+than retention_days, clearing the crop columns of the rows that pointed
+into them.
+"""
+
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from sqlalchemy import func, update
+
+from database import Camera, Detection
+from storage_ledger import storage_ledger
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CROP_STORE_DIR = os.getenv("CROP_STORE_DIR", os.path.join("detections", "packs"))
+CROP_SEGMENT_MAX_MB = float(os.getenv("CROP_SEGMENT_MAX_MB", 64))
+CROP_RETENTION_DAYS = float(os.getenv("CROP_RETENTION_DAYS", 30))       # 0 = keep forever
+CROP_RETENTION_CHECK_HOURS = float(os.getenv("CROP_RETENTION_CHECK_HOURS", 1))
+CROP_STORE_OPEN_SEGMENTS = int(os.getenv("CROP_STORE_OPEN_SEGMENTS", 32))  # cached read mappings
+
+RECORD_HEADER = struct.Struct("<4sI")
+RECORD_MAGIC = b"CRP1"
+
+# "20261017_142501_3.pack" – creation time (UTC) + sequence number
+_SEGMENT_NAME = re.compile(r"^(\d{8}_\d{6})_(\d+)\.pack$")
+
+# Crops are encoded a few seconds after the detection timestamp
+_DETECTED_AT_SLACK = timedelta(minutes=5)
+
+
+class CropRef(NamedTuple):
+    segment: str
+    offset: int
+    length: int
+
+
+def _unmap(mm: mmap.mmap):
+    """Close a segment map; with views still out it is unmapped when they go."""
+    try:
+        mm.close()
+    except BufferError:
+        pass
+
+
+class CropStore:
+    def __init__(
+        self,
+        directory: str = CROP_STORE_DIR,
+        segment_max_bytes: int = int(CROP_SEGMENT_MAX_MB * 1024 * 1024),
+        retention_days: float = CROP_RETENTION_DAYS,
+        retention_check_interval: float = CROP_RETENTION_CHECK_HOURS * 3600,
+        max_open_segments: int = CROP_STORE_OPEN_SEGMENTS,
+    ):
+        """
+        Args:
+            directory:                Where segment files live
+            segment_max_bytes:        Close the active segment once it reaches this size
+            retention_days:           Delete closed segments older than this (0 = never)
+            retention_check_interval: Seconds between retention passes
+            max_open_segments:        Segment memory maps kept open (LRU)
+        """
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.retention_days = retention_days
+        self.retention_check_interval = retention_check_interval
+        self.max_open_segments = max(1, max_open_segments)
+
+        self._db_factory = None
+        self._write_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self._active: Optional[str] = None
+        self._active_fd: Optional[int] = None
+        self._active_size = 0
+        self._active_day = None
+        self._sequence = 0
+        self._maps: "OrderedDict[str, mmap.mmap]" = OrderedDict()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Statistics
+        self.appended = 0
+        self.appended_bytes = 0
+        self.reads = 0
+        self.read_misses = 0
+        self.segments_opened = 0
+        self.segments_deleted = 0
+        self.orphaned = 0
+        self.last_retention_at: Optional[datetime] = None
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def set_db_factory(self, factory):
+        """Inject the database session factory (called from app.py startup)."""
+        self._db_factory = factory
+
+    def start(self):
+        """Start the background retention thread."""
+        self._thread = threading.Thread(target=self._run, name="crop_store", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        with self._write_lock:
+            self._close_active()
+        with self._read_lock:
+            for mm in self._maps.values():
+                _unmap(mm)
+            self._maps.clear()
+
+    # ── Writing ───────────────────────────────────────────────────────────
+
+    def append(self, data: bytes, user_id: Optional[int] = None) -> CropRef:
+        """Append one encoded crop and return where it landed.  Thread-safe."""
+        record = RECORD_HEADER.pack(RECORD_MAGIC, len(data)) + data
+        with self._write_lock:
+            now = datetime.utcnow()
+            new_segment = (
+                self._active_fd is None
+                or self._active_day != now.date()
+                or self._active_size + len(record) > self.segment_max_bytes
+            )
+            if new_segment:
+                self._open_segment(now)
+
+            offset = self._active_size + RECORD_HEADER.size
+            view = memoryview(record)
+            while view:
+                view = view[os.write(self._active_fd, view):]
+            self._active_size += len(record)
+            segment = self._active
+            self.appended += 1
+            self.appended_bytes += len(record)
+
+        storage_ledger.record(self._path(segment), len(record), int(new_segment), user_id)
+        return CropRef(segment, offset, len(data))
+
+    def disown(self, refs: Iterable[CropRef], user_id: Optional[int] = None):
+        """
+        Crops whose Detection rows were never written.  Their bytes move from
+        `user_id` (who append() charged) to the unowned total, which is where
+        retention takes unreferenced records off when the segment goes.
+        """
+        for ref in refs:
+            path = self._path(ref.segment)
+            nbytes = RECORD_HEADER.size + ref.length
+            opener = int(ref.offset == RECORD_HEADER.size)
+            if user_id is not None:
+                storage_ledger.record(path, -nbytes, -opener, user_id)
+                storage_ledger.record(path, nbytes, opener)
+            with self._write_lock:
+                self.orphaned += 1
+
+    def _open_segment(self, now: datetime):
+        self._close_active()
+        while True:
+            self._sequence += 1
+            name = f"{now:%Y%m%d_%H%M%S}_{self._sequence}.pack"
+            try:
+                fd = os.open(self._path(name), os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_EXCL, 0o644)
+                break
+            except FileExistsError:
+                continue
+        self._active, self._active_fd = name, fd
+        self._active_size = 0
+        self._active_day = now.date()
+        self.segments_opened += 1
+        logger.info(f"Crop store: opened segment {name}")
+
+    def _close_active(self):
+        if self._active_fd is not None:
+            os.close(self._active_fd)
+        self._active = self._active_fd = None
+
+    # ── Reading ───────────────────────────────────────────────────────────
+
+    def read(self, segment: str, offset: int, length: int) -> memoryview:
+        """
+        Return the crop as a read-only view of the segment's memory map (no
+        copy, no lock held while the caller uses it).  Raises
+        FileNotFoundError when the segment is gone (retention) or the
+        reference doesn't fit inside it.
+        """
+        if not _SEGMENT_NAME.match(segment or ""):
+            raise FileNotFoundError(segment)
+        end = offset + length
+        # Only the map lookup is locked; the slice keeps its mapping alive
+        # even if LRU eviction or retention drops it meanwhile
+        with self._read_lock:
+            mm = self._mapping(segment, end)
+            self.reads += 1
+            if end > len(mm):
+                self.read_misses += 1
+                raise FileNotFoundError(f"{segment}@{offset}+{length}")
+        return memoryview(mm)[offset:end]
+
+    def _mapping(self, segment: str, end: int) -> mmap.mmap:
+        """
+        Cached read-only map of a segment (caller holds _read_lock).  The
+        active segment grows, so it is remapped when a reference lies past
+        the end of its current map.
+        """
+        mm = self._maps.get(segment)
+        if mm is not None and end <= len(mm):
+            self._maps.move_to_end(segment)
+            return mm
+        try:
+            with open(self._path(segment), "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    raise FileNotFoundError(segment)
+                new = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            self.read_misses += 1
+            raise
+        if mm is not None:
+            _unmap(mm)
+        self._maps[segment] = new
+        self._maps.move_to_end(segment)
+        while len(self._maps) > self.max_open_segments:
+            _, old = self._maps.popitem(last=False)
+            _unmap(old)
+        return new
+
+    # ── Retention ─────────────────────────────────────────────────────────
+
+    def run_retention(self) -> dict:
+        """Delete closed segments older than retention_days."""
+        if self.retention_days <= 0:
+            return {"deleted": 0, "freed_bytes": 0}
+
+        cutoff = time.time() - self.retention_days * 86_400
+        deleted = freed = cleared = 0
+        for name in sorted(os.listdir(self.directory)):
+            match = _SEGMENT_NAME.match(name)
+            if not match or name == self._active:
+                continue
+            path = self._path(name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if st.st_mtime > cutoff:
+                continue
+
+            with self._read_lock:
+                mm = self._maps.pop(name, None)
+                if mm is not None:
+                    _unmap(mm)
+            opened_at = datetime.strptime(match.group(1), "%Y%m%d_%H%M%S")
+            last_write_at = datetime.utcfromtimestamp(st.st_mtime)
+            owners = self._segment_owners(name, opened_at, last_write_at)
+            try:
+                os.remove(path)
+            except PermissionError:
+                # Windows: a crop response still holds a view of the map
+                logger.info(f"Crop store retention: {name} still in use, retrying next pass")
+                continue
+            self._release(path, st.st_size, owners)
+            cleared += self._clear_references(name, opened_at, last_write_at)
+            deleted += 1
+            freed += st.st_size
+            logger.info(f"Crop store retention: deleted segment {name}")
+
+        self.segments_deleted += deleted
+        self.last_retention_at = datetime.utcnow()
+        return {
+            "deleted": deleted,
+            "freed_bytes": freed,
+            "freed_mb": round(freed / 1_048_576, 2),
+            "detections_cleared": cleared,
+        }
+
+    def _segment_owners(
+        self, segment: str, opened_at: datetime, last_write_at: datetime
+    ) -> Dict[Optional[int], Tuple[int, bool]]:
+        """
+        Bytes each camera owner has in a segment, and whether they opened it
+        (append() charged the segment's file count to its first crop's owner).
+        """
+        if self._db_factory is None:
+            return {}
+        db = self._db_factory()
+        try:
+            rows = (
+                db.query(
+                    Camera.user_id,
+                    func.sum(Detection.crop_length),
+                    func.count(Detection.id),
+                    func.min(Detection.crop_offset),
+                )
+                .join(Camera, Camera.id == Detection.camera_id)
+                .filter(
+                    Detection.detected_at >= opened_at - _DETECTED_AT_SLACK,
+                    Detection.detected_at <= last_write_at + _DETECTED_AT_SLACK,
+                    Detection.crop_segment == segment,
+                )
+                .group_by(Camera.user_id)
+                .all()
+            )
+            return {
+                user_id: (int(length or 0) + count * RECORD_HEADER.size, first == RECORD_HEADER.size)
+                for user_id, length, count, first in rows
+            }
+        except Exception as e:
+            logger.error(f"Crop store: could not look up owners of {segment}: {e}")
+            return {}
+        finally:
+            db.close()
+
+    @staticmethod
+    def _release(path: str, size: int, owners: Dict[Optional[int], Tuple[int, bool]]):
+        """Take a deleted segment off the storage ledger, per owner.
+
+        Records no row points at (failed inserts, unknown cameras) and the
+        file itself when its opener is unknown fall back to the unowned total.
+        """
+        bytes_left, files_left = size, 1
+        for user_id, (nbytes, opener) in owners.items():
+            if user_id is None:
+                continue
+            nbytes = min(nbytes, bytes_left)
+            storage_ledger.record(path, -nbytes, -int(opener and files_left > 0), user_id)
+            bytes_left -= nbytes
+            files_left -= int(opener and files_left > 0)
+        if bytes_left or files_left:
+            storage_ledger.record(path, -bytes_left, -files_left)
+
+    def _clear_references(self, segment: str, opened_at: datetime, last_write_at: datetime) -> int:
+        """Null the crop columns of rows in a deleted segment (index range on detected_at)."""
+        if self._db_factory is None:
+            return 0
+        db = self._db_factory()
+        try:
+            result = db.execute(
+                update(Detection)
+                .where(
+                    Detection.detected_at >= opened_at - _DETECTED_AT_SLACK,
+                    Detection.detected_at <= last_write_at + _DETECTED_AT_SLACK,
+                    Detection.crop_segment == segment,
+                )
+                .values(crop_segment=None, crop_offset=None, crop_length=None)
+            )
+            db.commit()
+            return result.rowcount
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Crop store: could not clear references to {segment}: {e}")
+            return 0
+        finally:
+            db.close()
+
+    def get_stats(self) -> dict:
+        return {
+            "directory": self.directory,
+            "active_segment": self._active,
+            "active_segment_mb": round(self._active_size / 1_048_576, 2),
+            "appended": self.appended,
+            "appended_mb": round(self.appended_bytes / 1_048_576, 2),
+            "reads": self.reads,
+            "read_misses": self.read_misses,
+            "open_read_segments": len(self._maps),
+            "segments_opened": self.segments_opened,
+            "segments_deleted": self.segments_deleted,
+            "orphaned": self.orphaned,
+            "retention_days": self.retention_days,
+            "last_retention_at": self.last_retention_at,
+        }
+
+    # ── Internal helpers ──────────────────────────────────────────────────
+
+    def _path(self, segment: str) -> str:
+        return os.path.join(self.directory, segment)
+
+    def _run(self):
+        while not self._stop.wait(self.retention_check_interval):
+            try:
+                self.run_retention()
+            except Exception as e:
+                logger.error(f"Crop store retention failed: {e}")
+
+
+# Global instance
+# Call crop_store.set_db_factory(SessionLocal) then start() in app.py startup.
+crop_store = CropStore()
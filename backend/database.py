@@ -23,8 +23,10 @@ HOW TO APPLY
  
 from sqlalchemy import (
     create_engine, Column, Integer, String, Boolean,
-    DateTime, Float, JSON, ForeignKey, Text
+    DateTime, Float, JSON, ForeignKey, Text, Index, case, cast, event, func,
+    inspect, insert, select, text
 )
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
@@ -42,10 +44,65 @@ engine = create_engine(
     },
     pool_pre_ping=True
 )
+ 
+# ★ NEW – SQLite performance profile (WAL, relaxed fsync, mmap, bigger page cache)
+DB_PERFORMANCE_PROFILE = os.getenv("DB_PERFORMANCE_PROFILE", "true").lower() == "true"
+SQLITE_MMAP_SIZE_MB = int(os.getenv("SQLITE_MMAP_SIZE_MB", 256))
+SQLITE_CACHE_SIZE_MB = int(os.getenv("SQLITE_CACHE_SIZE_MB", 64))
+ 
+ 
+def sqlite_performance_pragmas(dbapi_connection, connection_record=None):
+    """
+    Applied to every new SQLite connection.  WAL lets the API read while the
+    detection sink writes; synchronous=NORMAL is durable in WAL mode except
+    for the last transactions before a power cut.
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE_MB * 1024 * 1024}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_MB * 1024}")   # negative = KiB
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+ 
+ 
+if DB_PERFORMANCE_PROFILE and engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", sqlite_performance_pragmas)
+ 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
  
  
+# ★ NEW – async engine for request handlers, so queries don't block the
+#   event loop that also serves the video WebSockets.  SessionLocal stays
+#   for background threads (detection sink, clip writer, scheduler).
+def _async_url(url: str) -> str:
+    for sync_prefix, async_prefix in (
+        ("sqlite://", "sqlite+aiosqlite://"),
+        ("postgresql://", "postgresql+asyncpg://"),
+        ("postgresql+psycopg2://", "postgresql+asyncpg://"),
+    ):
+        if url.startswith(sync_prefix):
+            return async_prefix + url[len(sync_prefix):]
+    return url
+ 
+ 
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", _async_url(DATABASE_URL))
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    connect_args={"timeout": 30} if ASYNC_DATABASE_URL.startswith("sqlite") else {},
+    pool_pre_ping=True
+)
+if DB_PERFORMANCE_PROFILE and async_engine.dialect.name == "sqlite":
+    event.listen(async_engine.sync_engine, "connect", sqlite_performance_pragmas)
+ 
+# expire_on_commit=False: attributes stay readable after commit without an
+# implicit (and, under asyncio, impossible) lazy reload
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+ 
+ 
 # ──────────────────────────────────────────────────────────────────────────────
 # EXISTING MODELS  (unchanged except Recording – see ★ markers)
 # ──────────────────────────────────────────────────────────────────────────────
@@ -81,8 +138,8 @@ class Camera(Base):
     last_seen = Column(DateTime)
     fps = Column(Float, default=0)
     resolution = Column(String)
-    session_id = Column(String)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    session_id = Column(String, index=True)                    # ★ looked up on every WS connect
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
  
     owner = relationship("User", back_populates="cameras")
@@ -95,6 +152,9 @@ class Camera(Base):
     # ★ NEW: link to smart clip events for this camera
     smart_clip_events = relationship("SmartClipEvent", back_populates="camera",
                                      cascade="all, delete-orphan")
+    # ★ NEW: hourly detection rollups for this camera
+    detection_rollups = relationship("DetectionHourlyRollup", back_populates="camera",
+                                     cascade="all, delete-orphan")
  
  
 class Recording(Base):
@@ -108,6 +168,11 @@ class Recording(Base):
  
     event_classes : JSON list of YOLO class names detected in the clip,
                     e.g. ["person", "car"].  NULL for non-smart recordings.
+
+    event_id      : Id shared by all clips of one detection event.
+ 
+    event_part    : 1, 2, … when an event longer than max_clip_seconds was
+                    split into several clips.
     """
     __tablename__ = "recordings"
     id = Column(Integer, primary_key=True, index=True)
@@ -127,10 +192,18 @@ class Recording(Base):
     # ★ NEW – smart recording metadata
     is_smart_clip = Column(Boolean, default=False, nullable=True)
     event_classes = Column(JSON, nullable=True)  # e.g. ["person", "car"]
+    event_id = Column(String, nullable=True)
+    event_part = Column(Integer, nullable=True)
  
     camera = relationship("Camera", back_populates="recordings")
     user = relationship("User", back_populates="recordings")
  
+    # ★ NEW – recording lists: WHERE user_id [AND is_smart_clip] ORDER BY created_at DESC
+    __table_args__ = (
+        Index("ix_recordings_user_created", "user_id", "created_at"),
+        Index("ix_recordings_user_smart_created", "user_id", "is_smart_clip", "created_at"),
+    )
+ 
  
 class Detection(Base):
     __tablename__ = "detections"
@@ -141,12 +214,24 @@ class Detection(Base):
     bbox_y1 = Column(Float)
     bbox_x2 = Column(Float)
     bbox_y2 = Column(Float)
-    screenshot_path = Column(String)
+    screenshot_path = Column(String)   # legacy one-file-per-crop JPEGs
+    # ★ NEW – location of the crop in the packed crop store (crop_store.py)
+    crop_segment = Column(String, nullable=True)
+    crop_offset = Column(Integer, nullable=True)
+    crop_length = Column(Integer, nullable=True)
     camera_id = Column(Integer, ForeignKey("cameras.id"))
     recording_id = Column(Integer, ForeignKey("recordings.id"), nullable=True)
     detected_at = Column(DateTime, default=datetime.utcnow)
     camera = relationship("Camera", back_populates="detections")
  
+    # ★ NEW – analytics filter by camera + time range (+ class); the
+    #   detection list orders every camera by detected_at
+    __table_args__ = (
+        Index("ix_detections_camera_detected", "camera_id", "detected_at"),
+        Index("ix_detections_camera_class_detected", "camera_id", "class_name", "detected_at"),
+        Index("ix_detections_detected", "detected_at"),
+    )
+ 
  
 class RecordingSchedule(Base):
     __tablename__ = "recording_schedules"
@@ -173,6 +258,12 @@ class Notification(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     user = relationship("User", back_populates="notifications")
  
+    # ★ NEW – notification list (optionally unread only), newest first
+    __table_args__ = (
+        Index("ix_notifications_user_read_created", "user_id", "is_read", "created_at"),
+        Index("ix_notifications_user_created", "user_id", "created_at"),
+    )
+ 
  
 # ──────────────────────────────────────────────────────────────────────────────
 # ★ NEW MODEL: SmartClipEvent
@@ -233,6 +324,73 @@ class SmartClipEvent(Base):
     camera = relationship("Camera", back_populates="smart_clip_events")
  
  
+# ──────────────────────────────────────────────────────────────────────────────
+# ★ NEW MODEL: DetectionHourlyRollup
+# ──────────────────────────────────────────────────────────────────────────────
+ 
+# Thresholds and zone grid shared with the analytics endpoints
+ROLLUP_HIGH_CONFIDENCE = 0.8
+ROLLUP_LOW_CONFIDENCE = 0.3
+ZONE_FRAME_W, ZONE_FRAME_H = 1280, 720      # 3×3 zone grid assumes this frame
+ZONE_COUNT = 9                              # zone index = row * 3 + col
+ 
+ 
+class DetectionHourlyRollup(Base):
+    """
+    Pre-aggregated detections: one row per camera × class × hour (UTC).
+ 
+    Kept up to date by the detection sink in the same transaction as the
+    raw INSERT (see upsert_detection_rollups), so analytics can read a few
+    thousand rollup rows instead of millions of detections.
+    Rebuild from raw data with:  python database.py backfill-rollups
+    """
+    __tablename__ = "detection_rollups_hourly"
+ 
+    camera_id = Column(Integer, ForeignKey("cameras.id"), primary_key=True)
+    class_name = Column(String, primary_key=True)
+    hour_start = Column(DateTime, primary_key=True)   # detected_at truncated to the hour
+ 
+    detection_count = Column(Integer, default=0, nullable=False)
+    confidence_sum = Column(Float, default=0)
+    confidence_max = Column(Float, default=0)
+    high_conf_count = Column(Integer, default=0)      # confidence >= ROLLUP_HIGH_CONFIDENCE
+    low_conf_count = Column(Integer, default=0)       # confidence <  ROLLUP_LOW_CONFIDENCE
+    first_detected_at = Column(DateTime)
+    last_detected_at = Column(DateTime)
+ 
+    # Detections per 3×3 zone (box centre), zone_0 = top-left … zone_8 = bottom-right
+    zone_0 = Column(Integer, default=0)
+    zone_1 = Column(Integer, default=0)
+    zone_2 = Column(Integer, default=0)
+    zone_3 = Column(Integer, default=0)
+    zone_4 = Column(Integer, default=0)
+    zone_5 = Column(Integer, default=0)
+    zone_6 = Column(Integer, default=0)
+    zone_7 = Column(Integer, default=0)
+    zone_8 = Column(Integer, default=0)
+ 
+    camera = relationship("Camera", back_populates="detection_rollups")
+ 
+ 
+# ──────────────────────────────────────────────────────────────────────────────
+# ★ NEW MODEL: StorageUsage
+# ──────────────────────────────────────────────────────────────────────────────
+ 
+class StorageUsage(Base):
+    """
+    Persisted counters of the storage ledger (storage_ledger.py): bytes and
+    file count per storage category (recordings, screenshots, ...) and user.
+    user_id 0 holds bytes that can't be attributed to a user.
+    """
+    __tablename__ = "storage_usage"
+ 
+    category = Column(String, primary_key=True)
+    user_id = Column(Integer, primary_key=True, default=0)
+    bytes = Column(Integer, default=0, nullable=False)
+    files = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+ 
+ 
 # ──────────────────────────────────────────────────────────────────────────────
 # DB UTILITIES  (unchanged)
 # ──────────────────────────────────────────────────────────────────────────────
@@ -247,6 +405,8 @@ def init_db():
     """
     Base.metadata.create_all(bind=engine)
     _sqlite_add_missing_columns()
+    create_missing_indexes()
+    _backfill_rollups_if_empty()
  
  
 def _sqlite_add_missing_columns():
@@ -262,9 +422,13 @@ def _sqlite_add_missing_columns():
         # (table_name, column_name, column_definition)
         ("recordings", "is_smart_clip", "BOOLEAN DEFAULT 0"),
         ("recordings", "event_classes", "JSON"),
+        ("recordings", "event_id", "VARCHAR"),
+        ("recordings", "event_part", "INTEGER"),
+        ("detections", "crop_segment", "VARCHAR"),
+        ("detections", "crop_offset", "INTEGER"),
+        ("detections", "crop_length", "INTEGER"),
     ]
  
-    from sqlalchemy import inspect, text
     inspector = inspect(engine)
     existing_tables = inspector.get_table_names()
  
@@ -284,9 +448,216 @@ def _sqlite_add_missing_columns():
                     print(f"⚠️  Migration warning ({table}.{col}): {e}")
  
  
+def create_missing_indexes(bind=None) -> list:
+    """
+    ★ NEW – create_all() only builds indexes together with new tables, so
+    indexes added to existing models are created here.  Safe on every
+    startup; on a large detections table the first run takes a while.
+    Returns the names of the indexes it built.
+    """
+    bind = bind if bind is not None else engine
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    created = []
+ 
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            print(f"⏳ Migration: building index {index.name}...")
+            try:
+                index.create(bind=bind)
+                created.append(index.name)
+            except Exception as e:
+                print(f"⚠️  Migration warning ({index.name}): {e}")
+ 
+    if created:
+        # Refresh planner statistics so the new indexes get picked up
+        with bind.connect() as conn:
+            conn.execute(text("ANALYZE"))
+            conn.commit()
+        print(f"✅ Migration: built {len(created)} index(es)")
+    return created
+ 
+ 
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+ 
+ 
+async def get_async_db():
+    """★ NEW – FastAPI dependency yielding an AsyncSession."""
+    async with AsyncSessionLocal() as db:
+        yield db
+ 
+# ──────────────────────────────────────────────────────────────────────────────
+# ★ NEW: DETECTION ROLLUP MAINTENANCE
+# ──────────────────────────────────────────────────────────────────────────────
+ 
+def zone_index(x1: float, y1: float, x2: float, y2: float) -> int:
+    """3×3 zone of a box centre (row * 3 + col)."""
+    col = min(int((x1 + x2) / 2 / ZONE_FRAME_W * 3), 2)
+    row = min(int((y1 + y2) / 2 / ZONE_FRAME_H * 3), 2)
+    return row * 3 + col
+ 
+ 
+def zone_index_sql(x1, y1, x2, y2, postgres: bool = False):
+    """SQL twin of zone_index() for non-negative coordinates."""
+    def grid(value, size):
+        scaled = value / size * 3
+        index = cast(func.floor(scaled), Integer) if postgres else cast(scaled, Integer)
+        return case((index > 2, 2), else_=index)
+    return grid((y1 + y2) / 2, ZONE_FRAME_H) * 3 + grid((x1 + x2) / 2, ZONE_FRAME_W)
+ 
+ 
+def _rollup_columns():
+    return DetectionHourlyRollup.__table__.c
+ 
+ 
+def upsert_detection_rollups(db, rows) -> int:
+    """
+    Fold freshly inserted detection rows (dicts with camera_id, class_name,
+    confidence, bbox_*, detected_at) into the hourly rollups.
+    The caller commits, so rollups and raw rows land in one transaction.
+    """
+    groups = {}
+    for r in rows:
+        ts = r["detected_at"]
+        key = (r["camera_id"], r["class_name"], ts.replace(minute=0, second=0, microsecond=0))
+        g = groups.get(key)
+        if g is None:
+            g = groups[key] = {
+                "camera_id": key[0], "class_name": key[1], "hour_start": key[2],
+                "detection_count": 0, "confidence_sum": 0.0, "confidence_max": 0.0,
+                "high_conf_count": 0, "low_conf_count": 0,
+                "first_detected_at": ts, "last_detected_at": ts,
+                **{f"zone_{i}": 0 for i in range(ZONE_COUNT)},
+            }
+        conf = r["confidence"] or 0.0
+        g["detection_count"] += 1
+        g["confidence_sum"] += conf
+        g["confidence_max"] = max(g["confidence_max"], conf)
+        g["high_conf_count"] += conf >= ROLLUP_HIGH_CONFIDENCE
+        g["low_conf_count"] += conf < ROLLUP_LOW_CONFIDENCE
+        g["first_detected_at"] = min(g["first_detected_at"], ts)
+        g["last_detected_at"] = max(g["last_detected_at"], ts)
+        g[f"zone_{zone_index(r['bbox_x1'], r['bbox_y1'], r['bbox_x2'], r['bbox_y2'])}"] += 1
+ 
+    if not groups:
+        return 0
+ 
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        greatest, least = func.max, func.min
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        greatest, least = func.greatest, func.least
+    else:
+        # No portable upsert: merge row by row
+        for g in groups.values():
+            existing = db.get(DetectionHourlyRollup, (g["camera_id"], g["class_name"], g["hour_start"]))
+            if existing is None:
+                db.add(DetectionHourlyRollup(**g))
+                continue
+            for name in ["detection_count", "confidence_sum", "high_conf_count", "low_conf_count",
+                         *(f"zone_{i}" for i in range(ZONE_COUNT))]:
+                setattr(existing, name, (getattr(existing, name) or 0) + g[name])
+            existing.confidence_max = max(existing.confidence_max or 0.0, g["confidence_max"])
+            existing.first_detected_at = min(existing.first_detected_at, g["first_detected_at"])
+            existing.last_detected_at = max(existing.last_detected_at, g["last_detected_at"])
+        return len(groups)
+ 
+    c = _rollup_columns()
+    stmt = dialect_insert(DetectionHourlyRollup).values(list(groups.values()))
+    new = stmt.excluded
+    additive = ["detection_count", "confidence_sum", "high_conf_count", "low_conf_count",
+                *(f"zone_{i}" for i in range(ZONE_COUNT))]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[c.camera_id, c.class_name, c.hour_start],
+        set_={
+            **{name: c[name] + new[name] for name in additive},
+            "confidence_max": greatest(c.confidence_max, new.confidence_max),
+            "first_detected_at": least(c.first_detected_at, new.first_detected_at),
+            "last_detected_at": greatest(c.last_detected_at, new.last_detected_at),
+        },
+    )
+    db.execute(stmt)
+    return len(groups)
+ 
+ 
+def rebuild_detection_rollups(db) -> int:
+    """
+    Recompute every rollup row from the raw detections table in one
+    INSERT … SELECT.  Returns the number of rollup rows written.
+    """
+    postgres = db.get_bind().dialect.name == "postgresql"
+    ts = Detection.detected_at
+    # Same text format SQLAlchemy uses for SQLite DateTime, so keys compare equal
+    hour = func.date_trunc("hour", ts) if postgres \
+        else func.strftime("%Y-%m-%d %H:00:00.000000", ts)
+    zone = zone_index_sql(Detection.bbox_x1, Detection.bbox_y1,
+                          Detection.bbox_x2, Detection.bbox_y2, postgres)
+    conf = func.coalesce(Detection.confidence, 0.0)
+ 
+    aggregate = select(
+        Detection.camera_id,
+        func.coalesce(Detection.class_name, "unknown"),
+        hour,
+        func.count(),
+        func.sum(conf),
+        func.max(conf),
+        func.sum(case((conf >= ROLLUP_HIGH_CONFIDENCE, 1), else_=0)),
+        func.sum(case((conf < ROLLUP_LOW_CONFIDENCE, 1), else_=0)),
+        func.min(ts),
+        func.max(ts),
+        *(func.sum(case((zone == i, 1), else_=0)) for i in range(ZONE_COUNT)),
+    ).where(Detection.camera_id.isnot(None)).group_by(
+        Detection.camera_id, func.coalesce(Detection.class_name, "unknown"), hour
+    )
+ 
+    c = _rollup_columns()
+    db.query(DetectionHourlyRollup).delete()
+    db.execute(insert(DetectionHourlyRollup).from_select(
+        [c.camera_id, c.class_name, c.hour_start, c.detection_count,
+         c.confidence_sum, c.confidence_max, c.high_conf_count, c.low_conf_count,
+         c.first_detected_at, c.last_detected_at,
+         *(c[f"zone_{i}"] for i in range(ZONE_COUNT))],
+        aggregate,
+    ))
+    db.commit()
+    return db.query(DetectionHourlyRollup).count()
+ 
+ 
+def _backfill_rollups_if_empty():
+    """Build the rollups once for databases that predate them."""
+    db = SessionLocal()
+    try:
+        if db.query(DetectionHourlyRollup).first() is None and db.query(Detection).first() is not None:
+            print("⏳ Backfilling detection rollups...")
+            print(f"✅ Detection rollups built ({rebuild_detection_rollups(db)} rows)")
+    except Exception as e:
+        db.rollback()
+        print(f"⚠️  Rollup backfill failed: {e}")
+    finally:
+        db.close()
+
+ 
+if __name__ == "__main__":
+    import sys
+ 
+    if sys.argv[1:] == ["backfill-rollups"]:
+        Base.metadata.create_all(bind=engine)
+        session = SessionLocal()
+        try:
+            print(f"✅ Detection rollups rebuilt ({rebuild_detection_rollups(session)} rows)")
+        finally:
+            session.close()
+    else:
+        print("Usage: python database.py backfill-rollups")
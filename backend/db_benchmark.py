@@ -0,0 +1,196 @@
+"""
+DB Benchmark - Query times with and without the database performance profile
+
+Seeds a throwaway SQLite database (5M detections by default), times the
+query shapes the API runs with the pre-profile schema and default pragmas,
+then builds the profile indexes (create_missing_indexes), turns on the
+profile pragmas and times the same queries again.
+
+    python db_benchmark.py [--rows 5000000] [--cameras 8] [--days 90]
+                           [--repeat 5] [--db benchmark.db] [--keep] [--reuse]
+
+Seeding 5M rows takes a minute or two; use --keep and --reuse to rerun
+the timings against an existing file.
+"""
+
+import argparse
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from analytics_queries import build_advanced_analytics
+from database import (Base, Camera, Detection, Notification, Recording,
+                      create_missing_indexes, sqlite_performance_pragmas)
+
+CLASSES = ["person", "car", "bicycle", "motorcycle", "dog", "cat", "truck", "bus"]
+
+
+def profile_indexes():
+    """Indexes added by the performance profile (everything but id / email)."""
+    return [
+        index
+        for table in Base.metadata.sorted_tables
+        for index in table.indexes
+        if [c.name for c in index.columns] != ["id"] and index.name != "ix_users_email"
+    ]
+
+
+def seed(engine, rows: int, cameras: int, days: int):
+    Base.metadata.create_all(bind=engine)
+    for index in profile_indexes():
+        index.drop(bind=engine, checkfirst=True)
+
+    start = datetime.utcnow() - timedelta(days=days)
+    step = days * 86400 / max(rows, 1)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO users (id, email, hashed_password, is_active) "
+            "VALUES (1, 'bench@example.com', 'x', 1), (2, 'other@example.com', 'x', 1)"
+        ))
+        for i in range(1, cameras + 1):
+            conn.execute(text(
+                "INSERT INTO cameras (id, name, connection_url, status, session_id, user_id) "
+                "VALUES (:id, :name, :url, 'connected', :sid, :uid)"
+            ), {"id": i, "name": f"Camera {i}", "url": str(i), "sid": f"session-{i}", "uid": 1 + i % 2})
+
+        print(f"⏳ Seeding {rows:,} detections...")
+        started = time.perf_counter()
+        conn.execute(text(f"""
+            WITH RECURSIVE seq(x) AS (SELECT 0 UNION ALL SELECT x + 1 FROM seq WHERE x < :n - 1)
+            INSERT INTO detections (class_name, confidence, bbox_x1, bbox_y1, bbox_x2, bbox_y2,
+                                    camera_id, detected_at)
+            SELECT
+                CASE abs(random()) % {len(CLASSES)}
+                    {" ".join(f"WHEN {i} THEN '{c}'" for i, c in enumerate(CLASSES))}
+                END,
+                0.25 + (abs(random()) % 75) / 100.0,
+                abs(random()) % 1100, abs(random()) % 600,
+                100 + abs(random()) % 1180, 100 + abs(random()) % 620,
+                1 + abs(random()) % :cameras,
+                strftime('%Y-%m-%d %H:%M:%S', :start, '+' || CAST(x * :step AS INTEGER) || ' seconds')
+                    || '.000000'
+            FROM seq
+        """), {"n": rows, "cameras": cameras, "start": start.strftime("%Y-%m-%d %H:%M:%S"), "step": step})
+
+        extra = max(1000, rows // 100)
+        for table, columns, values in [
+            ("recordings", "filename, camera_id, user_id, is_smart_clip, created_at",
+             "'clip_' || x || '.mp4', 1 + x % :cameras, 1 + x % 2, x % 3 = 0"),
+            ("notifications", "user_id, title, message, type, is_read, created_at",
+             "1 + x % 2, 'Detection', 'bench', 'info', x % 5 != 0"),
+        ]:
+            conn.execute(text(f"""
+                WITH RECURSIVE seq(x) AS (SELECT 0 UNION ALL SELECT x + 1 FROM seq WHERE x < :n - 1)
+                INSERT INTO {table} ({columns})
+                SELECT {values},
+                       strftime('%Y-%m-%d %H:%M:%S', :start, '+' || (x * 60) || ' seconds') || '.000000'
+                FROM seq
+            """), {"n": extra, "cameras": cameras, "start": start.strftime("%Y-%m-%d %H:%M:%S")})
+        print(f"✅ Seeded in {time.perf_counter() - started:.1f}s")
+
+
+def queries():
+    """(label, fn(session)) pairs mirroring the query shapes in app.py."""
+    now = datetime.utcnow()
+    # Not hour-aligned, so analytics read the raw detections table
+    day_ago = now - timedelta(hours=24, minutes=7)
+    week_ago = now - timedelta(days=7)
+
+    return [
+        ("camera by session_id", lambda db: db.query(Camera).filter(
+            Camera.session_id == "session-3", Camera.user_id == 2).first()),
+        ("recording list", lambda db: db.query(Recording).filter(
+            Recording.user_id == 1).order_by(Recording.created_at.desc()).all()),
+        ("smart clip list", lambda db: db.query(Recording).filter(
+            Recording.user_id == 1, Recording.is_smart_clip == True
+        ).order_by(Recording.created_at.desc()).all()),
+        ("unread notifications", lambda db: db.query(Notification).filter(
+            Notification.user_id == 1, Notification.is_read == False
+        ).order_by(Notification.created_at.desc()).limit(50).all()),
+        ("detection list (100 newest)", lambda db: db.query(Detection).join(Camera).filter(
+            Camera.user_id == 1).order_by(Detection.detected_at.desc()).limit(100).all()),
+        ("camera, last 7 days", lambda db: db.query(Detection).filter(
+            Detection.camera_id == 2, Detection.detected_at >= week_ago).count()),
+        ("camera + class, last 7 days", lambda db: db.query(Detection).filter(
+            Detection.camera_id == 2, Detection.class_name == "person",
+            Detection.detected_at >= week_ago).count()),
+        ("advanced analytics, last 24h (raw)", lambda db: build_advanced_analytics(
+            db, 1, day_ago, None, None, None)),
+        ("advanced analytics, 1 camera, 24h (raw)", lambda db: build_advanced_analytics(
+            db, 1, day_ago, None, ["person", "car"], [2])),
+    ]
+
+
+def run(engine, repeat: int) -> dict:
+    Session = sessionmaker(bind=engine)
+    timings = {}
+    for label, fn in queries():
+        samples = []
+        for _ in range(repeat):
+            db = Session()
+            try:
+                started = time.perf_counter()
+                fn(db)
+                samples.append(time.perf_counter() - started)
+            finally:
+                db.close()
+        timings[label] = statistics.median(samples)
+        print(f"   {label:<42} {timings[label] * 1000:10.1f} ms")
+    return timings
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--cameras", type=int, default=8)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--db", default="benchmark.db")
+    parser.add_argument("--keep", action="store_true", help="Keep the database file afterwards")
+    parser.add_argument("--reuse", action="store_true", help="Reuse an existing seeded file")
+    args = parser.parse_args()
+
+    url = f"sqlite:///{args.db}"
+    if not args.reuse:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+        seed(create_engine(url), args.rows, args.cameras, args.days)
+    else:
+        baseline = create_engine(url)
+        with baseline.begin() as conn:
+            conn.execute(text("PRAGMA journal_mode=DELETE"))
+        for index in profile_indexes():
+            index.drop(bind=baseline, checkfirst=True)
+
+    print("\nBefore (no profile indexes, default pragmas):")
+    before = run(create_engine(url), args.repeat)
+
+    tuned = create_engine(url)
+    event.listen(tuned, "connect", sqlite_performance_pragmas)
+    started = time.perf_counter()
+    built = create_missing_indexes(bind=tuned)
+    print(f"\nBuilt {len(built)} indexes in {time.perf_counter() - started:.1f}s")
+
+    print("\nAfter (profile indexes, WAL / synchronous=NORMAL / mmap / cache_size):")
+    after = run(tuned, args.repeat)
+
+    print(f"\n{'query':<42} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    for label in before:
+        speedup = before[label] / after[label] if after[label] else float("inf")
+        print(f"{label:<42} {before[label] * 1000:10.1f} {after[label] * 1000:10.1f} {speedup:7.1f}x")
+
+    tuned.dispose()
+    if not args.keep:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,186 @@
+"""
+Detection Scheduler - Cross-camera batched YOLO inference
+
+Every live session submits frames here instead of calling the detector
+directly.  A single worker thread collects pending frames for up to
+max_wait_ms (or until max_batch_size frames are waiting), runs one batched
+model call, and resolves each caller's future with its own detections.
+
+Batching amortises the per-call framework overhead on CPU, so total
+detections/sec grows with the number of live cameras instead of staying flat.
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+import numpy as np
+
+from yolo_detector import yolo_detector
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _DetectionRequest:
+    frame: np.ndarray
+    confidence: float
+    future: Future = field(default_factory=Future)
+    submitted: float = field(default_factory=time.perf_counter)
+
+
+class BatchDetectionScheduler:
+    def __init__(self, detector, max_batch_size: int = 8, max_wait_ms: float = 15.0):
+        """
+        Args:
+            detector:       YOLODetector (needs detect_arrays_batch())
+            max_batch_size: Upper bound on frames per model call
+            max_wait_ms:    How long the first frame of a batch may wait for company
+        """
+        self.detector = detector
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+
+        self._queue: "queue.Queue[_DetectionRequest]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = threading.Thread(
+            target=self._run, name="detection_scheduler", daemon=True
+        )
+
+        # Statistics
+        self.batches = 0
+        self.frames = 0
+        self.failed = 0
+        self.active = 0
+        self.total_run_seconds = 0.0
+        self.total_latency_seconds = 0.0
+        self.last_batch_size = 0
+        self.last_run_seconds = 0.0
+
+        self._worker.start()
+        logger.info(
+            f"Detection scheduler started "
+            f"(max_batch={self.max_batch_size}, max_wait={max_wait_ms}ms)"
+        )
+
+    # ── Public API ────────────────────────────────────────────────────────
+
+    def submit(self, frame: np.ndarray, confidence: float = 0.5) -> Future:
+        """Queue a frame; the returned future resolves to its detection list."""
+        request = _DetectionRequest(frame=frame, confidence=confidence)
+        self._queue.put(request)
+        return request.future
+
+    async def detect(self, frame: np.ndarray, confidence: float = 0.5) -> List[Dict]:
+        """Awaitable form of submit() for use inside coroutines."""
+        return await asyncio.wrap_future(self.submit(frame, confidence))
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "active": self.active,
+                "batches": self.batches,
+                "frames": self.frames,
+                "failed": self.failed,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": round(self.max_wait * 1000, 2),
+                "avg_batch_size": round(self.frames / self.batches, 2) if self.batches else 0.0,
+                "last_batch_size": self.last_batch_size,
+                "avg_run_ms": round(self.total_run_seconds / self.batches * 1000, 2) if self.batches else 0.0,
+                "last_run_ms": round(self.last_run_seconds * 1000, 2),
+                "avg_latency_ms": round(self.total_latency_seconds / self.frames * 1000, 2) if self.frames else 0.0,
+            }
+
+    # ── Worker ────────────────────────────────────────────────────────────
+
+    def _collect_batch(self) -> List[_DetectionRequest]:
+        """Block for the first request, then gather more until full or timed out."""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        # Callers that gave up (cancelled futures) don't need inference
+        return [r for r in batch if r.future.set_running_or_notify_cancel()]
+
+    def _run(self):
+        while True:
+            batch: List[_DetectionRequest] = []
+            try:
+                batch = self._collect_batch()
+                if batch:
+                    self._run_batch(batch)
+            except Exception as e:
+                # The worker must survive: callers awaiting detect() would hang
+                logger.error(f"Detection scheduler error: {e}")
+                for request in batch:
+                    _resolve(request.future, [])
+                with self._lock:
+                    self.active = 0
+
+    def _run_batch(self, batch: List[_DetectionRequest]):
+        with self._lock:
+            self.active = len(batch)
+
+        started = time.perf_counter()
+        # One model call at the loosest threshold, then filter per caller
+        min_conf = min(r.confidence for r in batch)
+        try:
+            results = self.detector.detect_arrays_batch([r.frame for r in batch], min_conf)
+            if len(results) != len(batch):
+                raise ValueError(f"{len(results)} results for {len(batch)} frames")
+        except Exception as e:
+            logger.error(f"Batched detection error: {e}")
+            results = None
+        elapsed = time.perf_counter() - started
+        finished = time.perf_counter()
+
+        failed = 0
+        for i, request in enumerate(batch):
+            detections = []
+            if results is not None:
+                try:
+                    detections = results[i].filter(request.confidence).to_dicts(self.detector.target_classes)
+                except Exception as e:
+                    logger.error(f"Detection result error: {e}")
+                    failed += 1
+            _resolve(request.future, detections)
+
+        with self._lock:
+            self.active = 0
+            self.batches += 1
+            self.frames += len(batch)
+            self.failed += len(batch) if results is None else failed
+            self.last_batch_size = len(batch)
+            self.last_run_seconds = elapsed
+            self.total_run_seconds += elapsed
+            self.total_latency_seconds += sum(finished - r.submitted for r in batch)
+
+
+def _resolve(future: Future, detections: List[Dict]):
+    """Complete a caller's future unless that already happened."""
+    if not future.done():
+        future.set_result(detections)
+
+# Global instance
+detection_scheduler = BatchDetectionScheduler(
+    yolo_detector,
+    max_batch_size=int(os.getenv("DETECTION_MAX_BATCH", 8)),
+    max_wait_ms=float(os.getenv("DETECTION_MAX_WAIT_MS", 15)),
+)
@@ -0,0 +1,339 @@
+"""
+Detection Sink - Queued, batched persistence of YOLO detections
+
+Video hubs hand every fresh detection list to detection_sink.submit(),
+which never blocks: crops are encoded on a small thread pool and appended
+to the packed crop store (crop_store.py), and the rows go into a bounded
+queue.  A single writer thread drains the queue and flushes when
+batch_size rows are waiting or flush_interval seconds have passed, with
+one bulk INSERT per flush (plus one upsert into the hourly rollup table).
+
+When the queue is full new detections are dropped (and counted) rather
+than stalling the video pipeline.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import insert
+
+from crop_store import CropRef, crop_store
+from database import Camera, Detection, upsert_detection_rollups
+from yolo_detector import yolo_detector
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _PendingDetection:
+    camera_id: int
+    detection: Dict
+    detected_at: datetime
+    crop: Optional[Future] = None
+
+
+class DetectionSink:
+    def __init__(
+        self,
+        db_session_factory=None,
+        max_queue: int = 5000,
+        batch_size: int = 200,
+        flush_interval: float = 1.0,
+        crop_workers: int = 2,
+        max_pending_crops: int = 256,
+    ):
+        """
+        Args:
+            db_session_factory: Callable → SQLAlchemy Session (SessionLocal)
+            max_queue:          Rows allowed to wait before new ones are dropped
+            batch_size:         Flush as soon as this many rows are waiting
+            flush_interval:     Flush at least this often (seconds) when rows wait
+            crop_workers:       Threads encoding and appending crops
+            max_pending_crops:  Crops allowed in flight; beyond this rows are saved without one
+        """
+        self._db_factory = db_session_factory
+        self._on_commit = None
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_pending_crops = max_pending_crops
+
+        self._queue: "queue.Queue[_PendingDetection]" = queue.Queue(maxsize=max_queue)
+        self._crop_pool = ThreadPoolExecutor(
+            max_workers=max(1, crop_workers), thread_name_prefix="detection_crop"
+        )
+        self._lock = threading.Lock()
+        self._camera_owners: Dict[int, Optional[int]] = {}
+        self._stop = threading.Event()
+        self._writer = threading.Thread(
+            target=self._run, name="detection_sink", daemon=True
+        )
+
+        # Statistics
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.flushes = 0
+        self.pending_crops = 0
+        self.crops_written = 0
+        self.crops_failed = 0
+        self.crops_skipped = 0
+        self.crops_orphaned = 0
+        self.total_flush_seconds = 0.0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.last_batch_size = 0
+
+        self._writer.start()
+
+    def set_db_factory(self, factory):
+        """Inject the database session factory (called from app.py startup)."""
+        self._db_factory = factory
+
+    def set_commit_handler(self, handler):
+        """
+        Register handler(camera_ids) called from the writer thread after each
+        successful flush, e.g. to invalidate cached analytics.
+        """
+        self._on_commit = handler
+
+    # ── Public API ────────────────────────────────────────────────────────
+
+    def submit(self, camera_id: int, detections: List[Dict], frame: np.ndarray) -> int:
+        """
+        Queue detections from one frame for persistence.  Safe to call from
+        the event loop.  Returns how many were accepted.
+        """
+        detected_at = datetime.utcnow()
+        accepted = 0
+        for det in detections:
+            item = _PendingDetection(camera_id, det, detected_at, self._submit_crop(frame, det, camera_id))
+            try:
+                self._queue.put_nowait(item)
+                accepted += 1
+            except queue.Full:
+                if item.crop is not None and not item.crop.cancel():
+                    # Already encoding: the record lands in the store with no row
+                    item.crop.add_done_callback(lambda f: self._dropped_crop(camera_id, f))
+                with self._lock:
+                    self.dropped += 1
+
+        with self._lock:
+            self.enqueued += accepted
+        if accepted < len(detections):
+            logger.warning(
+                f"Detection sink full, dropped {len(detections) - accepted} "
+                f"detections for camera {camera_id}"
+            )
+        return accepted
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "enqueued": self.enqueued,
+                "dropped": self.dropped,
+                "written": self.written,
+                "failed": self.failed,
+                "flushes": self.flushes,
+                "last_batch_size": self.last_batch_size,
+                "avg_flush_ms": round(self.total_flush_seconds / self.flushes * 1000, 2) if self.flushes else 0.0,
+                "last_flush_ms": round(self.last_flush_seconds * 1000, 2),
+                "max_flush_ms": round(self.max_flush_seconds * 1000, 2),
+                "pending_crops": self.pending_crops,
+                "crops_written": self.crops_written,
+                "crops_failed": self.crops_failed,
+                "crops_skipped": self.crops_skipped,
+                "crops_orphaned": self.crops_orphaned,
+            }
+
+    def stop(self, timeout: float = 5.0):
+        """Flush whatever is queued and stop the writer thread."""
+        self._stop.set()
+        self._writer.join(timeout)
+        self._crop_pool.shutdown(wait=False, cancel_futures=True)
+
+    # ── Crops ─────────────────────────────────────────────────────────────
+
+    def _submit_crop(self, frame: np.ndarray, det: Dict, camera_id: int) -> Optional[Future]:
+        with self._lock:
+            if self.pending_crops >= self.max_pending_crops:
+                self.crops_skipped += 1
+                return None
+            self.pending_crops += 1
+
+        future = self._crop_pool.submit(self._save_crop, frame, det, camera_id)
+        future.add_done_callback(self._crop_done)
+        return future
+
+    def _save_crop(self, frame: np.ndarray, det: Dict, camera_id: int) -> CropRef:
+        return crop_store.append(yolo_detector.encode_crop(frame, det),
+                                 user_id=self._camera_owner(camera_id))
+
+    def _camera_owner(self, camera_id: int) -> Optional[int]:
+        """Owner of a camera, for per-user storage accounting (cached)."""
+        if camera_id in self._camera_owners or self._db_factory is None:
+            return self._camera_owners.get(camera_id)
+        db = self._db_factory()
+        try:
+            owner = db.query(Camera.user_id).filter(Camera.id == camera_id).scalar()
+        except Exception as e:
+            logger.warning(f"Could not look up owner of camera {camera_id}: {e}")
+            return None
+        finally:
+            db.close()
+        self._camera_owners[camera_id] = owner
+        return owner
+
+    def _crop_done(self, future: Future):
+        with self._lock:
+            self.pending_crops -= 1
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                self.crops_failed += 1
+            else:
+                self.crops_written += 1
+
+    @staticmethod
+    def _crop_ref(item: _PendingDetection) -> Optional[CropRef]:
+        if item.crop is None:
+            return None
+        try:
+            # No timeout: a crop that lands after its row is written would be
+            # an orphan. The pool is bounded by max_pending_crops.
+            return item.crop.result()
+        except Exception as e:
+            logger.warning(f"Failed to save detection crop: {e}")
+            return None
+
+    def _dropped_crop(self, camera_id: int, future: Future):
+        """Done callback of a crop whose row was dropped before it finished."""
+        if not future.cancelled() and future.exception() is None:
+            self._orphan_crops(camera_id, [future.result()], "queue full")
+
+    def _orphan_crops(self, camera_id: int, refs: List[CropRef], reason: str):
+        """Log crops that have no Detection row and hand their bytes back to the store."""
+        if not refs:
+            return
+        logger.error(
+            f"Detection sink: {len(refs)} crops of camera {camera_id} have no row ({reason}): "
+            + ", ".join(f"{r.segment}@{r.offset}+{r.length}" for r in refs)
+        )
+        crop_store.disown(refs, self._camera_owner(camera_id))
+        with self._lock:
+            self.crops_orphaned += len(refs)
+
+    # ── Writer ────────────────────────────────────────────────────────────
+
+    def _collect_batch(self) -> List[_PendingDetection]:
+        """Wait for the first row, then gather more until full or timed out."""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop.is_set():
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch: List[_PendingDetection]):
+        started = time.perf_counter()
+        rows = []
+        for item in batch:
+            det = item.detection
+            bbox = det.get("bbox", {})
+            crop = self._crop_ref(item)
+            rows.append({
+                "camera_id": item.camera_id,
+                "class_name": det.get("class_name", "unknown"),
+                "confidence": det.get("confidence", 0.0),
+                "bbox_x1": bbox.get("x1", 0),
+                "bbox_y1": bbox.get("y1", 0),
+                "bbox_x2": bbox.get("x2", 0),
+                "bbox_y2": bbox.get("y2", 0),
+                "crop_segment": crop.segment if crop else None,
+                "crop_offset": crop.offset if crop else None,
+                "crop_length": crop.length if crop else None,
+                "detected_at": item.detected_at,
+            })
+
+        ok = False
+        if self._db_factory is None:
+            logger.error("Detection sink has no DB factory; dropping batch")
+        else:
+            db = self._db_factory()
+            try:
+                db.execute(insert(Detection), rows)
+                # Hourly rollups move in the same transaction as the raw rows
+                upsert_detection_rollups(db, rows)
+                db.commit()
+                ok = True
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Error committing detections: {e}")
+            finally:
+                db.close()
+
+        if not ok:
+            by_camera: Dict[int, List[CropRef]] = {}
+            for row in rows:
+                if row["crop_segment"] is not None:
+                    by_camera.setdefault(row["camera_id"], []).append(
+                        CropRef(row["crop_segment"], row["crop_offset"], row["crop_length"])
+                    )
+            for camera_id, refs in by_camera.items():
+                self._orphan_crops(camera_id, refs, "batch not committed")
+
+        if ok and self._on_commit is not None:
+            try:
+                self._on_commit({row["camera_id"] for row in rows})
+            except Exception as e:
+                logger.error(f"Detection commit handler failed: {e}")
+
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.flushes += 1
+            self.last_batch_size = len(rows)
+            if ok:
+                self.written += len(rows)
+            else:
+                self.failed += len(rows)
+            self.last_flush_seconds = elapsed
+            self.total_flush_seconds += elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+
+        logger.debug(f"Detection sink flushed {len(rows)} rows in {elapsed * 1000:.1f}ms")
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._collect_batch()
+            if batch:
+                self._flush(batch)
+
+
+# Global instance
+# Call detection_sink.set_db_factory(SessionLocal) in app.py startup.
+detection_sink = DetectionSink(
+    max_queue=int(os.getenv("DETECTION_SINK_MAX_QUEUE", 5000)),
+    batch_size=int(os.getenv("DETECTION_SINK_BATCH_SIZE", 200)),
+    flush_interval=float(os.getenv("DETECTION_SINK_FLUSH_SECONDS", 1.0)),
+    crop_workers=int(os.getenv("DETECTION_SINK_CROP_WORKERS", 2)),
+)
@@ -0,0 +1,85 @@
+"""
+Frame Packet - A decoded frame plus memoized JPEG encodings
+
+One frame goes through several consumers that each want a JPEG of it:
+the stream to the viewers, the smart-recording pre-event buffer,
+screenshots.  A FramePacket encodes at most once per (quality, size)
+and hands every consumer the same buffer as a memoryview, so matching
+parameters share one encode and nothing is copied into new bytes objects.
+
+The packet owns its frame: don't modify `frame` after the first encode
+(derive a new packet from a copy instead, e.g. for drawn boxes).
+"""
+
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+EncodingKey = Tuple[int, Optional[Tuple[int, int]]]   # (quality, (width, height) or None)
+
+
+class FramePacket:
+    def __init__(self, frame: np.ndarray, timestamp: Optional[float] = None):
+        self.frame = frame
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self._encodings: Dict[EncodingKey, memoryview] = {}
+        self._lock = threading.Lock()
+
+    def jpeg(self, quality: int, size: Optional[Tuple[int, int]] = None) -> memoryview:
+        """
+        JPEG of the frame at `quality`, resized to `size` (width, height) if
+        given.  Encoded on first request, then shared.  Thread-safe.
+        """
+        key = (int(quality), tuple(size) if size else None)
+        with self._lock:
+            encoded = self._encodings.get(key)
+            if encoded is not None:
+                _count(reused=1)
+                return encoded
+
+            image = self.frame
+            if size and (image.shape[1], image.shape[0]) != key[1]:
+                image = cv2.resize(image, key[1], interpolation=cv2.INTER_AREA)
+            ok, buf = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, key[0]])
+            if not ok:
+                raise ValueError(f"JPEG encoding failed (quality={quality}, size={size})")
+
+            encoded = memoryview(buf.reshape(-1))
+            self._encodings[key] = encoded
+            _count(encoded=1, encoded_bytes=encoded.nbytes)
+            return encoded
+
+    def cached_jpeg(self, quality: int, size: Optional[Tuple[int, int]] = None) -> Optional[memoryview]:
+        """The encoding if it already exists, without encoding."""
+        with self._lock:
+            return self._encodings.get((int(quality), tuple(size) if size else None))
+
+    @property
+    def encodings(self) -> int:
+        return len(self._encodings)
+
+
+# ── Process-wide counters (reported under /health) ───────────────────────
+
+_stats_lock = threading.Lock()
+_stats = {"encoded": 0, "reused": 0, "encoded_bytes": 0}
+
+
+def _count(**deltas):
+    with _stats_lock:
+        for name, delta in deltas.items():
+            _stats[name] += delta
+
+
+def get_stats() -> dict:
+    with _stats_lock:
+        requests = _stats["encoded"] + _stats["reused"]
+        return {
+            "encodes": _stats["encoded"],
+            "reuses": _stats["reused"],
+            "reuse_ratio": round(_stats["reused"] / requests, 3) if requests else 0.0,
+            "encoded_mb": round(_stats["encoded_bytes"] / 1_048_576, 1),
+        }
@@ -0,0 +1,281 @@
+"""
+Frame Ring - Memory-mapped on-disk ring of JPEG frames
+
+Backing store for a smart-recording pre-event buffer: one fixed-size file
+per camera, mapped into memory, so a long pre-roll costs disk and page
+cache instead of Python heap, and survives a restart of the server.
+
+File layout:
+    header   64 bytes   magic b"FRG1", version, data size, slot count,
+                        next sequence number, oldest live sequence number,
+                        logical write position
+    slots    n × 32     NumPy structured array, one entry per frame:
+                        (seq, offset, length, flags, timestamp)
+    data     data_size  JPEG bytes, written round-robin
+
+Offsets are logical (they keep growing; physical = offset % data_size) and
+a record never straddles the end of the data area.  A frame is valid while
+its slot still carries its sequence number and the write position has not
+advanced more than data_size past it.  Readers get zero-copy views of the
+mapping; since the ring may overwrite a view at any time they check
+is_current() before and after using it (the write position is moved
+before the bytes are copied in).
+"""
+
+import logging
+import mmap
+import os
+import struct
+import threading
+from typing import Iterator, NamedTuple, Set
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RING_MAGIC = b"FRG1"
+RING_VERSION = 1
+HEADER = struct.Struct("<4sIQIQQQ")     # magic, version, data_size, slots, next_seq, tail_seq, write_end
+HEADER_SIZE = 64
+
+SLOT_DTYPE = np.dtype([
+    ("seq", "<u8"),
+    ("offset", "<u8"),
+    ("length", "<u4"),
+    ("flags", "u1"),
+    ("_pad", "V3"),
+    ("timestamp", "<f8"),
+])
+FLAG_DETECTIONS = 1
+
+# Ring files currently open in this process (one buffer per file)
+_open_paths: Set[str] = set()
+_open_paths_lock = threading.Lock()
+
+
+class RingEntry(NamedTuple):
+    seq: int
+    data: memoryview
+    timestamp: float
+    has_detections: bool
+
+
+class RingInUse(RuntimeError):
+    """The ring file is already open for another buffer."""
+
+
+class FrameRing:
+    def __init__(self, path: str, data_size: int, slots: int):
+        """
+        Open (or create) the ring file at `path`.  An existing file with the
+        same geometry keeps its frames; otherwise it is re-initialised.
+
+        Args:
+            path:       Ring file, one per camera
+            data_size:  Bytes reserved for JPEG data
+            slots:      Frames the index can hold (window plus headroom for
+                        frames still being read)
+        """
+        self.path = os.path.abspath(path)
+        self.data_size = int(data_size)
+        self.slots = max(1, int(slots))
+        self._data_start = HEADER_SIZE + self.slots * SLOT_DTYPE.itemsize
+        self._lock = threading.Lock()
+
+        with _open_paths_lock:
+            if self.path in _open_paths:
+                raise RingInUse(self.path)
+            _open_paths.add(self.path)
+
+        try:
+            self._open()
+        except Exception:
+            with _open_paths_lock:
+                _open_paths.discard(self.path)
+            raise
+
+        # Statistics
+        self.appended = 0
+        self.stale_reads = 0
+        self.data_evictions = 0     # frames overwritten because the data area was full
+        self._warned_small = False
+        self._closed = False
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        total = self._data_start + self.data_size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+        try:
+            sized = os.fstat(fd).st_size == total
+            if not sized:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, total)     # sparse: blocks are allocated as frames land
+            self._mm = mmap.mmap(fd, total)
+        finally:
+            os.close(fd)
+
+        # Header read from the mapping (no os.pread, which Windows lacks)
+        magic, version, data_size, slots, *_ = HEADER.unpack_from(self._mm, 0)
+        reuse = sized and (magic, version, data_size, slots) == (RING_MAGIC, RING_VERSION, self.data_size, self.slots)
+        if not reuse and sized:
+            self._mm[:self._data_start] = bytes(self._data_start)   # stale index from another geometry
+
+        self._view = memoryview(self._mm)
+        self._slots = np.ndarray((self.slots,), dtype=SLOT_DTYPE, buffer=self._mm, offset=HEADER_SIZE)
+        if reuse:
+            _, _, _, _, self._next_seq, self._tail_seq, self._write_end = HEADER.unpack_from(self._mm, 0)
+            logger.info(f"Frame ring: reopened {self.path} ({len(self)} frames kept)")
+        else:
+            self._next_seq = self._tail_seq = 1     # seq 0 marks an empty slot
+            self._write_end = 0
+            self._write_header()
+            logger.info(
+                f"Frame ring: created {self.path} "
+                f"({self.data_size / 1_048_576:.0f}MB, {self.slots} slots)"
+            )
+
+    # ── Writing ───────────────────────────────────────────────────────────
+
+    def append(self, data, timestamp: float, has_detections: bool = False) -> RingEntry:
+        """Copy one JPEG into the ring, overwriting the oldest frames as needed."""
+        length = len(data)
+        if length > self.data_size:
+            raise ValueError(f"frame of {length} bytes does not fit a {self.data_size}-byte ring")
+
+        with self._lock:
+            offset = self._write_end
+            physical = offset % self.data_size
+            if physical + length > self.data_size:
+                offset += self.data_size - physical     # wrap: records never straddle the end
+                physical = 0
+
+            # Publish the new write position first, so readers of the bytes
+            # about to be overwritten see that they are stale
+            self._write_end = offset + length
+            seq = self._next_seq
+            self._next_seq += 1
+            slot = self._slots[seq % self.slots]
+            slot["seq"] = 0
+            start = self._data_start + physical
+            self._view[start:start + length] = data
+            slot["offset"] = offset
+            slot["length"] = length
+            slot["flags"] = FLAG_DETECTIONS if has_detections else 0
+            slot["timestamp"] = timestamp
+            slot["seq"] = seq
+
+            while self._tail_seq < self._next_seq and not self._valid(self._tail_seq):
+                if int(self._slots[self._tail_seq % self.slots]["seq"]) == self._tail_seq:
+                    self._data_evicted()     # slot still held, its bytes were overwritten
+                self._tail_seq += 1
+            self._write_header()
+            self.appended += 1
+
+        return RingEntry(seq, self._view[start:start + length], timestamp, has_detections)
+
+    def _data_evicted(self):
+        self.data_evictions += 1
+        live = self._next_seq - self._tail_seq
+        if not self._warned_small and live < self.slots // 2:
+            self._warned_small = True
+            logger.warning(
+                f"Frame ring {self.path}: data area ({self.data_size / 1_048_576:.0f}MB) "
+                f"only holds ~{live} frames of {self.slots} slots; "
+                f"pre-event frames may be overwritten before they are saved "
+                f"(raise SMART_RING_FILE_MB)"
+            )
+
+    def clear(self):
+        """Forget every frame (the file keeps its size)."""
+        with self._lock:
+            if self._closed:
+                return      # the file may already belong to another ring
+            self._tail_seq = self._next_seq
+            self._write_header()
+
+    def _write_header(self):
+        HEADER.pack_into(
+            self._mm, 0, RING_MAGIC, RING_VERSION, self.data_size, self.slots,
+            self._next_seq, self._tail_seq, self._write_end,
+        )
+
+    # ── Reading ───────────────────────────────────────────────────────────
+
+    def _valid(self, seq: int) -> bool:
+        slot = self._slots[seq % self.slots]
+        return (
+            int(slot["seq"]) == seq
+            and self._write_end - int(slot["offset"]) <= self.data_size
+        )
+
+    def is_current(self, seq: int) -> bool:
+        """True while the frame's bytes have not been overwritten."""
+        if seq < self._tail_seq or not self._valid(seq):
+            self.stale_reads += 1
+            return False
+        return True
+
+    def entries(self, since: float = 0.0) -> Iterator[RingEntry]:
+        """Live frames, oldest first, as zero-copy views (timestamp >= since)."""
+        with self._lock:
+            seqs = range(self._tail_seq, self._next_seq)
+            slots = [(seq, self._slots[seq % self.slots].copy()) for seq in seqs if self._valid(seq)]
+        for seq, slot in slots:
+            if slot["timestamp"] < since:
+                continue
+            start = self._data_start + int(slot["offset"]) % self.data_size
+            yield RingEntry(
+                seq,
+                self._view[start:start + int(slot["length"])],
+                float(slot["timestamp"]),
+                bool(slot["flags"] & FLAG_DETECTIONS),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(1 for seq in range(self._tail_seq, self._next_seq) if self._valid(seq))
+
+    @property
+    def live_bytes(self) -> int:
+        with self._lock:
+            if self._tail_seq >= self._next_seq:
+                return 0
+            oldest = int(self._slots[self._tail_seq % self.slots]["offset"])
+            return self._write_end - oldest
+
+    def window(self) -> tuple:
+        """(oldest, newest) timestamps of the live frames, or (0, 0)."""
+        with self._lock:
+            if self._tail_seq >= self._next_seq:
+                return 0.0, 0.0
+            oldest = float(self._slots[self._tail_seq % self.slots]["timestamp"])
+            newest = float(self._slots[(self._next_seq - 1) % self.slots]["timestamp"])
+            return oldest, newest
+
+    def close(self):
+        """Flush to disk and release the file for another buffer."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._write_header()
+            self._mm.flush()
+        # Only now may another ring open the file
+        with _open_paths_lock:
+            _open_paths.discard(self.path)
+        # Views handed out (snapshots, queued event frames) keep the mapping
+        # alive; it is unmapped once the last of them is gone
+
+    def get_stats(self) -> dict:
+        oldest, newest = self.window()
+        return {
+            "path": self.path,
+            "size_mb": round((self._data_start + self.data_size) / 1_048_576, 1),
+            "frames": len(self),
+            "live_mb": round(self.live_bytes / 1_048_576, 2),
+            "window_seconds": round(newest - oldest, 1),
+            "appended": self.appended,
+            "stale_reads": self.stale_reads,
+            "data_evictions": self.data_evictions,
+        }
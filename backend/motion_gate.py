@@ -0,0 +1,168 @@
+"""
+Motion Gate - Cheap change detector in front of YOLO
+
+Thermal feeds are static for long stretches, so running the detector on
+every third frame mostly re-confirms an empty scene.  The gate keeps a
+running-average background of a small, blurred grayscale copy of the frame
+and only lets a frame through to YOLO when the fraction of changed pixels
+(in the whole frame, or in any configured ROI) crosses a threshold.
+
+Frames still pass while motion was seen recently (hold) and at least once
+every keepalive_seconds, so objects that stop moving are not forgotten.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MOTION_GATE_ENABLED = os.getenv("MOTION_GATE_ENABLED", "true").lower() == "true"
+MOTION_THRESHOLD = float(os.getenv("MOTION_THRESHOLD", 0.005))      # changed-pixel fraction
+MOTION_PIXEL_DELTA = int(os.getenv("MOTION_PIXEL_DELTA", 18))       # grey levels
+MOTION_KEEPALIVE_SECONDS = float(os.getenv("MOTION_KEEPALIVE_SECONDS", 30))
+MOTION_HOLD_SECONDS = float(os.getenv("MOTION_HOLD_SECONDS", 2))
+MOTION_DOWNSCALE_WIDTH = int(os.getenv("MOTION_DOWNSCALE_WIDTH", 160))
+MOTION_BACKGROUND_ALPHA = float(os.getenv("MOTION_BACKGROUND_ALPHA", 0.05))
+
+# Normalised region of interest: x, y, width, height in 0..1
+ROI = Tuple[float, float, float, float]
+
+
+def parse_rois(value: str) -> List[ROI]:
+    """Parse "x,y,w,h;x,y,w,h" (normalised) into ROI tuples."""
+    rois = []
+    for part in filter(None, (p.strip() for p in value.split(";"))):
+        x, y, w, h = (float(v) for v in part.split(","))
+        rois.append((x, y, w, h))
+    return rois
+
+
+class MotionGate:
+    """Decides per frame whether the detector needs to run."""
+
+    def __init__(
+        self,
+        enabled: bool = MOTION_GATE_ENABLED,
+        threshold: float = MOTION_THRESHOLD,
+        pixel_delta: int = MOTION_PIXEL_DELTA,
+        keepalive_seconds: float = MOTION_KEEPALIVE_SECONDS,
+        hold_seconds: float = MOTION_HOLD_SECONDS,
+        downscale_width: int = MOTION_DOWNSCALE_WIDTH,
+        background_alpha: float = MOTION_BACKGROUND_ALPHA,
+        rois: Optional[Sequence[ROI]] = None,
+    ):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.keepalive_seconds = keepalive_seconds
+        self.hold_seconds = hold_seconds
+        self.downscale_width = downscale_width
+        self.background_alpha = background_alpha
+
+        self._lock = threading.Lock()
+        self._rois: List[ROI] = list(rois if rois is not None
+                                     else parse_rois(os.getenv("MOTION_ROIS", "")))
+        self._background: Optional[np.ndarray] = None
+        self._last_motion = 0.0
+        self._last_pass = 0.0
+
+        # Statistics
+        self.checked = 0
+        self.passed = 0
+        self.skipped = 0
+        self.last_score = 0.0
+        self.last_reason = "none"
+
+    def set_rois(self, rois: Sequence[ROI]):
+        rois = [tuple(roi) for roi in rois]
+        if any(len(roi) != 4 for roi in rois):
+            raise ValueError("ROIs must be (x, y, width, height)")
+        with self._lock:
+            self._rois = rois
+        logger.info(f"Motion gate ROIs set: {self._rois or 'full frame'}")
+
+    def reset(self):
+        """Forget the background, e.g. when the camera restarts."""
+        with self._lock:
+            self._background = None
+
+    def _score(self, small: np.ndarray) -> float:
+        """Largest changed-pixel fraction over the frame or the ROIs."""
+        background = self._background
+        changed = cv2.absdiff(small, background.astype(np.uint8)) > self.pixel_delta
+        cv2.accumulateWeighted(small, background, self.background_alpha)
+
+        if not self._rois:
+            return float(changed.mean())
+
+        h, w = changed.shape
+        score = 0.0
+        for x, y, rw, rh in self._rois:
+            x1, y1 = int(x * w), int(y * h)
+            x2, y2 = max(x1 + 1, int((x + rw) * w)), max(y1 + 1, int((y + rh) * h))
+            region = changed[y1:y2, x1:x2]
+            if region.size:
+                score = max(score, float(region.mean()))
+        return score
+
+    def check(self, frame: np.ndarray) -> bool:
+        """Return True if YOLO should run on this frame."""
+        if not self.enabled:
+            return True
+
+        h, w = frame.shape[:2]
+        scale = self.downscale_width / w
+        small = cv2.resize(frame, (self.downscale_width, max(1, int(h * scale))),
+                           interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        small = cv2.GaussianBlur(small, (5, 5), 0)
+
+        now = time.monotonic()
+        with self._lock:
+            self.checked += 1
+            if self._background is None or self._background.shape != small.shape:
+                self._background = small.astype(np.float32)
+                score, reason = 1.0, "init"
+            else:
+                score = self._score(small)
+                reason = "motion" if score >= self.threshold else "none"
+
+            if reason != "none":
+                self._last_motion = now
+            elif now - self._last_motion <= self.hold_seconds:
+                reason = "hold"
+            elif now - self._last_pass >= self.keepalive_seconds:
+                reason = "keepalive"
+
+            self.last_score = score
+            self.last_reason = reason
+            if reason == "none":
+                self.skipped += 1
+                return False
+
+            self._last_pass = now
+            self.passed += 1
+            return True
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "state": "active" if self.last_reason in ("init", "motion", "hold") else "idle",
+                "last_reason": self.last_reason,
+                "last_score": round(self.last_score, 4),
+                "threshold": self.threshold,
+                "rois": [list(roi) for roi in self._rois],
+                "checked": self.checked,
+                "passed": self.passed,
+                "skipped": self.skipped,
+                "skip_ratio": round(self.skipped / self.checked, 3) if self.checked else 0.0,
+            }
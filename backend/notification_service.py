@@ -1,4 +1,7 @@
-from database import Notification, get_db
+from database import Notification, SessionLocal, get_db
+from pagination import decode_cursor, keyset_page, keyset_page_async
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 from typing import Optional
 import logging
@@ -50,21 +53,32 @@ class NotificationService:
             return None
     
     @staticmethod
-    def get_user_notifications(user_id: int, unread_only: bool = False, limit: int = 50):
-        """Get user notifications"""
+    def get_user_notifications(user_id: int, unread_only: bool = False, limit: int = 50,
+                               cursor: Optional[str] = None):
+        """
+        Get one page of user notifications, newest first.
+        Returns (rows, next_cursor); raises ValueError for a bad cursor.
+        """
+        if cursor:
+            decode_cursor(cursor)   # a bad cursor is the caller's error, not a DB failure
+        db = SessionLocal()
         try:
-            db = next(get_db())
-            query = db.query(Notification).filter(Notification.user_id == user_id)
+            query = db.query(
+                Notification.id, Notification.title, Notification.message,
+                Notification.type, Notification.is_read, Notification.data,
+                Notification.created_at
+            ).filter(Notification.user_id == user_id)
             
             if unread_only:
                 query = query.filter(Notification.is_read == False)
             
-            notifications = query.order_by(Notification.created_at.desc()).limit(limit).all()
-            return notifications
+            return keyset_page(query, Notification.created_at, Notification.id, cursor, limit)
             
         except Exception as e:
             logger.error(f"Error fetching notifications: {e}")
-            return []
+            return [], None
+        finally:
+            db.close()
     
     @staticmethod
     def mark_as_read(notification_id: int, user_id: int):
@@ -101,5 +115,44 @@ class NotificationService:
         except Exception as e:
             logger.error(f"Error marking all as read: {e}")
             return False
+    
+    # ── Async variants for request handlers (AsyncSession from get_async_db) ──
+    
+    @staticmethod
+    async def get_user_notifications_async(db: AsyncSession, user_id: int, unread_only: bool = False,
+                                           limit: int = 50, cursor: Optional[str] = None):
+        """Async get_user_notifications.  Raises ValueError for a bad cursor."""
+        stmt = select(
+            Notification.id, Notification.title, Notification.message,
+            Notification.type, Notification.is_read, Notification.data,
+            Notification.created_at
+        ).where(Notification.user_id == user_id)
+        
+        if unread_only:
+            stmt = stmt.where(Notification.is_read == False)
+        
+        return await keyset_page_async(db, stmt, Notification.created_at, Notification.id, cursor, limit)
+    
+    @staticmethod
+    async def mark_as_read_async(db: AsyncSession, notification_id: int, user_id: int) -> bool:
+        """Async mark_as_read"""
+        result = await db.execute(
+            update(Notification)
+            .where(Notification.id == notification_id, Notification.user_id == user_id)
+            .values(is_read=True)
+        )
+        await db.commit()
+        return result.rowcount > 0
+    
+    @staticmethod
+    async def mark_all_as_read_async(db: AsyncSession, user_id: int) -> bool:
+        """Async mark_all_as_read"""
+        await db.execute(
+            update(Notification)
+            .where(Notification.user_id == user_id, Notification.is_read == False)
+            .values(is_read=True)
+        )
+        await db.commit()
+        return True
 
 notification_service = NotificationService()
\ No newline at end of file
@@ -0,0 +1,214 @@
+"""
+Object Tracker - Lightweight per-session IoU tracker
+
+Associates each detection round with the existing tracks by IoU (same
+class only), gives every object a stable track ID, and extrapolates boxes
+with a constant-velocity model on the frames where detection is skipped.
+All box maths is vectorised with NumPy; there are rarely more than a
+few dozen tracks per camera.
+
+Per frame, the video hub calls exactly one of:
+    tracker.update(detections)   # detector ran on this frame
+    tracker.predict()            # detection skipped, scene may be moving
+    tracker.hold()               # detection skipped, motion gate says static
+"""
+
+import logging
+import os
+from typing import Dict, List
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TRACK_IOU_THRESHOLD = float(os.getenv("TRACK_IOU_THRESHOLD", 0.3))
+TRACK_MAX_MISSED = int(os.getenv("TRACK_MAX_MISSED", 2))        # detection rounds
+TRACK_MAX_PREDICT_FRAMES = int(os.getenv("TRACK_MAX_PREDICT_FRAMES", 15))
+TRACK_VELOCITY_SMOOTHING = float(os.getenv("TRACK_VELOCITY_SMOOTHING", 0.5))
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU between (N,4) and (M,4) xyxy boxes."""
+    if not len(a) or not len(b):
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    a = a[:, None, :]
+    b = b[None, :, :]
+    iw = (np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0])).clip(0)
+    ih = (np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1])).clip(0)
+    inter = iw * ih
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / (area_a + area_b - inter + 1e-6)
+
+
+class ObjectTracker:
+    """
+    Struct-of-arrays track store: row i of every array is track i.
+    Not thread-safe; each hub drives its tracker from one coroutine.
+    """
+
+    def __init__(
+        self,
+        iou_threshold: float = TRACK_IOU_THRESHOLD,
+        max_missed: int = TRACK_MAX_MISSED,
+        max_predict_frames: int = TRACK_MAX_PREDICT_FRAMES,
+        velocity_smoothing: float = TRACK_VELOCITY_SMOOTHING,
+    ):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.max_predict_frames = max_predict_frames
+        self.velocity_smoothing = velocity_smoothing
+
+        self._next_id = 1
+        self.total_tracks = 0
+        self.class_names: Dict[int, str] = {}
+        self._reset_arrays()
+
+    def _reset_arrays(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.class_ids = np.empty(0, dtype=np.int32)
+        self.confidences = np.empty(0, dtype=np.float32)
+        self.boxes = np.empty((0, 4), dtype=np.float32)       # current (predicted) box
+        self.observed = np.empty((0, 4), dtype=np.float32)    # last detected box
+        self.velocity = np.empty((0, 4), dtype=np.float32)    # px per frame
+        self.frames_since_seen = np.empty(0, dtype=np.int32)
+        self.missed = np.empty(0, dtype=np.int32)             # detection rounds without a match
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def clear(self):
+        self._reset_arrays()
+
+    # ── Per-frame API ─────────────────────────────────────────────────────
+
+    def predict(self) -> List[Dict]:
+        """Advance every track one frame along its velocity."""
+        if len(self):
+            self.frames_since_seen += 1
+            moving = self.frames_since_seen <= self.max_predict_frames
+            self.boxes[moving] += self.velocity[moving]
+        return self.tracks()
+
+    def hold(self) -> List[Dict]:
+        """Static scene: keep boxes where they are and stop extrapolating."""
+        self.velocity[:] = 0.0
+        return self.tracks()
+
+    def update(self, detections: List[Dict]) -> List[Dict]:
+        """
+        Match a fresh detection list against the tracks.  Each detection
+        dict gets a "track_id" key; the returned list is the live tracks.
+        """
+        self.predict()
+
+        n = len(detections)
+        det_boxes = np.array(
+            [[d["bbox"]["x1"], d["bbox"]["y1"], d["bbox"]["x2"], d["bbox"]["y2"]] for d in detections],
+            dtype=np.float32,
+        ).reshape(n, 4)
+        det_classes = np.array([d.get("class_id", -1) for d in detections], dtype=np.int32)
+        det_conf = np.array([d.get("confidence", 0.0) for d in detections], dtype=np.float32)
+        for d in detections:
+            self.class_names[d.get("class_id", -1)] = d.get("class_name", "unknown")
+
+        ious = iou_matrix(self.boxes, det_boxes)
+        if ious.size:
+            ious[self.class_ids[:, None] != det_classes[None, :]] = 0.0
+
+        # Greedy assignment, best IoU first
+        track_for_det = np.full(n, -1, dtype=np.int64)
+        if ious.size:
+            order = np.argsort(ious, axis=None)[::-1]
+            used_tracks = set()
+            for flat in order:
+                t, d = divmod(int(flat), n)
+                if ious[t, d] < self.iou_threshold:
+                    break
+                if t in used_tracks or track_for_det[d] >= 0:
+                    continue
+                used_tracks.add(t)
+                track_for_det[d] = t
+
+        matched_dets = np.flatnonzero(track_for_det >= 0)
+        matched_tracks = track_for_det[matched_dets]
+
+        if len(matched_dets):
+            steps = np.maximum(self.frames_since_seen[matched_tracks], 1)[:, None]
+            new_velocity = (det_boxes[matched_dets] - self.observed[matched_tracks]) / steps
+            a = self.velocity_smoothing
+            self.velocity[matched_tracks] = a * self.velocity[matched_tracks] + (1 - a) * new_velocity
+            self.boxes[matched_tracks] = det_boxes[matched_dets]
+            self.observed[matched_tracks] = det_boxes[matched_dets]
+            self.confidences[matched_tracks] = det_conf[matched_dets]
+            self.frames_since_seen[matched_tracks] = 0
+            self.missed[matched_tracks] = 0
+
+        # Tracks with no detection this round
+        unmatched = np.ones(len(self), dtype=bool)
+        unmatched[matched_tracks] = False
+        self.missed[unmatched] += 1
+
+        # Detections with no track start new ones
+        new_dets = np.flatnonzero(track_for_det < 0)
+        if len(new_dets):
+            new_ids = np.arange(self._next_id, self._next_id + len(new_dets), dtype=np.int64)
+            self._next_id += len(new_dets)
+            self.total_tracks += len(new_dets)
+            track_for_det[new_dets] = np.arange(len(self), len(self) + len(new_dets))
+
+            self.ids = np.concatenate([self.ids, new_ids])
+            self.class_ids = np.concatenate([self.class_ids, det_classes[new_dets]])
+            self.confidences = np.concatenate([self.confidences, det_conf[new_dets]])
+            self.boxes = np.concatenate([self.boxes, det_boxes[new_dets]])
+            self.observed = np.concatenate([self.observed, det_boxes[new_dets]])
+            self.velocity = np.concatenate([self.velocity, np.zeros((len(new_dets), 4), np.float32)])
+            self.frames_since_seen = np.concatenate([self.frames_since_seen, np.zeros(len(new_dets), np.int32)])
+            self.missed = np.concatenate([self.missed, np.zeros(len(new_dets), np.int32)])
+
+        for d, t in zip(detections, track_for_det.tolist()):
+            d["track_id"] = int(self.ids[t])
+
+        self._prune()
+        return self.tracks()
+
+    def tracks(self) -> List[Dict]:
+        """Live tracks as detection dicts (same shape as yolo_detector output)."""
+        boxes = self.boxes.round().astype(np.int32)
+        return [
+            {
+                "track_id": track_id,
+                "class_id": class_id,
+                "class_name": self.class_names.get(class_id, "unknown"),
+                "confidence": conf,
+                "bbox": {"x1": x1, "y1": y1, "x2": x2, "y2": y2},
+            }
+            for track_id, class_id, conf, (x1, y1, x2, y2) in zip(
+                self.ids.tolist(),
+                self.class_ids.tolist(),
+                self.confidences.tolist(),
+                boxes.tolist(),
+            )
+        ]
+
+    def get_stats(self) -> dict:
+        return {
+            "active_tracks": len(self),
+            "total_tracks": self.total_tracks,
+        }
+
+    # ── Internal helpers ──────────────────────────────────────────────────
+
+    def _prune(self):
+        keep = self.missed < self.max_missed
+        if keep.all():
+            return
+        self.ids = self.ids[keep]
+        self.class_ids = self.class_ids[keep]
+        self.confidences = self.confidences[keep]
+        self.boxes = self.boxes[keep]
+        self.observed = self.observed[keep]
+        self.velocity = self.velocity[keep]
+        self.frames_since_seen = self.frames_since_seen[keep]
+        self.missed = self.missed[keep]
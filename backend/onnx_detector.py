@@ -0,0 +1,159 @@
+"""
+ONNX Detector - onnxruntime CPU backend for YOLOv8
+
+Runs an exported yolov8n.onnx with onnxruntime instead of PyTorch.
+Pre-processing (letterbox) and post-processing (confidence filter, class
+filter, NMS, box rescaling) are plain NumPy/OpenCV and mirror what
+ultralytics does, so boxes line up with the torch backend.
+
+Selected from yolo_detector.py with YOLO_BACKEND=onnx; that module also
+takes care of exporting and caching the .onnx file.
+"""
+
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Same defaults ultralytics uses for predict() / non_max_suppression()
+MAX_DETECTIONS = 300
+MAX_WH = 7680
+LETTERBOX_COLOR = (114, 114, 114)
+
+
+def letterbox(frame: np.ndarray, size: int) -> Tuple[np.ndarray, float, Tuple[int, int]]:
+    """Resize keeping aspect ratio and pad to size×size (ultralytics LetterBox, auto=False)."""
+    h, w = frame.shape[:2]
+    gain = min(size / h, size / w)
+    new_w, new_h = int(round(w * gain)), int(round(h * gain))
+
+    if (new_w, new_h) != (w, h):
+        frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+    dw, dh = (size - new_w) / 2, (size - new_h) / 2
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    padded = cv2.copyMakeBorder(frame, top, bottom, left, right,
+                                cv2.BORDER_CONSTANT, value=LETTERBOX_COLOR)
+    return padded, gain, (left, top)
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """Greedy NMS over xyxy boxes; returns kept indices by descending score."""
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1).clip(0) * (y2 - y1).clip(0)
+    order = scores.argsort()[::-1]
+
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        if order.size == 1:
+            break
+        rest = order[1:]
+        iw = (np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest])).clip(0)
+        ih = (np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest])).clip(0)
+        inter = iw * ih
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-7)
+        order = rest[iou <= iou_threshold]
+
+    return np.asarray(keep, dtype=np.int64)
+
+
+class OnnxYOLOSession:
+    """onnxruntime session plus the NumPy pre/post-processing around it."""
+
+    def __init__(self, onnx_path: str, intra_op_threads: int = 0,
+                 imgsz: int = 640, iou_threshold: float = 0.7):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads  # 0 = onnxruntime default
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.session = ort.InferenceSession(
+            onnx_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.imgsz = imgsz
+        self.iou_threshold = iou_threshold
+        # A static batch dimension means frames have to go through one by one
+        self.dynamic_batch = not isinstance(model_input.shape[0], int)
+
+        logger.info(
+            f"✅ ONNX session ready: {onnx_path} "
+            f"(threads={intra_op_threads or 'auto'}, dynamic_batch={self.dynamic_batch})"
+        )
+
+    def _preprocess(self, frames: Sequence[np.ndarray]):
+        blobs, meta = [], []
+        for frame in frames:
+            padded, gain, pad = letterbox(frame, self.imgsz)
+            blobs.append(padded[:, :, ::-1].transpose(2, 0, 1))  # BGR→RGB, HWC→CHW
+            meta.append((gain, pad, frame.shape[:2]))
+        batch = np.ascontiguousarray(np.stack(blobs), dtype=np.float32)
+        batch /= 255.0
+        return batch, meta
+
+    def _postprocess(self, pred: np.ndarray, confidence: float,
+                     classes: Optional[np.ndarray], gain: float,
+                     pad: Tuple[int, int], shape: Tuple[int, int]):
+        # pred: (4 + num_classes, N) → (N, 4 + num_classes)
+        pred = pred.T
+        scores = pred[:, 4:]
+        class_ids = scores.argmax(axis=1).astype(np.int32)
+        confidences = scores[np.arange(len(scores)), class_ids].astype(np.float32)
+
+        keep = confidences > confidence
+        if classes is not None:
+            keep &= np.isin(class_ids, classes)
+
+        boxes = pred[keep, :4]
+        class_ids = class_ids[keep]
+        confidences = confidences[keep]
+        if not len(boxes):
+            return class_ids, confidences, np.empty((0, 4), dtype=np.int32)
+
+        # cx, cy, w, h → x1, y1, x2, y2
+        xyxy = np.empty_like(boxes)
+        xyxy[:, :2] = boxes[:, :2] - boxes[:, 2:] / 2
+        xyxy[:, 2:] = boxes[:, :2] + boxes[:, 2:] / 2
+
+        # Per-class NMS via coordinate offsets, as ultralytics does
+        kept = nms(xyxy + class_ids[:, None] * MAX_WH, confidences, self.iou_threshold)
+        kept = kept[:MAX_DETECTIONS]
+        xyxy, class_ids, confidences = xyxy[kept], class_ids[kept], confidences[kept]
+
+        # Undo the letterbox
+        xyxy[:, [0, 2]] -= pad[0]
+        xyxy[:, [1, 3]] -= pad[1]
+        xyxy /= gain
+        h, w = shape
+        xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, w)
+        xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, h)
+
+        return class_ids, confidences, np.rint(xyxy).astype(np.int32)
+
+    def infer(self, frames: Sequence[np.ndarray], confidence: float,
+              classes: Optional[np.ndarray] = None) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """Returns (class_ids, confidences, xyxy boxes) per frame."""
+        batch, meta = self._preprocess(frames)
+
+        if self.dynamic_batch:
+            preds = self.session.run(None, {self.input_name: batch})[0]
+        else:
+            preds = np.concatenate([
+                self.session.run(None, {self.input_name: batch[i:i + 1]})[0]
+                for i in range(len(batch))
+            ])
+
+        return [
+            self._postprocess(pred, confidence, classes, gain, pad, shape)
+            for pred, (gain, pad, shape) in zip(preds, meta)
+        ]
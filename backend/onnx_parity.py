@@ -0,0 +1,126 @@
+"""
+ONNX Parity Check - Compare the onnx backend against the torch backend
+
+Samples frames from the clips in smart_recordings/, runs both detector
+backends on the same frames, and matches boxes per class by IoU.
+
+    python onnx_parity.py [--clips DIR] [--every N] [--max-frames N]
+                          [--iou 0.5] [--min-match 0.95]
+
+Exits with status 1 when the share of matched boxes falls below --min-match.
+"""
+
+import argparse
+import glob
+import os
+import sys
+
+import cv2
+import numpy as np
+
+from yolo_detector import DetectionArrays, YOLODetector
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU between (N,4) and (M,4) xyxy boxes."""
+    a = a.astype(np.float32)[:, None, :]
+    b = b.astype(np.float32)[None, :, :]
+    iw = (np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0])).clip(0)
+    ih = (np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1])).clip(0)
+    inter = iw * ih
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / (area_a + area_b - inter + 1e-7)
+
+
+def match(reference: DetectionArrays, candidate: DetectionArrays, iou_threshold: float):
+    """Greedy same-class matching; returns (matched, ious of matched pairs)."""
+    if not len(reference) or not len(candidate):
+        return 0, []
+
+    ious = box_iou(reference.boxes, candidate.boxes)
+    ious[reference.class_ids[:, None] != candidate.class_ids[None, :]] = 0.0
+
+    matched, pairs = 0, []
+    while True:
+        i, j = np.unravel_index(ious.argmax(), ious.shape)
+        if ious[i, j] < iou_threshold:
+            break
+        matched += 1
+        pairs.append(float(ious[i, j]))
+        ious[i, :] = 0.0
+        ious[:, j] = 0.0
+    return matched, pairs
+
+
+def sample_frames(clips_dir: str, every: int, max_frames: int):
+    clips = sorted(glob.glob(os.path.join(clips_dir, "*.mp4")))
+    taken = 0
+    for path in clips:
+        cap = cv2.VideoCapture(path)
+        index = 0
+        while taken < max_frames:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            if index % every == 0:
+                taken += 1
+                yield os.path.basename(path), index, frame
+            index += 1
+        cap.release()
+        if taken >= max_frames:
+            return
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clips", default="smart_recordings")
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--confidence", type=float, default=0.5)
+    parser.add_argument("--every", type=int, default=15)
+    parser.add_argument("--max-frames", type=int, default=200)
+    parser.add_argument("--iou", type=float, default=0.5)
+    parser.add_argument("--min-match", type=float, default=0.95)
+    args = parser.parse_args()
+
+    torch_detector = YOLODetector(args.model, backend="torch")
+    onnx_detector = YOLODetector(args.model, backend="onnx")
+    if not torch_detector.is_loaded or onnx_detector.backend != "onnx":
+        print("❌ Both backends must load for a parity check")
+        return 1
+
+    frames = ref_boxes = onnx_boxes = matched = 0
+    all_ious = []
+    for clip, index, frame in sample_frames(args.clips, args.every, args.max_frames):
+        ref = torch_detector.detect_arrays_batch([frame], args.confidence)[0]
+        cand = onnx_detector.detect_arrays_batch([frame], args.confidence)[0]
+        m, ious = match(ref, cand, args.iou)
+
+        frames += 1
+        ref_boxes += len(ref)
+        onnx_boxes += len(cand)
+        matched += m
+        all_ious.extend(ious)
+        if m < max(len(ref), len(cand)):
+            print(f"  {clip} frame {index}: torch={len(ref)} onnx={len(cand)} matched={m}")
+
+    if not frames:
+        print(f"❌ No frames found in {args.clips}")
+        return 1
+
+    denominator = max(ref_boxes, onnx_boxes)
+    match_rate = matched / denominator if denominator else 1.0
+    print(f"Frames:       {frames}")
+    print(f"Boxes:        torch={ref_boxes} onnx={onnx_boxes} matched={matched}")
+    print(f"Match rate:   {match_rate:.3f} (IoU ≥ {args.iou})")
+    print(f"Mean IoU:     {np.mean(all_ious) if all_ious else 0.0:.3f}")
+
+    if match_rate < args.min_match:
+        print(f"❌ Parity below {args.min_match}")
+        return 1
+    print("✅ Parity OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
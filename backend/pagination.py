@@ -0,0 +1,73 @@
+"""
+Pagination - Keyset (cursor) pagination for the list endpoints
+
+Lists are ordered newest first on (timestamp, id).  A page is fetched with
+WHERE (ts, id) < (cursor_ts, cursor_id) ... LIMIT n+1, which stays an index
+range scan no matter how deep the client pages, unlike OFFSET.
+
+The cursor handed to clients is an opaque url-safe token of the last row's
+(timestamp, id); `next_cursor` is None on the last page.
+"""
+
+import base64
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(ts: datetime, row_id: int) -> str:
+    raw = f"{ts.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Raises ValueError for anything that isn't a cursor we issued."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(ts), int(row_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def keyset_select(query, ts_col, id_col, cursor: Optional[str], limit: int):
+    """
+    Apply cursor + ordering + limit (one extra row, to detect a next page).
+    Works on both ORM Query and 2.0-style select(); raises ValueError for
+    a bad cursor.
+    """
+    if cursor:
+        ts, row_id = decode_cursor(cursor)
+        query = query.filter(tuple_(ts_col, id_col) < tuple_(ts, row_id))
+    return query.order_by(ts_col.desc(), id_col.desc()).limit(limit + 1)
+
+
+def split_page(rows: List, ts_col, id_col, limit: int) -> Tuple[List, Optional[str]]:
+    """Trim the look-ahead row and build next_cursor from the last row kept."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, ts_col.key), getattr(last, id_col.key))
+
+
+def keyset_page(query: Query, ts_col, id_col, cursor: Optional[str],
+                limit: int) -> Tuple[List, Optional[str]]:
+    """
+    Sync one-shot: return (rows, next_cursor) for an ORM Query.
+    Rows must expose the ts/id columns under their column names.
+    """
+    rows = keyset_select(query, ts_col, id_col, cursor, limit).all()
+    return split_page(rows, ts_col, id_col, limit)
+
+
+async def keyset_page_async(db, stmt, ts_col, id_col, cursor: Optional[str],
+                            limit: int) -> Tuple[List, Optional[str]]:
+    """Same as keyset_page for a select() run on an AsyncSession."""
+    rows = (await db.execute(keyset_select(stmt, ts_col, id_col, cursor, limit))).all()
+    return split_page(rows, ts_col, id_col, limit)
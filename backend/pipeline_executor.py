@@ -0,0 +1,128 @@
+"""
+Pipeline Executor - Sized worker pools for the CPU-heavy video stages
+
+JPEG encoding and recording-side work (drawing boxes, buffer encoding,
+VideoWriter) are handed to dedicated thread pools so the asyncio event
+loop only awaits their results.  OpenCV releases the GIL inside its
+kernels, so threads give real parallelism here.  YOLO inference has its
+own batching worker (see detection_scheduler.py).
+
+Each stage keeps counters so /health can show which one is saturated:
+queued (waiting for a worker), active, completed, failed, and timings.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class PipelineStage:
+    """A named thread pool that measures queue depth and service time."""
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix=f"stage_{name}"
+        )
+        self._lock = threading.Lock()
+
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_run_seconds = 0.0
+        self.total_wait_seconds = 0.0
+        self.last_run_seconds = 0.0
+        self.max_run_seconds = 0.0
+
+    async def run(self, fn: Callable, *args):
+        """Run fn(*args) on this stage's pool and await the result."""
+        loop = asyncio.get_running_loop()
+        submitted = time.perf_counter()
+        with self._lock:
+            self.queued += 1
+
+        def _call():
+            started = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.active += 1
+                self.total_wait_seconds += started - submitted
+            ok = False
+            try:
+                result = fn(*args)
+                ok = True
+                return result
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    self.active -= 1
+                    if ok:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+                    self.total_run_seconds += elapsed
+                    self.last_run_seconds = elapsed
+                    self.max_run_seconds = max(self.max_run_seconds, elapsed)
+
+        return await loop.run_in_executor(self._executor, _call)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            done = self.completed + self.failed
+            return {
+                "workers": self.max_workers,
+                "queued": self.queued,
+                "active": self.active,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_run_ms": round(self.total_run_seconds / done * 1000, 2) if done else 0.0,
+                "avg_wait_ms": round(self.total_wait_seconds / done * 1000, 2) if done else 0.0,
+                "last_run_ms": round(self.last_run_seconds * 1000, 2),
+                "max_run_ms": round(self.max_run_seconds * 1000, 2),
+                "utilization": round(self.active / self.max_workers, 2),
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class PipelineExecutors:
+    """The set of stages shared by every video session."""
+
+    def __init__(self):
+        cpu = os.cpu_count() or 4
+        self.encode = PipelineStage(
+            "encode", int(os.getenv("PIPELINE_ENCODE_WORKERS", max(2, cpu // 2)))
+        )
+        self.record = PipelineStage(
+            "record", int(os.getenv("PIPELINE_RECORD_WORKERS", 2))
+        )
+        self.stages: Dict[str, PipelineStage] = {
+            "encode": self.encode,
+            "record": self.record,
+        }
+        logger.info(
+            "Pipeline stages: "
+            + ", ".join(f"{n}={s.max_workers}" for n, s in self.stages.items())
+        )
+
+    def get_stats(self) -> Dict[str, dict]:
+        return {name: stage.get_stats() for name, stage in self.stages.items()}
+
+    def shutdown(self):
+        for stage in self.stages.values():
+            stage.shutdown()
+
+
+# Global instance
+pipeline_executors = PipelineExecutors()
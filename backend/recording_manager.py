@@ -1,18 +1,39 @@
 import cv2
 import os
+import queue
+import threading
 from datetime import datetime
 from typing import Optional
 import logging
 from pathlib import Path
 import platform
 
+from storage_ledger import storage_ledger
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Frames queued per recording for its writer thread, and what write_frame()
+# does when the queue is full: "drop_oldest" (never waits) or "block"
+RECORDING_QUEUE_SIZE = int(os.getenv("RECORDING_QUEUE_SIZE", 60))
+RECORDING_OVERFLOW_POLICY = os.getenv("RECORDING_OVERFLOW_POLICY", "drop_oldest").lower()
+RECORDING_BLOCK_TIMEOUT_SECONDS = float(os.getenv("RECORDING_BLOCK_TIMEOUT_SECONDS", 1.0))
+WRITER_JOIN_TIMEOUT_SECONDS = 30
+WRITER_POLL_SECONDS = 0.1   # how often an idle writer checks for stop
+
 class RecordingManager:
-    def __init__(self, output_dir: str = "recordings"):
+    def __init__(self, output_dir: str = "recordings",
+                 queue_size: int = RECORDING_QUEUE_SIZE,
+                 overflow_policy: str = RECORDING_OVERFLOW_POLICY,
+                 block_timeout: float = RECORDING_BLOCK_TIMEOUT_SECONDS):
         self.output_dir = output_dir
-        self.active_recordings = {}  # session_id -> VideoWriter
+        self.active_recordings = {}  # session_id -> recording dict (writer, queue, thread, ...)
+        self.queue_size = max(1, queue_size)
+        if overflow_policy not in ("drop_oldest", "block"):
+            logger.warning(f"Unknown RECORDING_OVERFLOW_POLICY {overflow_policy!r}, using drop_oldest")
+            overflow_policy = "drop_oldest"
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
         Path(output_dir).mkdir(exist_ok=True)
         self.preferred_codec = self._get_preferred_codec()
     
@@ -87,15 +108,21 @@ class RecordingManager:
         return (None, None)
         
     def start_recording(self, session_id: str, fps: float, 
-                       frame_size: tuple, camera_name: str = "camera") -> Optional[str]:
+                       frame_size: Optional[tuple] = None, camera_name: str = "camera",
+                       user_id: Optional[int] = None) -> Optional[str]:
         """
         Start recording for a session with annotated frames.
         
+        Frames handed to write_frame() are queued and written by a writer
+        thread owned by the recording.
+        
         Args:
             session_id: Unique session identifier
             fps: Frames per second for the video
-            frame_size: Tuple of (width, height) for the video
+            frame_size: Tuple of (width, height) for the video. None = take it
+                        from the first frame (the camera's real size)
             camera_name: Name of the camera for filename
+            user_id: Owner, for per-user storage accounting
         
         Returns:
             Filepath if successful, None otherwise
@@ -111,20 +138,18 @@ class RecordingManager:
             
             # Ensure fps and frame size are valid
             fps = float(fps) if fps > 0 else 30
-            frame_size = (int(frame_size[0]), int(frame_size[1]))
-            
-            # Select appropriate codec
-            fourcc, writer = self._select_codec(filepath, fps, frame_size)
-            logger.info(
-    f"Writer opened={writer.isOpened()} "
-    f"fps={fps} size={frame_size}"
-)
-            
-            if writer is None:
-                logger.error(f"Failed to create video writer for {filepath}")
-                return None
+            fourcc = writer = None
+            if frame_size:
+                frame_size = (int(frame_size[0]), int(frame_size[1]))
+                
+                # Select appropriate codec
+                fourcc, writer = self._select_codec(filepath, fps, frame_size)
+                if writer is None:
+                    logger.error(f"Failed to create video writer for {filepath}")
+                    return None
+                logger.info(f"Writer opened={writer.isOpened()} fps={fps} size={frame_size}")
             
-            self.active_recordings[session_id] = {
+            recording = {
                 'writer': writer,
                 'filepath': filepath,
                 'filename': filename,
@@ -132,10 +157,30 @@ class RecordingManager:
                 'frame_count': 0,
                 'fps': fps,
                 'frame_size': frame_size,
-                'fourcc': fourcc
+                'fourcc': fourcc,
+                'user_id': user_id,
+                'queue': queue.Queue(maxsize=self.queue_size),
+                # Set by stop_recording; the writer drains the queue, then exits.
+                # An event rather than a queue sentinel, which drop_oldest
+                # could evict from a full queue
+                'stop': threading.Event(),
+                'dropped_frames': 0,
+                'max_queue_depth': 0,
             }
+            recording['thread'] = threading.Thread(
+                target=self._writer_loop,
+                args=(recording,),
+                name=f"recording-writer-{session_id[:8]}",
+                daemon=True
+            )
+            recording['thread'].start()
+            self.active_recordings[session_id] = recording
             
-            logger.info(f"Recording started: {filepath} (FPS: {fps}, Resolution: {frame_size})")
+            logger.info(
+                f"Recording started: {filepath} (FPS: {fps}, "
+                f"Resolution: {frame_size or 'from first frame'}, "
+                f"queue: {self.queue_size} frames, overflow: {self.overflow_policy})"
+            )
             return filepath
             
         except Exception as e:
@@ -144,7 +189,11 @@ class RecordingManager:
     
     def write_frame(self, session_id: str, frame, enforce_size: bool = True) -> bool:
         """
-        Write a frame to the recording.
+        Queue a frame for the recording's writer thread.  Never touches the
+        encoder itself.
+        
+        When the queue is full, "drop_oldest" evicts the oldest queued frame
+        and "block" waits up to block_timeout seconds before dropping this one.
         
         Args:
             session_id: Session identifier
@@ -152,46 +201,102 @@ class RecordingManager:
             enforce_size: If True, resize frame to match expected size
         
         Returns:
-            True if successful, False otherwise
+            True if queued, False otherwise
         """
-        if session_id not in self.active_recordings:
+        recording = self.active_recordings.get(session_id)
+        if recording is None or recording['stop'].is_set():
             return False
         
-        try:
-            recording = self.active_recordings[session_id]
-            
-            # Ensure frame size matches what VideoWriter expects
-            if enforce_size:
-                expected_size = recording['frame_size']
-                if frame.shape[1] != expected_size[0] or frame.shape[0] != expected_size[1]:
-                    frame = cv2.resize(frame, expected_size, interpolation=cv2.INTER_LINEAR)
-            
-            # Ensure frame is in BGR color space (OpenCV standard)
-            if len(frame.shape) == 2:  # Grayscale
-                frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
-            elif frame.shape[2] == 4:  # RGBA
-                frame = cv2.cvtColor(frame, cv2.COLOR_RGBA2BGR)
-            
-            recording['writer'].write(frame)
-            recording['frame_count'] += 1
-            return True
+        frames = recording['queue']
+        item = (frame, enforce_size)
+        if self.overflow_policy == "block":
+            try:
+                frames.put(item, timeout=self.block_timeout)
+            except queue.Full:
+                recording['dropped_frames'] += 1
+                return False
+        else:
+            while True:
+                try:
+                    frames.put_nowait(item)
+                    break
+                except queue.Full:
+                    try:
+                        frames.get_nowait()
+                        recording['dropped_frames'] += 1
+                    except queue.Empty:
+                        pass
+        
+        recording['max_queue_depth'] = max(recording['max_queue_depth'], frames.qsize())
+        return True
+    
+    def _writer_loop(self, recording: dict):
+        """Writer thread: drain the queue into the VideoWriter until stopped."""
+        frames = recording['queue']
+        stop = recording['stop']
+        while True:
+            try:
+                frame, enforce_size = frames.get(timeout=WRITER_POLL_SECONDS)
+            except queue.Empty:
+                if stop.is_set():
+                    break
+                continue
             
-        except Exception as e:
-            logger.error(f"Error writing frame: {e}")
+            try:
+                if recording['writer'] is None:
+                    if not self._open_writer(recording, frame):
+                        continue
+                
+                # Ensure frame size matches what VideoWriter expects
+                if enforce_size:
+                    expected_size = recording['frame_size']
+                    if frame.shape[1] != expected_size[0] or frame.shape[0] != expected_size[1]:
+                        frame = cv2.resize(frame, expected_size, interpolation=cv2.INTER_LINEAR)
+                
+                # Ensure frame is in BGR color space (OpenCV standard)
+                if len(frame.shape) == 2:  # Grayscale
+                    frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+                elif frame.shape[2] == 4:  # RGBA
+                    frame = cv2.cvtColor(frame, cv2.COLOR_RGBA2BGR)
+                
+                recording['writer'].write(frame)
+                recording['frame_count'] += 1
+                
+            except Exception as e:
+                logger.error(f"Error writing frame: {e}")
+    
+    def _open_writer(self, recording: dict, frame) -> bool:
+        """Open the VideoWriter at the size of the first frame."""
+        if recording.get('open_failed'):
             return False
+        frame_size = (frame.shape[1], frame.shape[0])
+        fourcc, writer = self._select_codec(recording['filepath'], recording['fps'], frame_size)
+        if writer is None:
+            logger.error(f"Failed to create video writer for {recording['filepath']}")
+            recording['open_failed'] = True
+            return False
+        recording.update(writer=writer, fourcc=fourcc, frame_size=frame_size)
+        logger.info(f"Writer opened={writer.isOpened()} fps={recording['fps']} size={frame_size}")
+        return True
     
     def stop_recording(self, session_id: str) -> Optional[dict]:
         """
         Stop recording and return statistics.
+        Waits for the writer thread to drain the frames still queued.
         
         Returns:
             Dictionary with recording info or None if session not found
         """
-        if session_id not in self.active_recordings:
+        recording = self.active_recordings.pop(session_id, None)
+        if recording is None:
             return None
         
         try:
-            recording = self.active_recordings[session_id]
+            queue_depth = recording['queue'].qsize()
+            recording['stop'].set()
+            recording['thread'].join(WRITER_JOIN_TIMEOUT_SECONDS)
+            if recording['thread'].is_alive():
+                logger.warning(f"Writer thread for {recording['filename']} did not finish in time")
             writer = recording['writer']
             
             # Properly release the video writer
@@ -218,6 +323,7 @@ class RecordingManager:
                 except Exception as e:
                     logger.warning(f"Could not validate MP4: {e}")
             
+            frame_size = recording['frame_size']
             stats = {
                 'filepath': filepath,
                 'filename': recording['filename'],
@@ -226,13 +332,22 @@ class RecordingManager:
                 'file_size_mb': round(file_size / (1024 * 1024), 2),
                 'frame_count': recording['frame_count'],
                 'expected_fps': recording['fps'],
-                'resolution': f"{recording['frame_size'][0]}x{recording['frame_size'][1]}",
+                'resolution': f"{frame_size[0]}x{frame_size[1]}" if frame_size else None,
                 'started_at': recording['start_time'],
-                'ended_at': end_time
+                'ended_at': end_time,
+                'queue_depth_at_stop': queue_depth,
+                'max_queue_depth': recording['max_queue_depth'],
+                'queue_capacity': recording['queue'].maxsize,
+                'dropped_frames': recording['dropped_frames'],
+                'overflow_policy': self.overflow_policy
             }
             
-            del self.active_recordings[session_id]
-            logger.info(f"Recording stopped: {recording['filename']} ({duration:.1f}s, {file_size / (1024*1024):.2f}MB)")
+            if file_size > 0:
+                storage_ledger.file_added(filepath, file_size, recording['user_id'])
+            logger.info(
+                f"Recording stopped: {recording['filename']} ({duration:.1f}s, "
+                f"{file_size / (1024*1024):.2f}MB, dropped {recording['dropped_frames']} frames)"
+            )
             
             return stats
             
@@ -244,6 +359,19 @@ class RecordingManager:
         """Check if session is recording"""
         return session_id in self.active_recordings
     
+    def get_stats(self) -> dict:
+        """Queue depth / drop counters of the active recordings, by session."""
+        return {
+            session_id: {
+                'filename': recording['filename'],
+                'frame_count': recording['frame_count'],
+                'queue_depth': recording['queue'].qsize(),
+                'max_queue_depth': recording['max_queue_depth'],
+                'dropped_frames': recording['dropped_frames'],
+            }
+            for session_id, recording in list(self.active_recordings.items())
+        }
+    
     def get_active_recordings(self) -> list:
         """Get list of active recording sessions"""
         return list(self.active_recordings.keys())
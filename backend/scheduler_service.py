@@ -12,6 +12,14 @@ class SchedulerService:
         self.scheduler = BackgroundScheduler()
         self.scheduler.start()
         self.active_scheduled_recordings = {}  # camera_id -> recording_session_id
+        self._on_start = None
+    
+    def set_start_handler(self, handler):
+        """
+        Register handler(camera_id), called on the scheduler thread when a
+        schedule window opens (the camera's ingest pipeline starts recording).
+        """
+        self._on_start = handler
     
     def add_schedule(self, schedule_id: int):
         """Add a schedule to the scheduler"""
@@ -88,11 +96,16 @@ class SchedulerService:
     def _start_scheduled_recording(self, camera_id: int, schedule_id: int):
         """Start scheduled recording"""
         logger.info(f"Starting scheduled recording for camera {camera_id} (schedule: {schedule_id})")
-        # Store schedule info so WebSocket handler can pick it up and start recording
+        # Store schedule info so a pipeline that starts later picks it up too
         self.active_scheduled_recordings[camera_id] = {
             'schedule_id': schedule_id,
             'started_at': datetime.now()
         }
+        if self._on_start:
+            try:
+                self._on_start(camera_id)
+            except Exception as e:
+                logger.error(f"Error starting scheduled recording for camera {camera_id}: {e}")
     
     def get_active_schedule(self, camera_id: int) -> dict:
         """Get active schedule info for a camera"""
@@ -6,17 +6,27 @@ import threading
 import logging
 import time
 import asyncio
+import functools
+import queue
+import shutil
+import subprocess
+import tempfile
 import uuid
+import weakref
 from collections import deque
-from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum, auto
 from pathlib import Path
-from typing import Optional, List, Tuple, Dict, Deque
+from typing import Callable, Optional, List, Tuple, Dict, Deque
 
 import numpy as np
 
+from buffer_memory import Pressure, buffer_memory
+from frame_packet import FramePacket
+from frame_ring import FrameRing, RingInUse
+from storage_ledger import storage_ledger
+
 logger =  logging.getLogger(__name__)
 #===================================================================
 # CONFIGURATION (all tunable without touching the rest of the code)
@@ -41,10 +51,34 @@ class SmartRecordingConfig:
     # This means any two events closer than the post_event_seconds are merged.
     
     # --------Frame buffer ----------------------
-    # JPEG quality for buffer frames
-    buffer_jpeg_quality: int=60
+    # JPEG quality for buffer frames.  Kept equal to the stream quality
+    # (STREAM_JPEG_QUALITY) so unannotated frames reuse the stream encode
+    buffer_jpeg_quality: int=75
     #JPEG quality for final saved clips
     output_jpeg_quality: int=85
+    #JPEG quality for buffer frames while the global buffer memory budget
+    #(buffer_memory.py, SMART_BUFFER_MEMORY_MB) is under pressure
+    buffer_pressure_jpeg_quality: int = 50
+    
+    # Where "jpeg" mode buffers keep their frames:
+    #   "memory" – a deque of JPEGs on the Python heap
+    #   "mmap"   – a fixed-size memory-mapped ring file per camera in
+    #              ring_dir (frame_ring.py); costs page cache instead of
+    #              heap and survives a restart
+    buffer_backing: str = os.getenv("SMART_BUFFER_BACKING", "memory").lower()
+    ring_dir: str = os.getenv("SMART_RING_DIR", "smart_buffers")
+    ring_file_mb: float = float(os.getenv("SMART_RING_FILE_MB", 256))
+    
+    # How the pre-event window is held:
+    #   "jpeg"     – one JPEG per frame in RAM; clips decode + re-encode them
+    #   "segments" – short encoded video segments in segment_spool_dir; clips
+    #                are the segments remuxed together (ffmpeg concat, -c copy)
+    buffer_mode: str = os.getenv("SMART_BUFFER_MODE", "jpeg").lower()
+    segment_seconds: float = 1.0
+    segment_spool_dir: str = os.path.join(tempfile.gettempdir(), "smart_segments")
+    # ffmpeg binary used to remux segments; without it clips fall back to a
+    # decode / re-encode of the segments
+    ffmpeg_bin: str = os.getenv("FFMPEG_BIN", "ffmpeg")
     
     #--- Output -----------------------------------
     output_dir: str = "smart_recordings"
@@ -60,6 +94,13 @@ class SmartRecordingConfig:
     #Target resolution for saved clips
     output_resolution: Optional[Tuple[int, int]] = None  #width, height
     
+    #Clips are written while the event runs.  An event longer than this
+    #rolls over into a new clip (part) linked by event_id.  0 = no limit
+    max_clip_seconds: float = float(os.getenv("SMART_MAX_CLIP_SECONDS", 300))
+    
+    #Event frames waiting for the clip writer thread before new ones are dropped
+    event_queue_size: int = int(os.getenv("SMART_EVENT_QUEUE_SIZE", 300))
+    
     
     #----- Cleanup ----------------------------------
     #Delete clips older than this many days 
@@ -83,8 +124,9 @@ class RecordingState(Enum):
 class BufferedFrame:
     """A single frame stored in the pre-event buffer.
     Storing JPEG bytes instead of raw numpy arrays cuts RAM USAGE BY ~10X
+    (a memoryview of the FramePacket's encoding, not a copy)
     """
-    jpeg_bytes: bytes
+    jpeg_bytes: memoryview
     timestamp: float
     has_detections: bool
     detections: List[dict]
@@ -93,6 +135,20 @@ class BufferedFrame:
         array = np.frombuffer(self.jpeg_bytes, dtype=np.uint8)
         return cv2.imdecode(array, cv2.IMREAD_COLOR)
     
+@dataclass
+class RingBufferedFrame(BufferedFrame):
+    """A BufferedFrame whose JPEG is a zero-copy view into a FrameRing.
+    The ring may overwrite it, so decode() returns None once it has."""
+    ring: Optional[FrameRing] = None
+    seq: int = 0
+    
+    def decode(self) -> Optional[np.ndarray]:
+        if not self.ring.is_current(self.seq):
+            return None
+        frame = super().decode()
+        # Re-check: the bytes may have been overwritten while decoding
+        return frame if self.ring.is_current(self.seq) else None
+    
 @dataclass
 class ClipRecord:
     """ 
@@ -112,6 +168,8 @@ class ClipRecord:
     frame_count : int 
     detection_count : int  #total detections across all frames
     event_classes : List[str]                  # unique class names detected 
+    event_id : str = ""                        # shared by all parts of one event
+    part : int = 1                             # 1, 2, ... when a long event rolls over
     
     
 class RollingFrameBuffer:  
@@ -126,18 +184,48 @@ class RollingFrameBuffer:
     • maxlen is computed from (fps × pre_event_seconds) so the buffer always
     covers exactly the requested look-back window regardless of camera FPS.
     • Thread-safe via a single threading.Lock().
+    • Bytes are counted as frames enter and leave (O(1) size_bytes) and
+    reported to the process-wide budget in buffer_memory.py; under
+    pressure the buffer lowers its JPEG quality, thins out idle pre-roll
+    and finally shrinks its window.
+    • With ring_path set, frames live in a memory-mapped FrameRing file
+    instead of the deque (off the heap, outside the memory budget) and
+    snapshot() returns zero-copy views into it.
     """
     
-    def __init__(self, fps: float, pre_event_seconds: float, jpeg_quality: int = 60):
+    def __init__(self, fps: float, pre_event_seconds: float, jpeg_quality: int = 60,
+                 pressure_jpeg_quality: int = 50, name: str = "buffer",
+                 ring_path: Optional[str] = None, ring_bytes: int = 0,
+                 ring_headroom: int = 0):
         self.fps = max(fps, 1.0)     #Guard against 0 fps
         self.pre_event_seconds = pre_event_seconds
         self.jpeg_quality = jpeg_quality
+        self.pressure_jpeg_quality = pressure_jpeg_quality
         
         #Compute how many frames fit in the pre-event window
         #add a 20% margin so we never run short due to fps jitter.
         maxlen = int(self.fps * pre_event_seconds * 1.2)+1
         self._buffer: Deque[BufferedFrame] = deque(maxlen=maxlen)
         self._lock = threading.Lock()
+        self._bytes = 0
+        self._skip_next = False
+        
+        self.ring: Optional[FrameRing] = None
+        self._ring_detections: Dict[int, List[dict]] = {}   # seq → detections
+        if ring_path:
+            try:
+                # Snapshot frames are views into the ring, so it holds twice
+                # the window plus the event queue before a slot is reused:
+                # the recorder drains the pre-roll long before it is overwritten
+                self.ring = FrameRing(ring_path, ring_bytes, slots=2 * maxlen + ring_headroom)
+            except (RingInUse, OSError, ValueError) as e:
+                logger.warning(f"RollingFrameBuffer: ring {ring_path} unavailable ({e}), using memory")
+        self._account = buffer_memory.open_account(name, degradable=self.ring is None)
+        
+        #Degradation counters (frames affected by memory pressure)
+        self.reduced_quality_frames = 0
+        self.decimated_frames = 0
+        self.shrunk_frames = 0
         
         logger.debug(
             f"RollingFrameBuffer: fps={fps}, pre={pre_event_seconds}s, "
@@ -146,30 +234,52 @@ class RollingFrameBuffer:
     
     
     #--------------------------- Public API ------------------------------------
-    def push(self, frame:np.ndarray, detections: Optional[List[Dict]] = None
-             ) -> BufferedFrame:
+    def push(self, frame: FramePacket | np.ndarray, detections: Optional[List[Dict]] = None,
+             idle: bool = False) -> Optional[BufferedFrame]:
         
         """Compress frame to Jpeg and append to the rolling buffer.
-        Returns the BufferedFrame that was stored.
+        A FramePacket that was already encoded at this quality (the stream
+        encode) is reused instead of encoding again.
+        Returns the BufferedFrame that was stored, or None if memory
+        pressure decimated this (idle, detection-free) frame.
         """
         detections = detections or []
+        pressure = self._account.pressure
+        if pressure >= Pressure.DECIMATE and idle and not detections:
+            self._skip_next = not self._skip_next
+            if self._skip_next:
+                self.decimated_frames += 1
+                return None
         
-        #Encode to JPEG for compact storage
-        encode_params = [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
-        ok, buf = cv2.imencode('.jpg', frame, encode_params)
-        if not ok:
-            #Fallback: use default quality
-            ok, buf = cv2.imencode('.jpg', frame)
+        if not isinstance(frame, FramePacket):
+            frame = FramePacket(frame)
+        quality = self.jpeg_quality
+        if pressure >= Pressure.REDUCE_QUALITY and self.pressure_jpeg_quality < quality:
+            quality = self.pressure_jpeg_quality
+            self.reduced_quality_frames += 1
+        if self.ring is not None:
+            return self._push_ring(frame.jpeg(quality), detections)
             
         bf = BufferedFrame(
-            jpeg_bytes=bytes(buf),
+            jpeg_bytes=frame.jpeg(quality),
             timestamp= time.time(),
             has_detections = len(detections) > 0,
             detections=detections,
         )
         
         with self._lock:
+            delta = len(bf.jpeg_bytes)
+            if len(self._buffer) == self._buffer.maxlen:
+                delta -= len(self._buffer[0].jpeg_bytes)   # evicted by append
             self._buffer.append(bf)
+            if pressure >= Pressure.SHRINK:
+                # Cut the window back to this buffer's share of the budget
+                share = self._account.fair_share
+                while len(self._buffer) > 1 and self._bytes + delta > share:
+                    delta -= len(self._buffer.popleft().jpeg_bytes)
+                    self.shrunk_frames += 1
+            self._bytes += delta
+        self._account.add(delta)
             
         return bf
             
@@ -178,25 +288,279 @@ class RollingFrameBuffer:
         Return a shallow copy of all frames currently in the buffer.
         Thread-safe; the returned list is a stable snapshot.
         """
+        if self.ring is not None:
+            return self._ring_snapshot()
         with self._lock:
             return list(self._buffer)
         
     def clear(self):
         """Empty the buffer (called after a clip is finalised)."""
+        if self.ring is not None:
+            with self._lock:
+                self.ring.clear()   # no-op once the ring is closed
+                self._ring_detections.clear()
+            return
         with self._lock:
             self._buffer.clear()
+            freed, self._bytes = self._bytes, 0
+        self._account.add(-freed)
+        
+    def close(self):
+        """Empty the buffer and give its share of the memory budget back.
+        A ring file keeps its frames for the next session of the camera."""
+        if self.ring is not None:
+            self.ring.close()
+        else:
+            self.clear()
+        buffer_memory.close_account(self._account)
             
     def __len__(self) -> int:
+        if self.ring is not None:
+            return len(self.ring)
         with self._lock:
             return len(self._buffer)
         
     @property
     def size_bytes(self) -> int:
-        """Approximate RAM used by stored JPEG bytes."""
+        """RAM used by stored JPEG bytes (kept as a running total).
+        For a ring: the bytes of the ring file holding live frames."""
+        if self.ring is not None:
+            return self.ring.live_bytes
+        return self._bytes
+    
+    @property
+    def window_seconds(self) -> float:
+        """Look-back currently covered (shorter than pre_event_seconds when shrunk)."""
+        if self.ring is not None:
+            oldest, newest = self.ring.window()
+            return newest - oldest
+        with self._lock:
+            if len(self._buffer) < 2:
+                return 0.0
+            return self._buffer[-1].timestamp - self._buffer[0].timestamp
+    
+    #--------------------------- Ring backing ----------------------------------
+    def _push_ring(self, jpeg: memoryview, detections: List[Dict]) -> RingBufferedFrame:
         with self._lock:
-            return sum(len(f.jpeg_bytes) for f in self._buffer)
+            entry = self.ring.append(jpeg, time.time(), has_detections=bool(detections))
+            if detections:
+                self._ring_detections[entry.seq] = detections
+            if len(self._ring_detections) > self._buffer.maxlen:
+                oldest = entry.seq - self._buffer.maxlen
+                for seq in [s for s in self._ring_detections if s <= oldest]:
+                    del self._ring_detections[seq]
+        return RingBufferedFrame(
+            jpeg_bytes=entry.data,
+            timestamp=entry.timestamp,
+            has_detections=entry.has_detections,
+            detections=detections,
+            ring=self.ring,
+            seq=entry.seq,
+        )
+    
+    def _ring_snapshot(self) -> List[RingBufferedFrame]:
+        # Frames older than the window (e.g. left in the file from before a
+        # long restart) are not pre-roll any more
+        since = time.time() - self.pre_event_seconds * 1.2
+        return [
+            RingBufferedFrame(
+                jpeg_bytes=entry.data,
+                timestamp=entry.timestamp,
+                has_detections=entry.has_detections,
+                detections=self._ring_detections.get(entry.seq, []),
+                ring=self.ring,
+                seq=entry.seq,
+            )
+            for entry in self.ring.entries(since=since)
+        ]
+    
+    def memory_stats(self) -> dict:
+        return {
+            "backing": "mmap" if self.ring is not None else "memory",
+            "ring": self.ring.get_stats() if self.ring is not None else None,
+            "mb": round(self._bytes / 1_048_576, 2),
+            "peak_mb": round(self._account.peak_bytes / 1_048_576, 2),
+            "pressure": self._account.pressure.name,
+            "window_seconds": round(self.window_seconds, 1),
+            "reduced_quality_frames": self.reduced_quality_frames,
+            "decimated_frames": self.decimated_frames,
+            "shrunk_frames": self.shrunk_frames,
+        }
         
         
+# ══════════════════════════════════════════════════════════════════════════════
+# SEGMENT RING BUFFER  (buffer_mode = "segments")
+# ══════════════════════════════════════════════════════════════════════════════
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class VideoSegment:
+    """
+    One short encoded video file (segment_seconds of frames) in the spool
+    directory.  The file is deleted as soon as nothing references the
+    segment any more: the ring dropped its frames and no clip still needs it.
+    """
+
+    def __init__(self, path: str, writer: cv2.VideoWriter, frame_size: Tuple[int, int]):
+        self.path = path
+        self.frame_size = frame_size
+        self.frames = 0
+        self.start_ts: Optional[float] = None
+        self.end_ts: Optional[float] = None
+        self.size_bytes = 0
+        self._writer: Optional[cv2.VideoWriter] = writer
+        weakref.finalize(self, _remove_quietly, path)
+
+    @property
+    def closed(self) -> bool:
+        return self._writer is None
+
+    def write(self, frame: np.ndarray, timestamp: float):
+        self._writer.write(frame)
+        self.frames += 1
+        if self.start_ts is None:
+            self.start_ts = timestamp
+        self.end_ts = timestamp
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.release()
+            self._writer = None
+            self.size_bytes = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+
+@dataclass
+class SegmentFrame:
+    """A frame in the segment ring: where it was encoded plus its detections."""
+    segment: VideoSegment
+    timestamp: float
+    has_detections: bool
+    detections: List[dict]
+
+
+class SegmentRingBuffer:
+    """
+    Drop-in alternative to RollingFrameBuffer that keeps the pre-event
+    window as short encoded video segments instead of one JPEG per frame.
+
+    Frames go straight into the open segment's VideoWriter (a new segment
+    every segment_seconds, so each starts on a keyframe).  The deque still
+    holds one small SegmentFrame per frame, which keeps the state machine
+    unchanged; segments live as long as any of their frames is referenced.
+    A clip is then just its segments remuxed together (ClipWriter), with
+    no JPEG decode / re-encode pass.
+    """
+
+    def __init__(self, fps: float, pre_event_seconds: float, config: SmartRecordingConfig):
+        self.fps = max(fps, 1.0)
+        self.pre_event_seconds = pre_event_seconds
+        self.config = config
+        self.frames_per_segment = max(1, round(self.fps * config.segment_seconds))
+        Path(config.segment_spool_dir).mkdir(parents=True, exist_ok=True)
+
+        maxlen = int(self.fps * pre_event_seconds * 1.2) + 1
+        self._buffer: Deque[SegmentFrame] = deque(maxlen=maxlen)
+        self._current: Optional[VideoSegment] = None
+        self._lock = threading.Lock()
+
+    # --------------------------- Public API ------------------------------------
+    def push(self, frame: FramePacket | np.ndarray, detections: Optional[List[Dict]] = None,
+             idle: bool = False) -> Optional[SegmentFrame]:
+        """Encode the frame into the open segment and append it to the ring."""
+        detections = detections or []
+        if isinstance(frame, FramePacket):
+            frame = frame.frame
+        if self.config.output_resolution and (frame.shape[1], frame.shape[0]) != tuple(self.config.output_resolution):
+            frame = cv2.resize(frame, tuple(self.config.output_resolution), interpolation=cv2.INTER_LINEAR)
+        frame_size = (frame.shape[1], frame.shape[0])
+        now = time.time()
+
+        with self._lock:
+            segment = self._current
+            if (segment is None or segment.frames >= self.frames_per_segment
+                    or segment.frame_size != frame_size):
+                if segment is not None:
+                    segment.close()
+                segment = self._current = self._open_segment(frame_size)
+                if segment is None:
+                    return None
+            segment.write(frame, now)
+
+            sf = SegmentFrame(
+                segment=segment,
+                timestamp=now,
+                has_detections=len(detections) > 0,
+                detections=detections,
+            )
+            self._buffer.append(sf)
+        return sf
+
+    def seal(self):
+        """Close the open segment so a clip can use it (next push starts a new one)."""
+        with self._lock:
+            if self._current is not None:
+                self._current.close()
+                self._current = None
+
+    def snapshot(self) -> List[SegmentFrame]:
+        with self._lock:
+            return list(self._buffer)
+
+    def clear(self):
+        with self._lock:
+            self._buffer.clear()
+            if self._current is not None:
+                self._current.close()
+                self._current = None
+
+    def close(self):
+        self.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._buffer)
+
+    @property
+    def size_bytes(self) -> int:
+        """Disk used by the segments the ring still references."""
+        with self._lock:
+            segments = {id(f.segment): f.segment for f in self._buffer}
+        return sum(
+            s.size_bytes if s.closed else (os.path.getsize(s.path) if os.path.exists(s.path) else 0)
+            for s in segments.values()
+        )
+
+    # --------------------------- Internals -------------------------------------
+    def _open_segment(self, frame_size: Tuple[int, int]) -> Optional[VideoSegment]:
+        path = os.path.join(self.config.segment_spool_dir, f"{uuid.uuid4().hex}.mp4")
+        writer = _open_video_writer(path, self.fps, frame_size, self.config.codec_priority)
+        if writer is None:
+            logger.error(f"SegmentRingBuffer: could not open a segment writer for {path}")
+            return None
+        return VideoSegment(path, writer, frame_size)
+
+
+def _open_video_writer(filepath: str, fps: float, frame_size: Tuple[int, int],
+                       codecs: List[str]) -> Optional[cv2.VideoWriter]:
+    """Try each codec in priority order; return first working writer."""
+    for codec in codecs:
+        try:
+            fourcc = cv2.VideoWriter_fourcc(*codec)
+            writer = cv2.VideoWriter(filepath, fourcc, fps, frame_size)
+            if writer.isOpened():
+                logger.debug(f"Using codec '{codec}' for {filepath}")
+                return writer
+            writer.release()
+        except Exception as e:
+            logger.debug(f"Codec '{codec}' failed: {e}")
+    return None
+
+
 # ══════════════════════════════════════════════════════════════════════════════
 # PER-SESSION STATE
 # ══════════════════════════════════════════════════════════════════════════════
@@ -213,7 +577,10 @@ class SmartSessionState:
       EVENT_ACTIVE  ◄──────────────────────── (new detection extends deadline)
           │  (post_event_seconds pass with no new detection)
           ▼
-      FINALIZING  →  background thread writes clip  →  IDLE
+      FINALIZING  →  event recorder closes the last clip  →  IDLE
+ 
+    Frames of an event are not accumulated here: they are handed to the
+    event's EventRecorder (created via open_recorder) as they arrive.
  
     All public methods are thread-safe.
     """
@@ -242,25 +609,50 @@ class SmartSessionState:
         # Wall-clock time of the last detection (deadline = this + post_event_seconds)
         self._last_event_time: Optional[float] = None
  
-        # ── Accumulators for the current event window ───────────────────────
-        # Frames that accumulate DURING the event (after the event starts)
-        self._event_frames: List[BufferedFrame] = []
-        self._pre_event_frames: List[BufferedFrame] = []
+        # ── Current event window ───────────────────────────────────────────
+        # Recorder writing the event; frames go to it, not into a list
+        self._recorder: Optional[EventRecorder] = None
+        self._event_frame_count: int = 0
         self._event_detection_count: int = 0
         self._event_classes: set = set()
         
         
         # Used only for logging detection pauses/resumes
         self._detection_paused_logged = False
+
+        # Motion gate in front of the detector (attached by the video hub)
+        self.motion_gate = None
+
+        # open_recorder(pre_event_frames) -> EventRecorder, set by
+        # SmartRecordingManager.init_session().  Without it events are
+        # tracked but not written.
+        self.open_recorder: Optional[Callable[[list], EventRecorder]] = None
+        # Set by close(); the buffer is released once no recorder reads it
+        self._closed = False
         
         
         
         # ── Rolling pre-event buffer ───────────────────────────────────────
-        self.buffer = RollingFrameBuffer(
-            fps=fps,
-            pre_event_seconds=config.pre_event_seconds,
-            jpeg_quality=config.buffer_jpeg_quality,
-        )
+        if config.buffer_mode == "segments":
+            self.buffer = SegmentRingBuffer(
+                fps=fps,
+                pre_event_seconds=config.pre_event_seconds,
+                config=config,
+            )
+        else:
+            self.buffer = RollingFrameBuffer(
+                fps=fps,
+                pre_event_seconds=config.pre_event_seconds,
+                jpeg_quality=config.buffer_jpeg_quality,
+                pressure_jpeg_quality=config.buffer_pressure_jpeg_quality,
+                name=session_id,
+                ring_path=(
+                    os.path.join(config.ring_dir, f"camera_{camera_id}.ring")
+                    if config.buffer_backing == "mmap" else None
+                ),
+                ring_bytes=int(config.ring_file_mb * 1024 * 1024),
+                ring_headroom=config.event_queue_size,
+            )
  
         # ── Statistics ─────────────────────────────────────────────────────
         self.clips_saved: int = 0
@@ -287,27 +679,31 @@ class SmartSessionState:
  
     # ── Core frame processing ─────────────────────────────────────────────
  
-    def process_frame(self, frame: np.ndarray,
+    def process_frame(self, frame: FramePacket | np.ndarray,
                       detections: Optional[List[Dict]] = None
-                      ) -> Optional[List[BufferedFrame]]:
+                      ) -> bool:
         """
         Main entry point.  Called for every frame from the WebSocket loop.
  
         1. Pushes the frame to the rolling buffer (always).
-        2. If detections are present, advances the state machine.
-        3. If no detections and we're in EVENT_ACTIVE past the deadline,
-           returns the complete list of frames to finalize into a clip.
+        2. If detections are present, advances the state machine; the first
+           one opens an event recorder seeded with the pre-event buffer.
+        3. Frames of an active event are handed to its recorder.
+        4. If no detections and we're in EVENT_ACTIVE past the deadline,
+           tells the recorder to finish the clip.
  
         Returns:
-            None              – normal operation, no clip ready yet
-            List[BufferedFrame] – clip is ready; these frames should be saved
+            True if this frame closed an event, False otherwise
         """
         detections = detections or []
  
         # Always push to rolling buffer first (even during an active event,
         # so the buffer stays current for the post-event tail)
-        bf = self.buffer.push(frame, detections)
+        bf = self.buffer.push(frame, detections, idle=self._state == RecordingState.IDLE)
+        if bf is None:
+            return False   # decimated idle frame, or no segment writer
  
+        closed_event = False
         with self._lock:
             now = time.time()
  
@@ -318,9 +714,10 @@ class SmartSessionState:
                 if self._state == RecordingState.IDLE:
                     self._state = RecordingState.EVENT_ACTIVE
                     self._event_start_time = now
-                    self._pre_event_frames = self.buffer.snapshot()
-                    
-                    self._event_frames = []
+                    # The snapshot ends with this frame, so it isn't fed again
+                    pre_event_frames = self.buffer.snapshot()
+                    self._recorder = self.open_recorder(pre_event_frames) if self.open_recorder else None
+                    self._event_frame_count = len(pre_event_frames)
                     self._event_detection_count = 0
                     self._event_classes = set()
                     self._detection_paused_logged = False
@@ -334,6 +731,9 @@ class SmartSessionState:
                         f"[SmartSession {self.session_id}] DETECTION RESUMED (merged)"
                     )
                     self._detection_paused_logged = False
+                    self._feed(bf)
+                else:
+                    self._feed(bf)
  
                 # Extend post-event deadline (this is the merge mechanism)
                 self._last_event_time = now
@@ -341,11 +741,8 @@ class SmartSessionState:
                 for d in detections:
                     self._event_classes.add(d.get("class_name", "unknown"))
  
-                # Accumulate this frame in the event window
-                self._event_frames.append(bf)
- 
             elif self._state == RecordingState.EVENT_ACTIVE:
-                self._event_frames.append(bf)
+                self._feed(bf)
 
                 if (
                     not self._detection_paused_logged
@@ -359,71 +756,94 @@ class SmartSessionState:
 
                 deadline = (self._last_event_time or 0) + self.config.post_event_seconds
                 if now >= deadline:
-                    # Post-event window closed → build clip and return it
+                    # Post-event window closed → recorder writes out the rest
                     self._state = RecordingState.FINALIZING
-                    clip_frames = self._build_clip_frames()
-                    return clip_frames  # caller will finalize asynchronously
+                    recorder = self._close_event()
+                    closed_event = True
  
-            # No clip ready yet
-            return None
+        if closed_event:
+            self._finish(recorder)
+        return closed_event
  
-    def finalize_done(self):
+    def finalize_done(self, clips: int = 1):
         """
-        Called by SmartRecordingManager after the clip has been written to disk.
-        Resets state back to IDLE.
+        Called by the event recorder after the last clip has been written
+        to disk.  Resets state back to IDLE.
         """
         with self._lock:
             self._state = RecordingState.IDLE
             self._event_start_time = None
             self._last_event_time = None
-            self._pre_event_frames = []
+            self._recorder = None
+            self._event_frame_count = 0
             self._event_detection_count = 0
             self._event_classes = set()
-            self.clips_saved += 1
+            self.clips_saved += clips
+            closed = self._closed
+        if closed:
+            # Session went away while the recorder was still reading the buffer
+            self.buffer.close()
+        else:
             # Clear the rolling buffer so the next clip starts fresh
             # (buffer will refill within pre_event_seconds of real time)
-        self.buffer.clear()
+            self.buffer.clear()
         logger.info(
             f"[SmartSession {self.session_id}] "
             f"STATE → IDLE (clips saved: {self.clips_saved})"
         )
  
-    def flush_active_event(self) -> Optional[List[BufferedFrame]]:
+    def flush_active_event(self) -> bool:
         """
         Force-finalize any active event (called on camera disconnect).
-        Returns clip frames or None if nothing was recording.
+        Returns False if nothing was recording.
         """
         with self._lock:
             if self._state != RecordingState.EVENT_ACTIVE:
-                return None
+                return False
             self._state = RecordingState.FINALIZING
-            return self._build_clip_frames()
- 
-    # ── Internal helpers ─────────────────────────────────────────────────
+            recorder = self._close_event()
+        self._finish(recorder)
+        return True
  
-    def _build_clip_frames(self) -> List[BufferedFrame]:
+    def close(self):
         """
-        Assemble the final ordered frame list:
-            [pre-event buffer frames] + [event frames accumulated during event]
- 
-        We filter the buffer to only include frames within the pre_event window
-        relative to _event_start_time, avoiding double-counting frames that
-        were pushed to both the buffer and _event_frames.
+        Release the buffer (and its ring file) now, or, while an event's
+        recorder is still reading zero-copy views of it, from finalize_done().
+        Call flush_active_event() first.
         """
+        with self._lock:
+            self._closed = True
+            busy = self._state != RecordingState.IDLE
+        if not busy:
+            self.buffer.close()
  
-        # _event_frames already contains from event_start onward (including
-        # post-event tail), so just concatenate
-        all_frames = self._pre_event_frames + self._event_frames
+    # ── Internal helpers ─────────────────────────────────────────────────
+ 
+    def _feed(self, frame):
+        """Hand an event frame to the recorder (caller holds the lock)."""
+        self._event_frame_count += 1
+        if self._recorder is not None:
+            self._recorder.feed(frame)
+ 
+    def _close_event(self) -> Optional[EventRecorder]:
+        """Log the finished event and return its recorder (caller holds the lock)."""
+        if isinstance(self.buffer, SegmentRingBuffer):
+            # The clip's last segment is still open
+            self.buffer.seal()
  
         logger.info(
             f"[SmartSession {self.session_id}] "
-            f"MERGED CLIP READY ({len(all_frames)} frames, "
-            f"(pre_frames={len(self._pre_event_frames)}, "
-            f"event_frames={len(self._event_frames)}, "
-            f"total_frames={len(all_frames)}, "
+            f"EVENT CLOSED ({self._event_frame_count} frames, "
             f"classes={list(self._event_classes)})"
-        )       
-        return all_frames
+        )
+        return self._recorder
+ 
+    def _finish(self, recorder: Optional[EventRecorder]):
+        """Let the recorder write out its queue; it calls finalize_done()."""
+        if recorder is not None:
+            recorder.finish()
+        else:
+            self.finalize_done(clips=0)
  
     def get_event_metadata(self) -> dict:
         """Return metadata about the current/last event window."""
@@ -439,6 +859,13 @@ class SmartSessionState:
                 "clips_saved": self.clips_saved,
                 "buffer_frames": len(self.buffer),
                 "buffer_mb": round(self.buffer.size_bytes / 1_048_576, 2),
+                "buffer_memory": (
+                    self.buffer.memory_stats()
+                    if isinstance(self.buffer, RollingFrameBuffer) else None
+                ),
+                "event_frames": self._event_frame_count,
+                "event_recorder": self._recorder.get_stats() if self._recorder else None,
+                "motion_gate": self.motion_gate.get_stats() if self.motion_gate else None,
             }
  
  
@@ -448,16 +875,34 @@ class SmartSessionState:
  
 class ClipWriter:
     """
-    Writes a list of BufferedFrames to an MP4 file on disk.
+    Writes BufferedFrames (or SegmentFrames) to MP4 files on disk.
  
-    Designed to run in a ThreadPoolExecutor so it never blocks the
-    async WebSocket event loop.
+    open() starts a clip that is written incrementally as frames are
+    added; write() is the one-shot form for a complete frame list.
+    Designed to run off the async WebSocket event loop.
     """
  
     def __init__(self, config: SmartRecordingConfig):
         self.config = config
         Path(config.output_dir).mkdir(parents=True, exist_ok=True)
  
+    def open(
+        self,
+        session_state: SmartSessionState,
+        camera_name: str = "camera",
+        segments: bool = False,
+        event_id: Optional[str] = None,
+        part: int = 1,
+    ) -> ClipPart:
+        """
+        Start a clip.  Part 1 of an event uses the event id as its clip id,
+        later parts (rollovers) append "-<part>".
+        """
+        event_id = event_id or str(uuid.uuid4())[:8]
+        clip_id = event_id if part == 1 else f"{event_id}-{part}"
+        part_cls = SegmentClipPart if segments else FrameClipPart
+        return part_cls(self, session_state, camera_name, clip_id, event_id, part)
+ 
     def write(
         self,
         frames: List[BufferedFrame],
@@ -471,127 +916,414 @@ class ClipWriter:
         if not frames:
             logger.warning("ClipWriter.write() called with empty frame list")
             return None
+        clip = self.open(session_state, camera_name, segments=isinstance(frames[0], SegmentFrame))
+        for frame in frames:
+            clip.add(frame)
+        return clip.close()
+ 
+    def _remux(self, segments: List[VideoSegment], filepath: str) -> bool:
+        """Concatenate segments with ffmpeg's concat demuxer, stream copy."""
+        ffmpeg = shutil.which(self.config.ffmpeg_bin)
+        if ffmpeg is None:
+            return False
+        list_path = filepath + ".txt"
+        try:
+            with open(list_path, "w") as f:
+                for segment in segments:
+                    f.write(f"file '{os.path.abspath(segment.path)}'\n")
+            result = subprocess.run(
+                [ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+                 "-i", list_path, "-c", "copy", "-movflags", "+faststart", filepath],
+                capture_output=True, timeout=120,
+            )
+            if result.returncode != 0:
+                logger.warning(f"ClipWriter: ffmpeg remux failed: {result.stderr.decode(errors='replace').strip()}")
+                return False
+            return True
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.warning(f"ClipWriter: ffmpeg remux failed: {e}")
+            return False
+        finally:
+            _remove_quietly(list_path)
  
-        # ── Determine output parameters ────────────────────────────────────
-        fps = self.config.output_fps or session_state.fps
-        fps = max(fps, 1.0)
- 
-        # Decode first valid frame to get resolution
-        sample_frame = None
-        for bf in frames:
-            sample_frame = bf.decode()
-            if sample_frame is not None:
-                break
-        if sample_frame is None:
-            logger.error("ClipWriter: All frames failed to decode")
-            return None
- 
-        if self.config.output_resolution:
-            width, height = self.config.output_resolution
-        else:
-            height, width = sample_frame.shape[:2]
+    def _reencode(self, segments: List[VideoSegment], filepath: str, fps: float) -> bool:
+        """Fallback without ffmpeg: decode the segments and write them again."""
+        writer = self._open_writer(filepath, fps, segments[0].frame_size)
+        if writer is None:
+            return False
+        try:
+            for segment in segments:
+                capture = cv2.VideoCapture(segment.path)
+                while True:
+                    ok, frame = capture.read()
+                    if not ok:
+                        break
+                    if (frame.shape[1], frame.shape[0]) != segments[0].frame_size:
+                        frame = cv2.resize(frame, segments[0].frame_size, interpolation=cv2.INTER_LINEAR)
+                    writer.write(frame)
+                capture.release()
+        finally:
+            writer.release()
+        return True
  
-        frame_size = (width, height)
+    def _open_writer(self, filepath: str, fps: float,
+                     frame_size: Tuple[int, int]) -> Optional[cv2.VideoWriter]:
+        """Try each codec in priority order; return first working writer."""
+        return _open_video_writer(filepath, fps, frame_size, self.config.codec_priority)
  
-        # ── Build output filepath ──────────────────────────────────────────
-        clip_id = str(uuid.uuid4())[:8]
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{camera_name}_event_{ts}_{clip_id}.mp4"
-        filepath = os.path.join(self.config.output_dir, filename)
-        logger.info(f"SAVING TO: {os.path.abspath(filepath)}")
  
-        # ── Open VideoWriter with codec fallback ───────────────────────────
-        writer = self._open_writer(filepath, fps, frame_size)
-        if writer is None:
-            logger.error(f"ClipWriter: Could not open VideoWriter for {filepath}")
-            return None
+class ClipPart:
+    """
+    One MP4 being written.  Frames are added in order; close() finishes
+    the file and returns its ClipRecord (None on failure).  Not thread-safe:
+    one writer thread owns a part.
+    """
  
-        # ── Write frames ───────────────────────────────────────────────────
-        written = 0
-        detection_count = 0
-        event_classes: set = set()
-        encode_params = [cv2.IMWRITE_JPEG_QUALITY, self.config.output_jpeg_quality]
+    def __init__(self, clip_writer: ClipWriter, session_state: SmartSessionState,
+                 camera_name: str, clip_id: str, event_id: str, part: int):
+        self.clip_writer = clip_writer
+        self.config = clip_writer.config
+        self.session_state = session_state
+        self.clip_id = clip_id
+        self.event_id = event_id
+        self.part = part
+        self.fps = max(self.config.output_fps or session_state.fps, 1.0)
  
-        for bf in frames:
-            try:
-                frame = bf.decode()
-                if frame is None:
-                    continue
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.filename = f"{camera_name}_event_{ts}_{clip_id}.mp4"
+        self.filepath = os.path.join(self.config.output_dir, self.filename)
  
-                # Resize if necessary
-                if frame.shape[1] != width or frame.shape[0] != height:
-                    frame = cv2.resize(frame, frame_size, interpolation=cv2.INTER_LINEAR)
+        self.frames_written = 0
+        self.detection_count = 0
+        self.event_classes: set = set()
+        self.started_at: Optional[float] = None
+        self.ended_at: Optional[float] = None
  
-                # Ensure BGR
-                if len(frame.shape) == 2:
-                    frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
-                elif frame.shape[2] == 4:
-                    frame = cv2.cvtColor(frame, cv2.COLOR_RGBA2BGR)
+    @property
+    def duration(self) -> float:
+        return self.frames_written / self.fps
  
-                writer.write(frame)
-                written += 1
+    def add(self, frame):
+        raise NotImplementedError
  
-                if bf.has_detections:
-                    detection_count += len(bf.detections)
-                    for d in bf.detections:
-                        event_classes.add(d.get("class_name", "unknown"))
+    def rollover_due(self, frame, max_seconds: float) -> bool:
+        """True if this part is full and `frame` should start the next one."""
+        return max_seconds > 0 and self.duration >= max_seconds
  
-            except Exception as e:
-                logger.warning(f"ClipWriter: Frame write error: {e}")
-                continue
+    def close(self) -> Optional[ClipRecord]:
+        raise NotImplementedError
  
-        writer.release()
+    def _count(self, frame):
+        if frame.has_detections:
+            self.detection_count += len(frame.detections)
+            for d in frame.detections:
+                self.event_classes.add(d.get("class_name", "unknown"))
  
-        # ── Validate output ────────────────────────────────────────────────
-        file_size = os.path.getsize(filepath) if os.path.exists(filepath) else 0
+    def _record(self) -> Optional[ClipRecord]:
+        file_size = os.path.getsize(self.filepath) if os.path.exists(self.filepath) else 0
         if file_size == 0:
-            logger.error(f"ClipWriter: Output file is empty: {filepath}")
+            logger.error(f"ClipWriter: Output file is empty: {self.filepath}")
             return None
+        storage_ledger.file_added(self.filepath, file_size, self.session_state.user_id)
  
-        duration = written / fps if fps > 0 else 0
-        started_at = datetime.fromtimestamp(frames[0].timestamp)
-        ended_at = datetime.fromtimestamp(frames[-1].timestamp)
- 
+        duration = self.duration
         record = ClipRecord(
-            clip_id=clip_id,
-            session_id=session_state.session_id,
-            camera_id=session_state.camera_id,
-            user_id=session_state.user_id,
-            filepath=filepath,
-            filename=filename,
-            started_at=started_at,
-            ended_at=ended_at,
+            clip_id=self.clip_id,
+            session_id=self.session_state.session_id,
+            camera_id=self.session_state.camera_id,
+            user_id=self.session_state.user_id,
+            filepath=self.filepath,
+            filename=self.filename,
+            started_at=datetime.fromtimestamp(self.started_at),
+            ended_at=datetime.fromtimestamp(self.ended_at),
             duration_seconds=round(duration, 2),
             file_size_bytes=file_size,
-            frame_count=written,
-            detection_count=detection_count,
-            event_classes=sorted(event_classes),
+            frame_count=self.frames_written,
+            detection_count=self.detection_count,
+            event_classes=sorted(self.event_classes),
+            event_id=self.event_id,
+            part=self.part,
         )
- 
         logger.info(
-            f"✅ Clip saved: {filename} "
-            f"({written} frames, {duration:.1f}s, "
+            f"✅ Clip saved: {self.filename} "
+            f"(part {self.part}, {self.frames_written} frames, {duration:.1f}s, "
             f"{file_size/1_048_576:.2f}MB, "
-            f"classes={sorted(event_classes)})"
+            f"classes={sorted(self.event_classes)})"
         )
         return record
  
-    def _open_writer(self, filepath: str, fps: float,
-                     frame_size: Tuple[int, int]) -> Optional[cv2.VideoWriter]:
-        """Try each codec in priority order; return first working writer."""
-        for codec in self.config.codec_priority:
-            try:
-                fourcc = cv2.VideoWriter_fourcc(*codec)
-                writer = cv2.VideoWriter(filepath, fourcc, fps, frame_size)
-                if writer.isOpened():
-                    logger.debug(f"ClipWriter: Using codec '{codec}'")
-                    return writer
-                writer.release()
-            except Exception as e:
-                logger.debug(f"ClipWriter: Codec '{codec}' failed: {e}")
-        return None
  
+class FrameClipPart(ClipPart):
+    """JPEG-buffer clips: decode each frame and feed the VideoWriter right away."""
  
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._writer: Optional[cv2.VideoWriter] = None
+        self._frame_size: Optional[Tuple[int, int]] = None
+        self._failed = False
+        self.frames_lost = 0   # undecodable, or overwritten in a ring before we got to them
+ 
+    def add(self, bf: BufferedFrame):
+        if self._failed:
+            return
+        try:
+            frame = bf.decode()
+            if frame is None:
+                self.frames_lost += 1
+                return
+ 
+            if self._writer is None:
+                # First decodable frame fixes the resolution
+                if self.config.output_resolution:
+                    self._frame_size = tuple(self.config.output_resolution)
+                else:
+                    self._frame_size = (frame.shape[1], frame.shape[0])
+                logger.info(f"SAVING TO: {os.path.abspath(self.filepath)}")
+                self._writer = self.clip_writer._open_writer(self.filepath, self.fps, self._frame_size)
+                if self._writer is None:
+                    logger.error(f"ClipWriter: Could not open VideoWriter for {self.filepath}")
+                    self._failed = True
+                    return
+ 
+            # Resize if necessary
+            if (frame.shape[1], frame.shape[0]) != self._frame_size:
+                frame = cv2.resize(frame, self._frame_size, interpolation=cv2.INTER_LINEAR)
+ 
+            # Ensure BGR
+            if len(frame.shape) == 2:
+                frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+            elif frame.shape[2] == 4:
+                frame = cv2.cvtColor(frame, cv2.COLOR_RGBA2BGR)
+ 
+            self._writer.write(frame)
+            self.frames_written += 1
+            if self.started_at is None:
+                self.started_at = bf.timestamp
+            self.ended_at = bf.timestamp
+            self._count(bf)
+ 
+        except Exception as e:
+            logger.warning(f"ClipWriter: Frame write error: {e}")
+ 
+    def close(self) -> Optional[ClipRecord]:
+        if self.frames_lost:
+            logger.warning(
+                f"ClipWriter: {self.frames_lost} frames of {self.filename} could not be "
+                f"read (corrupt, or overwritten in the buffer ring) and were left out"
+            )
+        if self._writer is None:
+            if not self._failed:
+                logger.error("ClipWriter: All frames failed to decode")
+            return None
+        self._writer.release()
+        self._writer = None
+        return self._record()
+ 
+ 
+class SegmentClipPart(ClipPart):
+    """
+    Segment-buffer clips: collect the segments as their frames arrive and
+    remux them into one MP4 on close (ffmpeg stream copy, no decode).
+    Without ffmpeg the segments are decoded and re-encoded instead.
+    """
+ 
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._segments: List[VideoSegment] = []
+ 
+    def add(self, sf: SegmentFrame):
+        if not self._segments or self._segments[-1] is not sf.segment:
+            self._segments.append(sf.segment)
+        self._count(sf)
+ 
+    def rollover_due(self, sf: SegmentFrame, max_seconds: float) -> bool:
+        # Parts end on segment boundaries; every segment before sf's is closed
+        return (
+            max_seconds > 0
+            and bool(self._segments)
+            and self._segments[-1] is not sf.segment
+            and self._duration_with_last() >= max_seconds
+        )
+ 
+    def _duration_with_last(self) -> float:
+        return sum(s.frames for s in self._segments) / self.fps
+ 
+    def close(self) -> Optional[ClipRecord]:
+        segments = [s for s in self._segments if s.closed and s.frames]
+        self._segments = []
+        if not segments:
+            logger.error("ClipWriter: no closed segments to write")
+            return None
+ 
+        logger.info(f"SAVING TO: {os.path.abspath(self.filepath)} ({len(segments)} segments)")
+        if not (self.clip_writer._remux(segments, self.filepath)
+                or self.clip_writer._reencode(segments, self.filepath, self.fps)):
+            logger.error(f"ClipWriter: could not write {self.filepath}")
+            return None
+ 
+        self.frames_written = sum(s.frames for s in segments)
+        self.started_at = segments[0].start_ts
+        self.ended_at = segments[-1].end_ts
+        return self._record()
+ 
+ 
+# ══════════════════════════════════════════════════════════════════════════════
+# EVENT RECORDER  (streams one event to disk while it happens)
+# ══════════════════════════════════════════════════════════════════════════════
+ 
+_STOP = object()   # queue sentinel: recorder thread exits after draining
+ 
+ 
+def _frame_bytes(frame) -> int:
+    """RAM held by a queued frame (segment and ring frames live on disk)."""
+    if isinstance(frame, RingBufferedFrame) or not isinstance(frame, BufferedFrame):
+        return 0
+    return len(frame.jpeg_bytes)
+ 
+ 
+class EventRecorder:
+    """
+    Writes one detection event incrementally on its own thread.
+ 
+    The thread first drains the pre-event snapshot, then consumes event
+    frames from a bounded queue as process_frame() hands them over, so an
+    event only ever holds the pre-event window plus the queue in memory,
+    however long it runs.  Once a clip reaches max_clip_seconds it is
+    closed and the event continues in a new part (same event_id).
+ 
+    on_clip(record) is called for every finished part, on_done(parts)
+    once after the last one.
+    """
+ 
+    def __init__(
+        self,
+        clip_writer: ClipWriter,
+        session_state: SmartSessionState,
+        camera_name: str,
+        pre_event_frames: list,
+        on_clip: Callable[[ClipRecord], None],
+        on_done: Callable[[int], None],
+    ):
+        self.clip_writer = clip_writer
+        self.session_state = session_state
+        self.camera_name = camera_name
+        self.config = clip_writer.config
+        self.event_id = str(uuid.uuid4())[:8]
+        self._pending: Deque = deque(pre_event_frames)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, self.config.event_queue_size))
+        self._on_clip = on_clip
+        self._on_done = on_done
+        self._finished = False
+        # Queued JPEGs count against the buffer budget but are never degraded
+        self._account = buffer_memory.open_account(f"{session_state.session_id}/event", degradable=False)
+        self._account.add(sum(_frame_bytes(f) for f in self._pending))
+ 
+        # Statistics
+        self.frames_queued = len(self._pending)
+        self.dropped_frames = 0
+        self.parts = 0
+        self.clips_saved = 0
+        self.max_queue_depth = 0
+ 
+        self._thread = threading.Thread(
+            target=self._run, name=f"smart_event_{self.event_id}", daemon=True
+        )
+        self._thread.start()
+ 
+    def feed(self, frame):
+        """Queue one event frame.  Never blocks; a full queue drops the frame."""
+        if self._finished:
+            return
+        try:
+            self._queue.put_nowait(frame)
+            self.frames_queued += 1
+            self._account.add(_frame_bytes(frame))
+        except queue.Full:
+            self.dropped_frames += 1
+            if self.dropped_frames == 1:
+                logger.warning(
+                    f"[SmartSession {self.session_state.session_id}] event writer "
+                    f"falling behind, dropping frames (queue={self._queue.maxsize})"
+                )
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+ 
+    def finish(self):
+        """No more frames: write out what is queued, close the last part."""
+        if self._finished:
+            return
+        self._finished = True
+        self._queue.put(_STOP)
+ 
+    def get_stats(self) -> dict:
+        return {
+            "event_id": self.event_id,
+            "parts": self.parts,
+            "frames_queued": self.frames_queued,
+            "queue_depth": self._queue.qsize(),
+            "max_queue_depth": self.max_queue_depth,
+            "queue_capacity": self._queue.maxsize,
+            "dropped_frames": self.dropped_frames,
+            "queued_mb": round(self._account.bytes / 1_048_576, 2),
+        }
+ 
+    def _frames(self):
+        while self._pending:
+            frame = self._pending.popleft()
+            self._account.add(-_frame_bytes(frame))
+            yield frame
+        while True:
+            frame = self._queue.get()
+            if frame is _STOP:
+                return
+            self._account.add(-_frame_bytes(frame))
+            yield frame
+ 
+    def _run(self):
+        clip: Optional[ClipPart] = None
+        try:
+            for frame in self._frames():
+                if clip is None:
+                    clip = self._open_part(frame)
+                elif clip.rollover_due(frame, self.config.max_clip_seconds):
+                    self._close_part(clip)
+                    logger.info(
+                        f"[SmartSession {self.session_state.session_id}] "
+                        f"clip reached {self.config.max_clip_seconds}s, rolling over "
+                        f"(event {self.event_id}, part {self.parts + 1})"
+                    )
+                    clip = self._open_part(frame)
+                clip.add(frame)
+            if clip is not None:
+                self._close_part(clip)
+        except Exception as e:
+            logger.error(f"Clip finalisation error: {e}", exc_info=True)
+        finally:
+            buffer_memory.close_account(self._account)
+            # Always reset the state machine, even on failure
+            self._on_done(self.clips_saved)
+ 
+    def _open_part(self, frame) -> ClipPart:
+        self.parts += 1
+        return self.clip_writer.open(
+            self.session_state,
+            self.camera_name,
+            segments=isinstance(frame, SegmentFrame),
+            event_id=self.event_id,
+            part=self.parts,
+        )
+ 
+    def _close_part(self, clip: ClipPart):
+        record = clip.close()
+        if record is None:
+            return
+        self.clips_saved += 1
+        try:
+            self._on_clip(record)
+        except Exception as e:
+            logger.error(f"Clip handler failed for {record.filename}: {e}")
+ 
+ 
+
 # ══════════════════════════════════════════════════════════════════════════════
 # BACKGROUND DB WRITER
 # ══════════════════════════════════════════════════════════════════════════════
@@ -621,8 +1353,11 @@ def _save_clip_to_db(clip: ClipRecord, db_session_factory) -> bool:
                 started_at=clip.started_at,
                 ended_at=clip.ended_at,
                 is_scheduled=False,      # event-driven, not schedule-driven
-                # store event classes in the filename field as context
-                # (the existing schema has no free-form metadata column)
+                is_smart_clip=True,
+                event_classes=clip.event_classes,
+                # parts of one long event share event_id
+                event_id=clip.event_id or clip.clip_id,
+                event_part=clip.part,
             )
             db.add(recording)
             db.commit()
@@ -656,8 +1391,9 @@ class StorageCleanup:
          until we're back under the limit.
     """
  
-    def __init__(self, config: SmartRecordingConfig):
+    def __init__(self, config: SmartRecordingConfig, db_session_factory=None):
         self.config = config
+        self._db_factory = db_session_factory  # to find clip owners for the storage ledger
         self._lock = threading.Lock()
  
     def run(self) -> dict:
@@ -685,8 +1421,7 @@ class StorageCleanup:
             for clip in clips:
                 age = now - clip.stat().st_mtime
                 if age > age_limit:
-                    size = clip.stat().st_size
-                    clip.unlink(missing_ok=True)
+                    size = self._delete(clip)
                     freed += size
                     deleted += 1
                     logger.info(f"Cleanup (age): deleted {clip.name}")
@@ -701,8 +1436,7 @@ class StorageCleanup:
             for clip in clips:
                 if total <= cap:
                     break
-                size = clip.stat().st_size
-                clip.unlink(missing_ok=True)
+                size = self._delete(clip)
                 total -= size
                 freed += size
                 deleted += 1
@@ -714,6 +1448,34 @@ class StorageCleanup:
             "freed_mb": round(freed / 1_048_576, 2),
         }
  
+    def _delete(self, clip: Path) -> int:
+        """Delete one clip and take its bytes off its owner in the storage ledger."""
+        size = clip.stat().st_size
+        clip.unlink(missing_ok=True)
+        storage_ledger.file_removed(str(clip), size, self._owner(clip))
+        return size
+ 
+    def _owner(self, clip: Path) -> Optional[int]:
+        """user_id of the Recording row for this clip (None if unknown)."""
+        if self._db_factory is None:
+            return None
+        from database import Recording   # local import to avoid circular deps
+        db = self._db_factory()
+        try:
+            rows = db.query(Recording.storage_path, Recording.user_id).filter(
+                Recording.filename == clip.name
+            ).all()
+            target = os.path.abspath(clip)
+            for path, user_id in rows:
+                if path and os.path.abspath(path) == target:
+                    return user_id
+            return None
+        except Exception as e:
+            logger.warning(f"Cleanup: could not look up owner of {clip.name}: {e}")
+            return None
+        finally:
+            db.close()
+ 
  
 # ══════════════════════════════════════════════════════════════════════════════
 # SMART RECORDING MANAGER  (the public API used by app.py)
@@ -729,6 +1491,7 @@ class SmartRecordingManager:
                                              fps, camera_name)
         smart_recording_manager.push_frame(session_id, frame, detections)
         smart_recording_manager.close_session(session_id)
+        smart_recording_manager.attach_motion_gate(session_id, gate)
         smart_recording_manager.get_status(session_id)
         smart_recording_manager.get_all_statuses()
         smart_recording_manager.run_cleanup()
@@ -738,27 +1501,22 @@ class SmartRecordingManager:
         self,
         config: Optional[SmartRecordingConfig] = None,
         db_session_factory=None,
-        max_workers: int = 4,
     ):
         """
         Args:
             config:              SmartRecordingConfig (uses defaults if None)
             db_session_factory:  Callable → SQLAlchemy Session (SessionLocal)
-            max_workers:         Thread pool size for background clip writes
         """
         self.config = config or SmartRecordingConfig()
         self._db_factory = db_session_factory  # set later via set_db_factory()
-        self._executor = ThreadPoolExecutor(
-            max_workers=max_workers,
-            thread_name_prefix="smart_rec"
-        )
         self._sessions: Dict[str, SmartSessionState] = {}
         self._camera_names: Dict[str, str] = {}       # session_id → camera_name
         self._sessions_lock = threading.Lock()
         self._clip_writer = ClipWriter(self.config)
-        self._cleanup = StorageCleanup(self.config)
+        self._cleanup = StorageCleanup(self.config, db_session_factory)
  
         Path(self.config.output_dir).mkdir(parents=True, exist_ok=True)
+        storage_ledger.add_category("smart_recordings", self.config.output_dir)
         logger.info(
             f"SmartRecordingManager initialised "
             f"(output={self.config.output_dir}, "
@@ -769,6 +1527,7 @@ class SmartRecordingManager:
     def set_db_factory(self, factory):
         """Inject the database session factory (called from app.py startup)."""
         self._db_factory = factory
+        self._cleanup._db_factory = factory
         logger.info("SmartRecordingManager: DB factory injected")
  
     # ── Session lifecycle ─────────────────────────────────────────────────
@@ -792,11 +1551,16 @@ class SmartRecordingManager:
             camera_name: Used in output filenames
         """
         with self._sessions_lock:
-            if session_id in self._sessions:
+            previous = self._sessions.get(session_id)
+            if previous is not None:
                 logger.warning(
                     f"SmartRecordingManager: session {session_id} already exists, "
                     "reinitialising"
                 )
+                # Finish the old event like close_session does, or its
+                # recorder would wait for frames forever
+                previous.flush_active_event()
+                previous.close()
  
             state = SmartSessionState(
                 session_id=session_id,
@@ -805,6 +1569,7 @@ class SmartRecordingManager:
                 fps=fps,
                 config=self.config,
             )
+            state.open_recorder = functools.partial(self._open_recorder, state, camera_name)
             self._sessions[session_id] = state
             self._camera_names[session_id] = camera_name
  
@@ -826,23 +1591,31 @@ class SmartRecordingManager:
         if state is None:
             return
  
-        # If there's an active event, flush it to disk
-        clip_frames = state.flush_active_event()
-        if clip_frames:
+        # If there's an active event, its recorder finishes the clip
+        if state.flush_active_event():
             logger.info(
                 f"SmartRecordingManager: flushing active event on close "
-                f"for session {session_id}"
+                f"for {camera_name} (session {session_id})"
             )
-            self._submit_clip(clip_frames, state, camera_name)
+        state.close()
  
-        logger.info(f"SmartRecordingManager: session closed ({session_id})")
+        logger.info(f"SmartRecordingManager: session closed for {camera_name} ({session_id})")
  
+    def attach_motion_gate(self, session_id: str, gate) -> bool:
+        """Expose a session's motion gate state through get_status()."""
+        with self._sessions_lock:
+            state = self._sessions.get(session_id)
+        if state is None:
+            return False
+        state.motion_gate = gate
+        return True
+
     # ── Core frame ingestion ──────────────────────────────────────────────
  
     def push_frame(
         self,
         session_id: str,
-        frame: np.ndarray,
+        frame: FramePacket | np.ndarray,
         detections: Optional[List[Dict]] = None,
     ) -> bool:
         """
@@ -859,7 +1632,8 @@ class SmartRecordingManager:
  
         Args:
             session_id:  Current WebSocket session
-            frame:       BGR numpy frame (with detections drawn if desired)
+            frame:       BGR numpy frame (with detections drawn if desired), or
+                         a FramePacket so an existing encode can be reused
             detections:  List of detection dicts from yolo_detector.detect()
  
         Returns:
@@ -871,14 +1645,9 @@ class SmartRecordingManager:
         if state is None:
             return False
  
-        # Delegate to state machine; returns frames if a clip is ready
-        clip_frames = state.process_frame(frame, detections)
- 
-        if clip_frames is not None:
-            # Clip is ready → write asynchronously in background thread
-            camera_name = self._camera_names.get(session_id, "camera")
-            self._submit_clip(clip_frames, state, camera_name)
- 
+        # Delegate to state machine; event frames are streamed to disk by
+        # the session's event recorder
+        state.process_frame(frame, detections)
         return True
  
     # ── Status queries ────────────────────────────────────────────────────
@@ -915,15 +1684,12 @@ class SmartRecordingManager:
         return result
  
     def get_storage_stats(self) -> dict:
-        """Return storage usage statistics for smart_recordings directory."""
+        """Storage usage of the smart_recordings directory (from the storage ledger)."""
         output_dir = Path(self.config.output_dir)
-        if not output_dir.exists():
-            return {"total_clips": 0, "total_bytes": 0, "total_mb": 0.0}
- 
-        clips = list(output_dir.glob("*.mp4"))
-        total_bytes = sum(c.stat().st_size for c in clips)
+        usage = storage_ledger.usage("smart_recordings")
+        total_bytes = usage["bytes"]
         return {
-            "total_clips": len(clips),
+            "total_clips": usage["files"],
             "total_bytes": total_bytes,
             "total_mb": round(total_bytes / 1_048_576, 2),
             "output_dir": str(output_dir.resolve()),
@@ -931,37 +1697,23 @@ class SmartRecordingManager:
  
     # ── Internal helpers ──────────────────────────────────────────────────
  
-    def _submit_clip(
-        self,
-        frames: List[BufferedFrame],
-        state: SmartSessionState,
-        camera_name: str,
-    ):
-        """
-        Submit clip writing to the thread pool executor.
-        Never blocks the calling async loop.
-        """
-        # Capture references needed inside the thread
-        db_factory = self._db_factory
-        writer = self._clip_writer
- 
-        def _task():
-            try:
-                clip = writer.write(frames, state, camera_name)
-                if clip and db_factory:
-                    _save_clip_to_db(clip, db_factory)
-            except Exception as e:
-                logger.error(f"Clip finalisation error: {e}", exc_info=True)
-            finally:
-                # Always reset the state machine, even on failure
-                state.finalize_done()
- 
-        self._executor.submit(_task)
-        logger.debug(
-            f"SmartRecordingManager: clip task submitted for session "
-            f"{state.session_id} ({len(frames)} frames)"
+    def _open_recorder(self, state: SmartSessionState, camera_name: str,
+                       pre_event_frames: list) -> EventRecorder:
+        """Start the writer for a new event (called by the session's state machine)."""
+        return EventRecorder(
+            clip_writer=self._clip_writer,
+            session_state=state,
+            camera_name=camera_name,
+            pre_event_frames=pre_event_frames,
+            on_clip=self._clip_saved,
+            on_done=state.finalize_done,
         )
  
+    def _clip_saved(self, clip: ClipRecord):
+        """Runs on the recorder thread for every finished clip (part)."""
+        if self._db_factory:
+            _save_clip_to_db(clip, self._db_factory)
+ 
  
 # ══════════════════════════════════════════════════════════════════════════════
 # GLOBAL INSTANCE
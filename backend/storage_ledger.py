@@ -0,0 +1,367 @@
+"""
+Storage Ledger - Incremental byte / file accounting for the media directories
+
+Every code path that writes or deletes a recording, clip, screenshot or
+detection crop reports it here, so storage stats are an O(1) read instead
+of an rglob + stat over hundreds of thousands of files.
+
+Counters are kept per category (one per media directory) and per user
+(user 0 = not attributable), persisted to the storage_usage table every
+flush_interval seconds, and corrected by a low-priority background scan
+every reconcile_interval seconds:
+  - category totals are reset to what is actually on disk
+  - for recordings / smart clips, per-user bytes are re-attributed from the
+    Recording rows that point at the files found
+  - anything else that drifted is absorbed by the user-0 bucket
+
+    with storage_ledger.tracked_write(path, user_id):
+        cv2.imwrite(path, image)
+    storage_ledger.remove_file(path, user_id)
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STORAGE_LEDGER_FLUSH_SECONDS = float(os.getenv("STORAGE_LEDGER_FLUSH_SECONDS", 30))
+STORAGE_RECONCILE_HOURS = float(os.getenv("STORAGE_RECONCILE_HOURS", 6))
+STORAGE_RECONCILE_YIELD_EVERY = int(os.getenv("STORAGE_RECONCILE_YIELD_EVERY", 500))   # dir entries
+STORAGE_RECONCILE_YIELD_SECONDS = float(os.getenv("STORAGE_RECONCILE_YIELD_SECONDS", 0.01))
+
+UNATTRIBUTED = 0
+
+# Categories whose files have Recording rows (storage_path, user_id)
+OWNED_CATEGORIES = ("recordings", "smart_recordings")
+
+
+def _stat_size(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return None
+
+
+class StorageLedger:
+    def __init__(
+        self,
+        categories: Optional[Dict[str, str]] = None,
+        flush_interval: float = STORAGE_LEDGER_FLUSH_SECONDS,
+        reconcile_interval: float = STORAGE_RECONCILE_HOURS * 3600,
+    ):
+        """
+        Args:
+            categories:         category name → directory
+            flush_interval:     Seconds between persisting changed counters
+            reconcile_interval: Seconds between background disk scans
+        """
+        self.flush_interval = flush_interval
+        self.reconcile_interval = reconcile_interval
+
+        self._lock = threading.Lock()
+        self._roots: Dict[str, str] = {}                      # abs dir → category
+        self._usage: Dict[Tuple[str, int], list] = {}         # (category, user) → [bytes, files]
+        self._dirty: set = set()
+        self._db_factory = None
+        self._stop = threading.Event()
+        self._reconcile_now = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Statistics
+        self.updates = 0
+        self.flushes = 0
+        self.reconciles = 0
+        self.last_reconcile_at: Optional[datetime] = None
+        self.last_reconcile_seconds = 0.0
+        self.last_reconcile_drift_bytes = 0
+
+        for name, directory in (categories or {}).items():
+            self.add_category(name, directory)
+
+    # ── Setup ─────────────────────────────────────────────────────────────
+
+    def add_category(self, name: str, directory: str):
+        with self._lock:
+            self._roots = {d: c for d, c in self._roots.items() if c != name}
+            self._roots[os.path.abspath(directory)] = name
+
+    def set_db_factory(self, factory):
+        """Inject the database session factory (called from app.py startup)."""
+        self._db_factory = factory
+
+    def start(self):
+        """Load persisted counters and start the flush / reconcile thread."""
+        loaded = self._load()
+        if not loaded:
+            self._reconcile_now.set()      # first run: build counters from disk
+        self._thread = threading.Thread(target=self._run, name="storage_ledger", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._reconcile_now.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._persist()
+
+    # ── Recording changes ─────────────────────────────────────────────────
+
+    def category_of(self, path: str) -> Optional[str]:
+        path = os.path.abspath(path)
+        for root, category in self._roots.items():
+            if path == root or path.startswith(root + os.sep):
+                return category
+        return None
+
+    def record(self, path: str, bytes_delta: int, files_delta: int, user_id: Optional[int] = None):
+        category = self.category_of(path)
+        if category is None or (bytes_delta == 0 and files_delta == 0):
+            return
+        key = (category, user_id or UNATTRIBUTED)
+        with self._lock:
+            counters = self._usage.setdefault(key, [0, 0])
+            counters[0] += bytes_delta
+            counters[1] += files_delta
+            self._dirty.add(key)
+            self.updates += 1
+
+    def file_added(self, path: str, size: Optional[int] = None, user_id: Optional[int] = None):
+        """A new file was finished at `path` (size is stat'ed if not given)."""
+        if size is None:
+            size = _stat_size(path)
+            if size is None:
+                return
+        self.record(path, size, 1, user_id)
+
+    def file_removed(self, path: str, size: int, user_id: Optional[int] = None):
+        """The caller already deleted `path`, which was `size` bytes."""
+        self.record(path, -size, -1, user_id)
+
+    @contextmanager
+    def tracked_write(self, path: str, user_id: Optional[int] = None):
+        """Account for whatever the body does to `path` (create or overwrite)."""
+        before = _stat_size(path)
+        try:
+            yield
+        finally:
+            after = _stat_size(path)
+            self.record(
+                path,
+                (after or 0) - (before or 0),
+                (after is not None) - (before is not None),
+                user_id,
+            )
+
+    def remove_file(self, path: str, user_id: Optional[int] = None) -> int:
+        """Delete `path` if it exists and account for it; returns bytes freed."""
+        size = _stat_size(path)
+        if size is None:
+            return 0
+        os.remove(path)
+        self.file_removed(path, size, user_id)
+        return size
+
+    # ── Reading ───────────────────────────────────────────────────────────
+
+    def usage(self, category: Optional[str] = None, user_id: Optional[int] = None) -> dict:
+        """Bytes / files, optionally narrowed to one category and/or user."""
+        total_bytes = total_files = 0
+        with self._lock:
+            for (cat, uid), (b, f) in self._usage.items():
+                if category is not None and cat != category:
+                    continue
+                if user_id is not None and uid != user_id:
+                    continue
+                total_bytes += b
+                total_files += f
+        return {"bytes": max(total_bytes, 0), "files": max(total_files, 0)}
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            categories = sorted(set(self._roots.values()))
+            dirty = len(self._dirty)
+        return {
+            "categories": {c: self.usage(c) for c in categories},
+            "updates": self.updates,
+            "flushes": self.flushes,
+            "dirty_counters": dirty,
+            "reconciles": self.reconciles,
+            "last_reconcile_at": self.last_reconcile_at,
+            "last_reconcile_seconds": round(self.last_reconcile_seconds, 2),
+            "last_reconcile_drift_bytes": self.last_reconcile_drift_bytes,
+        }
+
+    def request_reconcile(self):
+        """Ask the background thread to rescan soon."""
+        self._reconcile_now.set()
+
+    # ── Reconciliation ────────────────────────────────────────────────────
+
+    def reconcile(self) -> dict:
+        """Rescan every category directory and correct the counters."""
+        started = time.perf_counter()
+        with self._lock:
+            roots = dict(self._roots)
+
+        owners = self._recording_owners()
+        drift = 0
+        for root, category in roots.items():
+            scanned_bytes, scanned_files, per_user = self._scan(root, owners)
+            with self._lock:
+                keys = [k for k in self._usage if k[0] == category]
+                old_bytes = sum(self._usage[k][0] for k in keys)
+                if category in OWNED_CATEGORIES and owners is not None:
+                    # Absolute per-user values from the Recording rows
+                    for key in keys:
+                        self._usage[key] = [0, 0]
+                    for uid, (b, f) in per_user.items():
+                        self._usage[(category, uid)] = [b, f]
+                else:
+                    # Per-user increments stand; user 0 absorbs the drift
+                    old_files = sum(self._usage[k][1] for k in keys)
+                    counters = self._usage.setdefault((category, UNATTRIBUTED), [0, 0])
+                    counters[0] += scanned_bytes - old_bytes
+                    counters[1] += scanned_files - old_files
+                self._dirty.update(k for k in self._usage if k[0] == category)
+            drift += abs(scanned_bytes - old_bytes)
+
+        elapsed = time.perf_counter() - started
+        self.reconciles += 1
+        self.last_reconcile_at = datetime.utcnow()
+        self.last_reconcile_seconds = elapsed
+        self.last_reconcile_drift_bytes = drift
+        logger.info(f"Storage ledger reconciled in {elapsed:.1f}s (drift {drift / 1_048_576:.2f}MB)")
+        self._persist()
+        return self.get_stats()
+
+    def _scan(self, root: str, owners: Optional[Dict[str, int]]):
+        """Walk `root` with os.scandir, yielding the CPU now and then."""
+        total_bytes = total_files = seen = 0
+        per_user: Dict[int, list] = {}
+        stack = [root]
+        while stack and not self._stop.is_set():
+            try:
+                entries = os.scandir(stack.pop())
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    seen += 1
+                    if seen % STORAGE_RECONCILE_YIELD_EVERY == 0:
+                        time.sleep(STORAGE_RECONCILE_YIELD_SECONDS)
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                            continue
+                        if not entry.is_file(follow_symlinks=False):
+                            continue
+                        size = entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        continue
+                    total_bytes += size
+                    total_files += 1
+                    if owners is not None:
+                        uid = owners.get(os.path.abspath(entry.path), UNATTRIBUTED)
+                        counters = per_user.setdefault(uid, [0, 0])
+                        counters[0] += size
+                        counters[1] += 1
+        return total_bytes, total_files, per_user
+
+    def _recording_owners(self) -> Optional[Dict[str, int]]:
+        """abs storage_path → user_id for every Recording row."""
+        if self._db_factory is None:
+            return None
+        from database import Recording   # local import to avoid circular deps
+        db = self._db_factory()
+        try:
+            return {
+                os.path.abspath(path): uid or UNATTRIBUTED
+                for path, uid in db.query(Recording.storage_path, Recording.user_id)
+                if path
+            }
+        except Exception as e:
+            logger.warning(f"Storage ledger: could not load recording owners: {e}")
+            return None
+        finally:
+            db.close()
+
+    # ── Persistence ───────────────────────────────────────────────────────
+
+    def _load(self) -> bool:
+        if self._db_factory is None:
+            return False
+        from database import StorageUsage
+        db = self._db_factory()
+        try:
+            rows = db.query(StorageUsage).all()
+            with self._lock:
+                for row in rows:
+                    self._usage[(row.category, row.user_id)] = [row.bytes, row.files]
+            return bool(rows)
+        except Exception as e:
+            logger.warning(f"Storage ledger: could not load counters: {e}")
+            return False
+        finally:
+            db.close()
+
+    def _persist(self):
+        if self._db_factory is None:
+            return
+        with self._lock:
+            dirty = {key: list(self._usage[key]) for key in self._dirty}
+            self._dirty.clear()
+        if not dirty:
+            return
+
+        from database import StorageUsage
+        db = self._db_factory()
+        try:
+            now = datetime.utcnow()
+            for (category, uid), (b, f) in dirty.items():
+                db.merge(StorageUsage(category=category, user_id=uid, bytes=b, files=f, updated_at=now))
+            db.commit()
+            self.flushes += 1
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Storage ledger: persist failed: {e}")
+            with self._lock:
+                self._dirty.update(dirty)
+        finally:
+            db.close()
+
+    def _run(self):
+        try:
+            # Low priority: this thread only does bookkeeping and disk scans
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+
+        next_reconcile = time.monotonic() + self.reconcile_interval
+        while not self._stop.is_set():
+            self._reconcile_now.wait(self.flush_interval)
+            if self._stop.is_set():
+                break
+            if self._reconcile_now.is_set() or time.monotonic() >= next_reconcile:
+                self._reconcile_now.clear()
+                try:
+                    self.reconcile()
+                except Exception as e:
+                    logger.error(f"Storage ledger reconcile failed: {e}")
+                next_reconcile = time.monotonic() + self.reconcile_interval
+            else:
+                self._persist()
+
+
+# Global instance
+# Call storage_ledger.set_db_factory(SessionLocal) then start() in app.py startup.
+storage_ledger = StorageLedger({
+    "recordings": "recordings",
+    "screenshots": "screenshots",
+    "detections": "detections",
+})
@@ -0,0 +1,95 @@
+"""
+Stream Protocol - Binary wire format for /ws/video frames
+
+Clients opt in by sending {"type": "set_transport", "mode": "binary"}.
+The server answers with a {"type": "transport", ...} message describing the
+layout below, then sends every frame as one binary WebSocket message:
+
+    header     20 bytes  <BBHIdf   version, flags, detection_count,
+                                   seq, timestamp (unix s), fps
+    detections 17 bytes  <Bf4HI    class_id, confidence, x1, y1, x2, y2,
+               × detection_count   track_id (0 = not tracked)
+    jpeg       remaining bytes
+
+All integers are little-endian.  FLAG_FRESH_DETECTIONS is set when the
+detections come from a detector run on this very frame (JSON
+"detection_data"); otherwise they are the cached boxes
+(JSON "cached_detection_data").
+
+Clients that never negotiate keep receiving the JSON/base64 messages.
+"""
+
+import struct
+from typing import Dict, List, Optional
+
+PROTOCOL_VERSION = 2
+
+TRANSPORT_JSON = "json"
+TRANSPORT_BINARY = "binary"
+TRANSPORTS = (TRANSPORT_JSON, TRANSPORT_BINARY)
+
+FRAME_HEADER = struct.Struct("<BBHIdf")
+DETECTION_RECORD = struct.Struct("<Bf4HI")
+
+FLAG_FRESH_DETECTIONS = 0x01
+
+_U16_MAX = 0xFFFF
+
+
+def _clamp_u16(value) -> int:
+    return min(max(int(value), 0), _U16_MAX)
+
+
+def pack_frame(seq: int, timestamp: float, fps: float, jpeg,
+               detections: Optional[List[Dict]] = None,
+               fresh: bool = False) -> bytes:
+    """
+    Build one binary frame message.
+
+    Args:
+        seq:        Frame sequence number from the capture slot
+        timestamp:  Capture time of the frame (unix seconds)
+        fps:        Camera FPS reported to the client
+        jpeg:       Encoded JPEG (bytes, memoryview or numpy buffer)
+        detections: Detection dicts as returned by yolo_detector.detect()
+        fresh:      True if the detections were produced on this frame
+    """
+    detections = detections or []
+    flags = FLAG_FRESH_DETECTIONS if fresh else 0
+
+    parts = [FRAME_HEADER.pack(
+        PROTOCOL_VERSION,
+        flags,
+        len(detections),
+        seq & 0xFFFFFFFF,
+        timestamp,
+        fps,
+    )]
+    for det in detections:
+        b = det["bbox"]
+        parts.append(DETECTION_RECORD.pack(
+            det.get("class_id", 0) & 0xFF,
+            det.get("confidence", 0.0),
+            _clamp_u16(b["x1"]),
+            _clamp_u16(b["y1"]),
+            _clamp_u16(b["x2"]),
+            _clamp_u16(b["y2"]),
+            det.get("track_id", 0) & 0xFFFFFFFF,
+        ))
+    parts.append(jpeg)
+    return b"".join(parts)
+
+
+def describe(class_names: Dict[int, str]) -> dict:
+    """Negotiation reply telling the client how to decode binary frames."""
+    return {
+        "type": "transport",
+        "mode": TRANSPORT_BINARY,
+        "version": PROTOCOL_VERSION,
+        "header_size": FRAME_HEADER.size,
+        "header_format": FRAME_HEADER.format,
+        "detection_size": DETECTION_RECORD.size,
+        "detection_format": DETECTION_RECORD.format,
+        "flags": {"fresh_detections": FLAG_FRESH_DETECTIONS},
+        "classes": {str(k): v for k, v in class_names.items()},
+    }
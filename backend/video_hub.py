@@ -0,0 +1,529 @@
+"""
+Video Hub - One capture/detect/encode pipeline per camera session,
+fanned out to any number of WebSocket viewers.
+
+With HEADLESS_INGEST on (the default) a hub is started when its camera
+connects and keeps detecting and recording with nobody watching; viewers
+only subscribe to its output, and the stream JPEG is skipped while there
+are none.  With it off, the pipeline runs only while someone is watching.
+
+Each viewer gets a small bounded queue.  When a viewer falls behind, the
+oldest queued packet is dropped instead of stalling the shared pipeline.
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import cv2
+
+import stream_protocol
+from frame_packet import FramePacket
+from pipeline_executor import pipeline_executors
+from detection_scheduler import detection_scheduler
+from motion_gate import MotionGate
+from object_tracker import ObjectTracker
+from database import SessionLocal, Recording
+from yolo_detector import yolo_detector
+from recording_manager import recording_manager
+from smart_recording_manager import smart_recording_manager
+from scheduler_service import scheduler_service
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DETECTION_INTERVAL = int(os.getenv("DETECTION_INTERVAL", 3))  # Run detection every N frames
+# Server-side detection is per camera, not per viewer: it feeds the
+# detection sink and smart recording whether or not anyone is watching.
+# Viewers can only hide boxes or raise the threshold for themselves.
+DETECTION_ENABLED = os.getenv("DETECTION_ENABLED", "true").lower() == "true"
+DETECTION_CONFIDENCE = float(os.getenv("DETECTION_CONFIDENCE", 0.5))
+HEADLESS_INGEST = os.getenv("HEADLESS_INGEST", "true").lower() == "true"
+SUBSCRIBER_QUEUE_SIZE = 2     # Packets buffered per viewer before dropping
+# Same value as SmartRecordingConfig.buffer_jpeg_quality by default, so the
+# pre-event buffer reuses the stream encode of unannotated frames
+STREAM_JPEG_QUALITY = int(os.getenv("STREAM_JPEG_QUALITY", 75))
+
+
+# ==================== PACKETS & SUBSCRIBERS ====================
+
+@dataclass
+class StreamPacket:
+    """
+    One processed frame, shared read-only by every viewer of a session.
+    The JSON and binary encodings are built lazily, at most once each,
+    so the cost depends on which transports are in use, not on viewer count.
+    """
+    seq: int
+    timestamp: float
+    fps: float
+    jpeg: memoryview                          # shared with the FramePacket
+    detections: Optional[List[Dict]] = None   # fresh detections on this frame
+    cached: Optional[List[Dict]] = None       # boxes to draw (tracked)
+    _json_text: Optional[str] = field(default=None, repr=False)
+    _binary: Optional[bytes] = field(default=None, repr=False)
+    _views: Dict = field(default_factory=dict, repr=False)
+
+    def for_viewer(self, show_detections: bool, min_confidence: float) -> "StreamPacket":
+        """
+        This packet as one viewer sees it: boxes hidden, or those below the
+        viewer's threshold removed.  Variants are built once per setting and
+        share the JPEG; unfiltered viewers get the packet itself.
+        """
+        if show_detections and min_confidence <= 0:
+            return self
+        key = min_confidence if show_detections else None
+        view = self._views.get(key)
+        if view is None:
+            def keep(boxes):
+                if not show_detections or not boxes:
+                    return []
+                return [d for d in boxes if d.get("confidence", 0.0) >= min_confidence]
+
+            detections, cached = keep(self.detections), keep(self.cached)
+            if len(detections) == len(self.detections or []) and len(cached) == len(self.cached or []):
+                view = self
+            else:
+                view = StreamPacket(self.seq, self.timestamp, self.fps, self.jpeg, detections, cached)
+            self._views[key] = view
+        return view
+
+    def json_message(self) -> dict:
+        message = {
+            "frame": base64.b64encode(self.jpeg).decode('utf-8'),
+            "fps": self.fps,
+            "timestamp": self.timestamp
+        }
+        if self.detections:
+            message["detections"] = len(self.detections)
+            message["detection_data"] = self.detections  # Send full detection data
+        if self.cached:
+            message["cached_detections"] = len(self.cached)
+            message["cached_detection_data"] = self.cached  # Send cached detection data
+        return message
+
+    def json_text(self) -> str:
+        if self._json_text is None:
+            self._json_text = json.dumps(self.json_message(), separators=(",", ":"))
+        return self._json_text
+
+    def binary_frame(self) -> bytes:
+        if self._binary is None:
+            fresh = bool(self.detections)
+            self._binary = stream_protocol.pack_frame(
+                self.seq,
+                self.timestamp,
+                self.fps,
+                self.jpeg,
+                self.detections if fresh else self.cached,
+                fresh=fresh,
+            )
+        return self._binary
+
+
+@dataclass
+class Subscriber:
+    """A single viewer's bounded mailbox."""
+    queue: asyncio.Queue = field(
+        default_factory=lambda: asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    )
+    dropped: int = 0
+    delivered: int = 0
+    # This viewer's box filter (set from the client's toggle_detection)
+    show_detections: bool = True
+    min_confidence: float = 0.0
+
+    def offer(self, packet: Optional[StreamPacket]):
+        """Enqueue without blocking; evict the oldest packet if full."""
+        while True:
+            try:
+                self.queue.put_nowait(packet)
+                return
+            except asyncio.QueueFull:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except asyncio.QueueEmpty:
+                    pass
+
+    async def get(self) -> Optional[StreamPacket]:
+        """Wait for the next packet.  None means the stream has ended."""
+        packet = await self.queue.get()
+        if packet is None:
+            return None
+        self.delivered += 1
+        return packet.for_viewer(self.show_detections, self.min_confidence)
+
+
+# ==================== HUB ====================
+
+class VideoHub:
+    """
+    Runs the per-frame pipeline for one camera session exactly once and
+    broadcasts the result.
+
+    Detection settings are hub-wide: a toggle from any viewer applies to
+    everyone watching the same camera.
+    """
+
+    def __init__(self, session_id: str, camera_session, camera_id: int,
+                 camera_name: str, user_id: int,
+                 on_detections: Optional[Callable] = None):
+        self.session_id = session_id
+        self.camera_session = camera_session
+        self.camera_id = camera_id
+        self.camera_name = camera_name
+        self.user_id = user_id
+        self.on_detections = on_detections
+
+        self.detection_enabled = DETECTION_ENABLED
+        self.detection_confidence = DETECTION_CONFIDENCE
+        self.motion_gate = MotionGate()
+        self.scene_changed = True      # last motion gate result, reused until the next check
+        self.tracker = ObjectTracker()
+
+        self._subscribers: List[Subscriber] = []
+        self._task: Optional[asyncio.Task] = None
+        self._stop_requested = False
+        self.headless = False          # keep running with no viewers
+        self.frames_processed = 0
+        self.frames_streamed = 0
+
+    # ── Viewers ───────────────────────────────────────────────────────────
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Run the pipeline headless: it keeps going with no viewers attached."""
+        self.headless = True
+        self._ensure_running()
+        logger.info(f"[Hub {self.session_id}] Headless ingest started")
+
+    async def stop(self, timeout: float = 5.0):
+        """Stop the pipeline and wait for it to close its recordings."""
+        self._stop_requested = True
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+        except Exception:
+            pass
+
+    def _ensure_running(self):
+        if not self.is_running:
+            self._stop_requested = False
+            self._task = asyncio.create_task(self._run())
+
+    def subscribe(self) -> Subscriber:
+        """Register a viewer and make sure the pipeline is running."""
+        subscriber = Subscriber()
+        self._subscribers.append(subscriber)
+        self._ensure_running()
+        logger.info(
+            f"[Hub {self.session_id}] Viewer joined "
+            f"(viewers: {len(self._subscribers)})"
+        )
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        """Remove a viewer.  Unless headless, the pipeline stops with the last one."""
+        if subscriber in self._subscribers:
+            self._subscribers.remove(subscriber)
+        logger.info(
+            f"[Hub {self.session_id}] Viewer left "
+            f"(viewers: {len(self._subscribers)}, dropped: {subscriber.dropped})"
+        )
+
+    def get_stats(self) -> dict:
+        return {
+            "session_id": self.session_id,
+            "camera_id": self.camera_id,
+            "running": self.is_running,
+            "headless": self.headless,
+            "viewers": len(self._subscribers),
+            "frames_processed": self.frames_processed,
+            "frames_streamed": self.frames_streamed,
+            "dropped_per_viewer": [s.dropped for s in self._subscribers],
+            "motion_gate": self.motion_gate.get_stats(),
+            "tracker": self.tracker.get_stats(),
+        }
+
+    # ── Pipeline ──────────────────────────────────────────────────────────
+
+    def start_scheduled_recording(self):
+        """
+        Start recording if a schedule for this camera is currently active.
+        Called when the pipeline starts and from the scheduler thread when a
+        schedule window opens.
+        """
+        if not scheduler_service.get_active_schedule(self.camera_id):
+            return
+        if recording_manager.is_recording(self.session_id):
+            return
+
+        logger.info(f"Active scheduled recording detected for camera {self.camera_id}")
+        filepath = recording_manager.start_recording(
+            self.session_id,
+            self.camera_session.fps,
+            self.camera_session.frame_size,
+            self.camera_name,
+            user_id=self.user_id
+        )
+        if not filepath:
+            return
+
+        db = SessionLocal()
+        try:
+            db.add(Recording(
+                filename=os.path.basename(filepath),
+                format="mp4",
+                storage_path=filepath,
+                camera_id=self.camera_id,
+                user_id=self.user_id,
+                started_at=datetime.utcnow(),
+                is_scheduled=True  # Mark as scheduled
+            ))
+            db.commit()
+            logger.info(f"Scheduled recording started for camera {self.camera_id}")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error saving scheduled recording: {e}")
+        finally:
+            db.close()
+
+    @staticmethod
+    def _encode_stream(packet: FramePacket) -> memoryview:
+        return packet.jpeg(STREAM_JPEG_QUALITY)
+
+    def _record(self, packet: FramePacket, cached: List[Dict], detections: Optional[List[Dict]]):
+        """Recording side: draw boxes, feed the smart buffer and any active recording."""
+        session_id = self.session_id
+        recording_packet = packet
+        if cached:
+            # Draw tracked boxes on a copy; it needs its own encodings
+            recording_packet = FramePacket(
+                yolo_detector.draw_detections(packet.frame, cached), packet.timestamp
+            )
+
+        # Smart event driven recording (reuses the stream JPEG when unannotated)
+        smart_recording_manager.push_frame(session_id, recording_packet, detections)
+
+        if recording_manager.is_recording(session_id):
+            recording_manager.write_frame(session_id, recording_packet.frame)
+
+    async def _process_frame(self, frame, seq: int, timestamp: float) -> Optional[StreamPacket]:
+        """
+        Annotate, detect, encode and record one frame off the event loop.
+        `timestamp` is the capture time from the frame slot; it is what the
+        overlay, recordings and stream header carry.
+        Returns None when nobody is watching (no stream encode).
+        """
+        stages = pipeline_executors
+        streaming = bool(self._subscribers)
+
+        # YOLO Detection - run every N frames, and only when the motion gate
+        # sees change (checked before the timestamp overlay is drawn).
+        # Frames from all sessions are batched by the detection scheduler.
+        # Between checks the last gate result decides hold() vs predict().
+        if self.detection_enabled and self.frames_processed % DETECTION_INTERVAL == 0:
+            self.scene_changed = await stages.encode.run(self.motion_gate.check, frame)
+            run_detection = self.scene_changed
+        else:
+            run_detection = False
+
+        cv2.putText(frame,
+                    datetime.fromtimestamp(timestamp).strftime("%H:%M:%S.%f")[:-3],
+                    (20, 40),
+                    cv2.FONT_HERSHEY_SIMPLEX,
+                    1,
+                    (0, 255, 0),
+                    2)
+        packet = FramePacket(frame, timestamp)
+
+        # Detection runs in parallel with the stream encode
+        buffer = None
+        if run_detection and streaming:
+            buffer, detections = await asyncio.gather(
+                stages.encode.run(self._encode_stream, packet),
+                detection_scheduler.detect(frame, self.detection_confidence),
+            )
+        elif run_detection:
+            detections = await detection_scheduler.detect(frame, self.detection_confidence)
+        else:
+            if streaming:
+                buffer = await stages.encode.run(self._encode_stream, packet)
+            detections = []
+
+        # Tracked boxes: matched on detection frames, extrapolated in between
+        if not self.detection_enabled:
+            cached = []
+        elif run_detection:
+            cached = self.tracker.update(detections)
+        elif not self.scene_changed:
+            cached = self.tracker.hold()
+        else:
+            cached = self.tracker.predict()
+
+        if detections and self.on_detections:
+            # Non-blocking: the sink queues rows and writes them in batches
+            self.on_detections(self.camera_id, detections, frame)
+
+        await stages.record.run(
+            self._record,
+            packet,
+            cached,
+            detections if self.detection_enabled else None,
+        )
+
+        if buffer is None:
+            return None
+        return StreamPacket(
+            seq=seq,
+            timestamp=packet.timestamp,
+            fps=self.camera_session.fps,
+            jpeg=buffer,
+            detections=detections,
+            cached=cached,
+        )
+
+    def _broadcast(self, packet: Optional[StreamPacket]):
+        for subscriber in list(self._subscribers):
+            subscriber.offer(packet)
+
+    async def _run(self):
+        camera_session = self.camera_session
+        logger.info(f"[Hub {self.session_id}] Pipeline started for camera {self.camera_id}")
+
+        await asyncio.to_thread(self.start_scheduled_recording)
+        smart_recording_manager.init_session(
+            session_id=self.session_id,
+            camera_id=self.camera_id,
+            user_id=self.user_id,
+            fps=camera_session.fps,
+            camera_name=self.camera_name
+        )
+        self.motion_gate.reset()
+        self.scene_changed = True
+        smart_recording_manager.attach_motion_gate(self.session_id, self.motion_gate)
+
+        last_seq = 0  # sequence number of the last frame taken from the slot
+        try:
+            while (camera_session.is_running and camera_session.connected
+                   and not self._stop_requested and (self.headless or self._subscribers)):
+                slot = await camera_session.read_slot()
+                if slot is None or slot.seq == last_seq:
+                    await asyncio.sleep(0.005)
+                    continue
+                last_seq = slot.seq
+
+                try:
+                    packet = await self._process_frame(slot.frame, slot.seq, slot.timestamp)
+                except Exception as e:
+                    logger.error(f"[Hub {self.session_id}] Error processing frame: {e}")
+                    await asyncio.sleep(0.01)
+                    continue
+
+                self.frames_processed += 1
+                if packet is not None:
+                    self.frames_streamed += 1
+                    self._broadcast(packet)
+
+        except Exception as e:
+            logger.error(f"[Hub {self.session_id}] Stream error: {e}")
+        finally:
+            # Wake every remaining viewer so its socket can close cleanly
+            self._broadcast(None)
+            smart_recording_manager.close_session(self.session_id)
+            self.tracker.clear()
+            logger.info(
+                f"[Hub {self.session_id}] Pipeline stopped for camera {self.camera_id} "
+                f"(running={camera_session.is_running}, connected={camera_session.connected}, "
+                f"stop_requested={self._stop_requested})"
+            )
+
+
+# ==================== HUB MANAGER ====================
+
+class VideoHubManager:
+    def __init__(self):
+        self.hubs: Dict[str, VideoHub] = {}
+        self._on_detections: Optional[Callable] = None
+
+    def set_detection_handler(self, handler: Callable):
+        """
+        Inject the detection persistence callback (called from app.py startup).
+        It is called on the event loop and must not block.
+        """
+        self._on_detections = handler
+
+    def get_or_create(self, session_id: str, camera_session, camera) -> VideoHub:
+        """Return the hub for a session, creating it on first use."""
+        hub = self.hubs.get(session_id)
+        if hub is None or hub.camera_session is not camera_session:
+            hub = VideoHub(
+                session_id=session_id,
+                camera_session=camera_session,
+                camera_id=camera.id,
+                camera_name=camera.name,
+                user_id=camera.user_id,
+                on_detections=self._on_detections,
+            )
+            self.hubs[session_id] = hub
+        return hub
+
+    def get_hub(self, session_id: str) -> Optional[VideoHub]:
+        return self.hubs.get(session_id)
+
+    def start_ingest(self, session_id: str, camera_session, camera) -> VideoHub:
+        """
+        Called when a camera connects: run its pipeline headless so detection
+        and recording don't depend on a browser being attached.
+        """
+        # Drop finished hubs of earlier sessions of the same camera
+        for other_id, other in list(self.hubs.items()):
+            if other.camera_id == camera.id and other_id != session_id and not other.is_running:
+                self.hubs.pop(other_id, None)
+
+        hub = self.get_or_create(session_id, camera_session, camera)
+        if HEADLESS_INGEST:
+            hub.start()
+        return hub
+
+    async def stop(self, session_id: str):
+        """Stop a session's pipeline (camera disconnect / delete) and forget it."""
+        hub = self.hubs.pop(session_id, None)
+        if hub is not None:
+            await hub.stop()
+
+    async def stop_all(self):
+        await asyncio.gather(*(self.stop(session_id) for session_id in list(self.hubs)))
+
+    def remove(self, session_id: str):
+        self.hubs.pop(session_id, None)
+
+    def start_scheduled_recording(self, camera_id: int):
+        """
+        Scheduler hook (runs on the scheduler thread): a schedule window just
+        opened, so start recording on the camera's pipeline if it is running.
+        Otherwise the pipeline picks it up when it starts.
+        """
+        for hub in list(self.hubs.values()):
+            if hub.camera_id == camera_id and hub.is_running:
+                hub.start_scheduled_recording()
+                return
+
+    def get_all_stats(self) -> List[dict]:
+        return [hub.get_stats() for hub in self.hubs.values()]
+
+
+# Global instance
+video_hub_manager = VideoHubManager()
@@ -1,31 +1,105 @@
-# 🔐 PyTorch 2.6+ SAFE YOLO LOADING (COMPLETE FIX)
-import torch
-from ultralytics.nn.tasks import DetectionModel
-from torch.nn.modules.container import Sequential
-
-# Allow required YOLO globals
-torch.serialization.add_safe_globals([
-    DetectionModel,
-    Sequential
-])
-
-# --------------------------------------------------
-
-from ultralytics import YOLO
 import cv2
 import numpy as np
-from typing import List, Dict
+from typing import List, Dict, Optional
 import logging
 from datetime import datetime
 import os
 
+from storage_ledger import storage_ledger
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Inference backend: "torch" (ultralytics) or "onnx" (onnxruntime, CPU)
+YOLO_BACKEND = os.getenv("YOLO_BACKEND", "torch").lower()
+YOLO_ONNX_PATH = os.getenv("YOLO_ONNX_PATH", "")
+YOLO_ONNX_THREADS = int(os.getenv("YOLO_ONNX_THREADS", 0))
+YOLO_IMGSZ = int(os.getenv("YOLO_IMGSZ", 640))
+
+
+def _load_torch_yolo(model_path: str):
+    # 🔐 PyTorch 2.6+ SAFE YOLO LOADING (COMPLETE FIX)
+    # Imported here so the ONNX backend never pays for importing torch
+    import torch
+    from ultralytics import YOLO
+    from ultralytics.nn.tasks import DetectionModel
+    from torch.nn.modules.container import Sequential
+
+    # Allow required YOLO globals
+    torch.serialization.add_safe_globals([
+        DetectionModel,
+        Sequential
+    ])
+    return YOLO(model_path)
+
+
+def _export_onnx(model_path: str, onnx_path: str, imgsz: int) -> str:
+    """Export the .pt model to ONNX once; later starts reuse the cached file."""
+    if os.path.exists(onnx_path) and (
+        not os.path.exists(model_path)
+        or os.path.getmtime(onnx_path) >= os.path.getmtime(model_path)
+    ):
+        return onnx_path
+
+    logger.info(f"Exporting {model_path} → ONNX (imgsz={imgsz})...")
+    exported = _load_torch_yolo(model_path).export(
+        format="onnx", imgsz=imgsz, dynamic=True, simplify=False
+    )
+    if os.path.abspath(exported) != os.path.abspath(onnx_path):
+        os.replace(exported, onnx_path)
+    return onnx_path
+
+
+class DetectionArrays:
+    """
+    Struct-of-arrays detection result for one frame.
+    Serialise with to_dicts() only when per-box dicts are actually needed.
+    """
+    __slots__ = ("class_ids", "confidences", "boxes")
+
+    def __init__(self, class_ids: np.ndarray, confidences: np.ndarray, boxes: np.ndarray):
+        self.class_ids = class_ids        # (N,)   int32
+        self.confidences = confidences    # (N,)   float32
+        self.boxes = boxes                # (N, 4) int32, x1 y1 x2 y2
+
+    @classmethod
+    def empty(cls) -> "DetectionArrays":
+        return cls(
+            np.empty(0, dtype=np.int32),
+            np.empty(0, dtype=np.float32),
+            np.empty((0, 4), dtype=np.int32),
+        )
+
+    def __len__(self) -> int:
+        return len(self.class_ids)
+
+    def filter(self, min_confidence: float) -> "DetectionArrays":
+        keep = self.confidences >= min_confidence
+        if keep.all():
+            return self
+        return DetectionArrays(self.class_ids[keep], self.confidences[keep], self.boxes[keep])
+
+    def to_dicts(self, class_names: Dict[int, str]) -> List[Dict]:
+        return [
+            {
+                "class_id": class_id,
+                "class_name": class_names.get(class_id, "unknown"),
+                "confidence": conf,
+                "bbox": {"x1": x1, "y1": y1, "x2": x2, "y2": y2},
+            }
+            for class_id, conf, (x1, y1, x2, y2) in zip(
+                self.class_ids.tolist(),
+                self.confidences.tolist(),
+                self.boxes.tolist(),
+            )
+        ]
+
+
 class YOLODetector:
-    def __init__(self, model_path: str = "yolov8n.pt"):
+    def __init__(self, model_path: str = "yolov8n.pt", backend: str = YOLO_BACKEND):
         self.model = None
         self.model_path = model_path
+        self.backend = backend
         self.is_loaded = False
 
         # Target classes (COCO)
@@ -40,13 +114,29 @@ class YOLODetector:
             15: "cat",
             16: "dog",
         }
+        self._target_class_list = sorted(self.target_classes)
+        self._target_class_ids = np.array(self._target_class_list, dtype=np.int32)
 
         self.load_model()
 
     def load_model(self):
-        """Load YOLO model safely (PyTorch 2.6+)"""
+        """Load the model for the configured backend, falling back to torch"""
+        if self.backend == "onnx":
+            try:
+                from onnx_detector import OnnxYOLOSession
+
+                onnx_path = YOLO_ONNX_PATH or os.path.splitext(self.model_path)[0] + ".onnx"
+                _export_onnx(self.model_path, onnx_path, YOLO_IMGSZ)
+                self.model = OnnxYOLOSession(onnx_path, YOLO_ONNX_THREADS, YOLO_IMGSZ)
+                self.is_loaded = True
+                logger.info(f"✅ YOLO model loaded successfully (onnxruntime): {onnx_path}")
+                return
+            except Exception as e:
+                logger.error(f"❌ Failed to load ONNX backend, falling back to torch: {e}")
+                self.backend = "torch"
+
         try:
-            self.model = YOLO(self.model_path)
+            self.model = _load_torch_yolo(self.model_path)
             self.is_loaded = True
             logger.info(f"✅ YOLO model loaded successfully: {self.model_path}")
         except Exception as e:
@@ -54,40 +144,53 @@ class YOLODetector:
             self.is_loaded = False
 
     def detect(self, frame: np.ndarray, confidence: float = 0.5) -> List[Dict]:
-        if not self.is_loaded:
-            return []
+        return self.detect_batch([frame], confidence)[0]
+
+    def detect_batch(self, frames: List[np.ndarray], confidence: float = 0.5) -> List[List[Dict]]:
+        """Run one model call over several frames; returns one detection list per frame."""
+        return [
+            arrays.to_dicts(self.target_classes)
+            for arrays in self.detect_arrays_batch(frames, confidence)
+        ]
+
+    def detect_arrays_batch(self, frames: List[np.ndarray],
+                            confidence: float = 0.5) -> List[DetectionArrays]:
+        """Like detect_batch() but returns struct-of-arrays results."""
+        if not self.is_loaded or not frames:
+            return [DetectionArrays.empty() for _ in frames]
 
         try:
-            results = self.model(frame, conf=confidence, verbose=False)
-            detections = []
-
-            for result in results:
-                if result.boxes is None:
-                    continue
-
-                for box in result.boxes:
-                    class_id = int(box.cls[0])
-                    conf = float(box.conf[0])
-                    x1, y1, x2, y2 = map(float, box.xyxy[0].cpu().numpy())
-
-                    if class_id in self.target_classes:
-                        detections.append({
-                            "class_id": class_id,
-                            "class_name": self.target_classes[class_id],
-                            "confidence": conf,
-                            "bbox": {
-                                "x1": int(x1),
-                                "y1": int(y1),
-                                "x2": int(x2),
-                                "y2": int(y2),
-                            },
-                        })
-
-            return detections
+            if self.backend == "onnx":
+                return [
+                    DetectionArrays(*arrays)
+                    for arrays in self.model.infer(frames, confidence, self._target_class_ids)
+                ]
+
+            # Restricting classes in the model call keeps them out of NMS entirely
+            results = self.model(
+                frames,
+                conf=confidence,
+                classes=self._target_class_list,
+                verbose=False,
+            )
+            return [self._parse_result(result) for result in results]
 
         except Exception as e:
             logger.error(f"Detection error: {e}")
-            return []
+            return [DetectionArrays.empty() for _ in frames]
+
+    def _parse_result(self, result) -> DetectionArrays:
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            return DetectionArrays.empty()
+
+        # One device→host transfer per tensor instead of one per box
+        class_ids = boxes.cls.cpu().numpy().astype(np.int32)
+        confidences = boxes.conf.cpu().numpy().astype(np.float32)
+        xyxy = np.rint(boxes.xyxy.cpu().numpy()).astype(np.int32)   # round, don't truncate
+
+        keep = np.isin(class_ids, self._target_class_ids)
+        return DetectionArrays(class_ids[keep], confidences[keep], xyxy[keep])
 
     def draw_detections(self, frame: np.ndarray, detections: List[Dict]) -> np.ndarray:
         frame_copy = frame.copy()
@@ -114,15 +217,8 @@ class YOLODetector:
 
         return frame_copy
 
-    def save_detection(self, frame: np.ndarray, detection: Dict, output_dir="detections") -> str:
-        os.makedirs(output_dir, exist_ok=True)
-
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        name = detection["class_name"]
-        path = os.path.join(output_dir, f"{name}_{ts}.jpg")
-
+    def crop_detection(self, frame: np.ndarray, detection: Dict, pad: int = 20) -> np.ndarray:
         b = detection["bbox"]
-        pad = 20
         h, w = frame.shape[:2]
 
         x1 = max(0, b["x1"] - pad)
@@ -130,8 +226,27 @@ class YOLODetector:
         x2 = min(w, b["x2"] + pad)
         y2 = min(h, b["y2"] + pad)
 
-        crop = frame[y1:y2, x1:x2]
-        cv2.imwrite(path, crop)
+        return frame[y1:y2, x1:x2]
+
+    def encode_crop(self, frame: np.ndarray, detection: Dict, quality: int = 95) -> bytes:
+        """JPEG bytes of the padded detection box (for the crop store)."""
+        ok, buf = cv2.imencode(".jpg", self.crop_detection(frame, detection),
+                               [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            raise ValueError("JPEG encoding of detection crop failed")
+        return buf.tobytes()
+
+    def save_detection(self, frame: np.ndarray, detection: Dict, output_dir="detections",
+                       user_id: Optional[int] = None) -> str:
+        os.makedirs(output_dir, exist_ok=True)
+
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+        name = detection["class_name"]
+        path = os.path.join(output_dir, f"{name}_{ts}.jpg")
+
+        crop = self.crop_detection(frame, detection)
+        with storage_ledger.tracked_write(path, user_id):
+            cv2.imwrite(path, crop)
 
         return path
 
@@ -2,6 +2,45 @@ import { useEffect, useRef, useState } from 'react';
 import { useCameraStore } from '../store/cameraStore';
 import { Zap, Activity } from 'lucide-react';
 
+// Binary frame layout (see backend/stream_protocol.py)
+const FRAME_HEADER_SIZE = 20;
+const PROTOCOL_VERSION = 2;
+const DETECTION_RECORD_SIZE = 17;
+const FLAG_FRESH_DETECTIONS = 0x01;
+
+const parseBinaryFrame = (buffer, classNames) => {
+  const view = new DataView(buffer);
+  if (view.getUint8(0) !== PROTOCOL_VERSION) return null;
+  const flags = view.getUint8(1);
+  const count = view.getUint16(2, true);
+  const detections = [];
+  let offset = FRAME_HEADER_SIZE;
+
+  for (let i = 0; i < count; i++) {
+    const classId = view.getUint8(offset);
+    const trackId = view.getUint32(offset + 13, true);
+    detections.push({
+      class_id: classId,
+      class_name: classNames[classId] || `class ${classId}`,
+      confidence: view.getFloat32(offset + 1, true),
+      bbox: {
+        x1: view.getUint16(offset + 5, true),
+        y1: view.getUint16(offset + 7, true),
+        x2: view.getUint16(offset + 9, true),
+        y2: view.getUint16(offset + 11, true),
+      },
+      ...(trackId ? { track_id: trackId } : {}),
+    });
+    offset += DETECTION_RECORD_SIZE;
+  }
+
+  return {
+    fresh: (flags & FLAG_FRESH_DETECTIONS) !== 0,
+    detections,
+    jpeg: new Blob([new Uint8Array(buffer, offset)], { type: 'image/jpeg' }),
+  };
+};
+
 export default function VideoPlayer({ zoom = 0 }) {
   const { sessionId, currentFrame, setFrame } = useCameraStore();
   const canvasRef = useRef(null);
@@ -19,6 +58,7 @@ export default function VideoPlayer({ zoom = 0 }) {
   const MAX_RECONNECT_ATTEMPTS = 5;
   const reconnectTimeoutRef = useRef(null);
   const manualCloseRef = useRef(false);
+  const classNamesRef = useRef({});
 
   useEffect(() => {
     if (!sessionId) return;
@@ -26,6 +66,7 @@ export default function VideoPlayer({ zoom = 0 }) {
     manualCloseRef.current = false;
     const connectWebSocket = () => {
       const ws = new WebSocket(`ws://localhost:8000/ws/video/${sessionId}`);
+      ws.binaryType = 'arraybuffer';
       wsRef.current = ws;
 
       ws.onopen = () => {
@@ -33,7 +74,10 @@ export default function VideoPlayer({ zoom = 0 }) {
         setIsConnected(true);
         reconnectAttemptsRef.current = 0; // Reset reconnect counter
 
-        // Send initial detection state (enabled by default)
+        // Ask for raw JPEG frames instead of base64-in-JSON
+        ws.send(JSON.stringify({ type: 'set_transport', mode: 'binary' }));
+
+        // This viewer's box filter; detection itself runs server-side for every viewer
         ws.send(
           JSON.stringify({
             type: 'toggle_detection',
@@ -43,10 +87,43 @@ export default function VideoPlayer({ zoom = 0 }) {
         );
       };
 
+      const countFrame = () => {
+        frameCountRef.current++;
+        const now = Date.now();
+        if (now - lastTimeRef.current >= 1000) {
+          setFrameRate(frameCountRef.current);
+          frameCountRef.current = 0;
+          lastTimeRef.current = now;
+        }
+      };
+
       ws.onmessage = (event) => {
         try {
+          if (event.data instanceof ArrayBuffer) {
+            const parsed = parseBinaryFrame(event.data, classNamesRef.current);
+            if (!parsed) return; // other protocol version, JSON fallback pending
+            const { detections, jpeg } = parsed;
+            setFrame(URL.createObjectURL(jpeg));
+            setLastDetectionCount(detections.length);
+            setDetectionData(detections);
+            countFrame();
+            return;
+          }
+
           const data = JSON.parse(event.data);
 
+          // Handle transport negotiation reply
+          if (data.type === 'transport') {
+            if (data.mode === 'binary' && data.version !== PROTOCOL_VERSION) {
+              // Server speaks a different layout: fall back to JSON frames
+              console.warn(`Binary protocol v${data.version} not supported, using JSON`);
+              ws.send(JSON.stringify({ type: 'set_transport', mode: 'json' }));
+              return;
+            }
+            classNamesRef.current = data.classes || {};
+            return;
+          }
+
           // Handle stream ready message
           if (data.type === 'stream_ready') {
             console.log('Stream ready:', data);
@@ -76,13 +153,7 @@ export default function VideoPlayer({ zoom = 0 }) {
             }
 
             // Calculate FPS
-            frameCountRef.current++;
-            const now = Date.now();
-            if (now - lastTimeRef.current >= 1000) {
-              setFrameRate(frameCountRef.current);
-              frameCountRef.current = 0;
-              lastTimeRef.current = now;
-            }
+            countFrame();
           }
         } catch (err) {
           console.error('Failed to parse message:', err);
@@ -174,6 +245,8 @@ export default function VideoPlayer({ zoom = 0 }) {
     const ctx = canvas.getContext('2d');
     const img = new Image();
 
+    const isObjectUrl = currentFrame.startsWith('blob:');
+
     img.onload = () => {
       if (canvas.width !== img.width || canvas.height !== img.height) {
         canvas.width = img.width;
@@ -245,9 +318,20 @@ export default function VideoPlayer({ zoom = 0 }) {
       ctx.restore();
     };
 
-    img.src = `data:image/jpeg;base64,${currentFrame}`;
+    img.src = isObjectUrl
+      ? currentFrame
+      : `data:image/jpeg;base64,${currentFrame}`;
   }, [currentFrame, zoom, detectionEnabled, detectionData]);
 
+  // Release binary-transport frame URLs once a newer frame replaces them
+  useEffect(() => {
+    return () => {
+      if (currentFrame && currentFrame.startsWith('blob:')) {
+        URL.revokeObjectURL(currentFrame);
+      }
+    };
+  }, [currentFrame]);
+
   const getStreamQuality = () => {
     if (frameRate >= 30)
       return { color: 'text-green-400', status: 'Excellent' };
@@ -853,9 +853,9 @@ export default function Analytics() {
                       transition={{ delay: index * 0.03 }}
                       className="glass-dark rounded-xl overflow-hidden border border-white/10 hover:border-primary-500/50 transition-all"
                     >
-                      {detection.screenshot_path ? (
+                      {detection.crop_url ? (
                         <img
-                          src={`http://localhost:8000/${detection.screenshot_path}`}
+                          src={`http://localhost:8000${detection.crop_url}`}
                           alt={detection.class_name}
                           className="w-full h-40 object-cover"
                         />
@@ -12,6 +12,8 @@ export default function Recordings() {
   const navigate = useNavigate();
   const [recordings, setRecordings] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     if (!token) navigate('/login');
@@ -23,6 +25,7 @@ export default function Recordings() {
     try {
       const response = await recordingAPI.list();
       setRecordings(response.data.recordings);
+      setNextCursor(response.data.next_cursor);
     } catch (error) {
       toast.error('Failed to load recordings');
     } finally {
@@ -30,6 +33,19 @@ export default function Recordings() {
     }
   };
 
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      const response = await recordingAPI.list({ cursor: nextCursor });
+      setRecordings((prev) => [...prev, ...response.data.recordings]);
+      setNextCursor(response.data.next_cursor);
+    } catch (error) {
+      toast.error('Failed to load more recordings');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleDownload = async (recordingId, filename) => {
     try {
       const response = await recordingAPI.download(recordingId);
@@ -117,7 +133,7 @@ export default function Recordings() {
                 key={recording.id}
                 initial={{ opacity: 0, x: -20 }}
                 animate={{ opacity: 1, x: 0 }}
-                transition={{ delay: index * 0.05 }}
+                transition={{ delay: Math.min(index * 0.05, 0.5) }}
                 className="glass-dark rounded-xl p-4 border border-white/10 hover:border-primary-500/50 transition-all"
               >
                 <div className="flex items-center gap-4">
@@ -164,6 +180,13 @@ export default function Recordings() {
                 </div>
               </motion.div>
             ))}
+            {nextCursor && (
+              <div className="flex justify-center pt-2">
+                <button onClick={loadMore} disabled={loadingMore} className="btn-primary">
+                  {loadingMore ? 'Loading...' : 'Load more'}
+                </button>
+              </div>
+            )}
           </div>
         )}
       </div>
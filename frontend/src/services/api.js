@@ -121,7 +121,7 @@ export const recordingAPI = {
   },
   stop: (sessionId) =>
     api.post('/recording/stop', null, { params: { session_id: sessionId } }),
-  list: () => api.get('/recording/list'),
+  list: (params = {}) => api.get('/recording/list', { params }),
   download: (recordingId) => 
     api.get(`/recording/download/${recordingId}`, {
       responseType: 'blob',
@@ -139,7 +139,8 @@ export const screenshotAPI = {
 
 // Detection API
 export const detectionAPI = {
-  list: (limit = 100) => api.get('/detection/list', { params: { limit } }),
+  list: (limit = 100, params = {}) =>
+    api.get('/detection/list', { params: { limit, ...params } }),
 };
 
 // Schedule API